@@ -1,67 +1,75 @@
-import argparse
-from setup.preprocess import load_raw
-from pipelineio.visualization import plot_mode_cluster_heatmaps, radar_chart
-from setup.config import DATA_PATH, QUESTION_COLS
-import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
-
-def main() -> None:
-    """Main script to run pipeline. Using k=2 as best seen in Jupyter Notebook testing."""
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--cluster-labels", type=str, required=True, help="Filepath to cluster labels dataframe csv")
-    args = parser.parse_args()
-
-    # read dfs
-    X = pd.read_csv(args.cluster_labels, index_col=0)
-    plot_mode_cluster_heatmaps(X, f"response_heatmap")
-    
-    data = pd.read_csv(DATA_PATH)
-    data = data.loc[X.index]
-    other_columns = [col for col in data.columns.to_list() if not col.startswith("Q")]
-
-    # add other columns to sampled df with clusters
-    full_df = pd.concat([X, data[other_columns]], axis=1)
-    
-    other_answers = ["TIPI1","TIPI2","TIPI3","TIPI4","TIPI5","TIPI6","TIPI7","TIPI8","TIPI9","TIPI10"]
-    other_answers_df = full_df[other_answers]
-
-    other_answers_df = other_answers_df.rename(columns={
-        "TIPI1":"Extraverted, enthusiastic",
-        "TIPI2":"Critical, quarrelsome",
-        "TIPI3":"Dependable, self-disciplined",
-        "TIPI4":"Anxious, easily upset",
-        "TIPI5":"Open to new experiences, complex",
-        "TIPI6":"Reserved, quiet",
-        "TIPI7":"Sympathetic, warm",
-        "TIPI8":"Disorganized, careless",
-        "TIPI9":"Calm, emotionally stable",
-        "TIPI10":"Conventional, uncreative"
-        })
-
-
-    # scale other answers
-    scaler = MinMaxScaler()
-    normalized_df = pd.DataFrame(
-        scaler.fit_transform(other_answers_df),
-        columns=other_answers_df.columns,
-        index=other_answers_df.index
-    )
-
-    # add clusters
-    normalized_df = pd.concat([normalized_df, full_df["Cluster"]], axis=1)
-    
-    # graph each cluster
-    cluster_dfs = normalized_df.groupby("Cluster")
-    for cluster, df in cluster_dfs:
-        df.drop("Cluster", axis=1, inplace=True)
-
-        # get the modes
-        modes = df.mode().iloc[0].to_list()
-
-        radar_chart(df.columns.to_list(), modes, f"Cluster {cluster}")
-    
-    plot_mode_cluster_heatmaps(normalized_df, "other_responses_heatmap")
-
-
-if __name__ == "__main__":
+import argparse
+from setup.preprocess import load_raw
+from pipelineio.visualization import plot_mode_cluster_heatmaps, radar_chart
+from pipelineio.render import RENDERER
+from pipelineio.writer import WRITER
+from pipelineio.io_utils import save_df
+from pipelineio.label_store import is_label_store, load_labeled
+from setup.config import QUESTION_COLS
+from setup.profiles import ResponseDistribution
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+def main() -> None:
+    """Main script to run pipeline. Using k=2 as best seen in Jupyter Notebook testing."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--cluster-labels", type=str, required=True, help="Filepath to cluster labels dataframe csv or label store directory")
+    parser.add_argument("-c", "--label-column", type=str, default=None, help="Label store column to analyze, e.g. kmeans_k2")
+    args = parser.parse_args()
+
+    # read dfs; a label store is memory-mapped rather than parsed
+    if is_label_store(args.cluster_labels):
+        X = load_labeled(args.cluster_labels, args.label_column)
+    else:
+        X = pd.read_csv(args.cluster_labels, index_col=0)
+    RENDERER.submit(plot_mode_cluster_heatmaps, X, f"response_heatmap")
+    
+    data = load_raw()
+    data = data.loc[X.index]
+    other_columns = [col for col in data.columns.to_list() if not col.startswith("Q")]
+
+    # add other columns to sampled df with clusters
+    full_df = pd.concat([X, data[other_columns]], axis=1)
+    
+    other_answers = ["TIPI1","TIPI2","TIPI3","TIPI4","TIPI5","TIPI6","TIPI7","TIPI8","TIPI9","TIPI10"]
+    other_answers_df = full_df[other_answers]
+
+    other_answers_df = other_answers_df.rename(columns={
+        "TIPI1":"Extraverted, enthusiastic",
+        "TIPI2":"Critical, quarrelsome",
+        "TIPI3":"Dependable, self-disciplined",
+        "TIPI4":"Anxious, easily upset",
+        "TIPI5":"Open to new experiences, complex",
+        "TIPI6":"Reserved, quiet",
+        "TIPI7":"Sympathetic, warm",
+        "TIPI8":"Disorganized, careless",
+        "TIPI9":"Calm, emotionally stable",
+        "TIPI10":"Conventional, uncreative"
+        })
+
+
+    # scale other answers
+    scaler = MinMaxScaler()
+    normalized_df = pd.DataFrame(
+        scaler.fit_transform(other_answers_df),
+        columns=other_answers_df.columns,
+        index=other_answers_df.index
+    )
+
+    # add clusters
+    normalized_df = pd.concat([normalized_df, full_df["Cluster"]], axis=1)
+    
+    # graph each cluster
+    other_dist = ResponseDistribution.from_frame(normalized_df)
+    for cluster, modes in other_dist.modes().iterrows():
+        RENDERER.submit(radar_chart, other_dist.columns, modes.to_list(), f"Cluster {cluster}")
+    
+    RENDERER.submit(plot_mode_cluster_heatmaps, other_dist, "other_responses_heatmap")
+    RENDERER.close()
+    # surface failed writes here rather than at exit, then keep the per-artifact write times
+    WRITER.flush()
+    save_df(WRITER.timing_frame(), "artifact_timings.csv")
+
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,10 +1,32 @@
+import contextlib
+import io
+import threading
+from collections.abc import Iterator
 from pathlib import Path
 import pandas as pd
+import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 from datetime import datetime
 from typing import Any
+from setup.config import ASYNC_ARTIFACTS
+from .writer import WRITER
 
 ARTIFACTS_DIR = Path(f"artifacts_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+_redirect = threading.local()
+
+def artifacts_dir() -> Path:
+    """Returns the artifacts directory of the calling thread: its `redirect_artifacts` target, else `ARTIFACTS_DIR`."""
+    return getattr(_redirect, "path", None) or ARTIFACTS_DIR
+
+@contextlib.contextmanager
+def redirect_artifacts(path: Path) -> Iterator[Path]:
+    """Sends the artifacts saved by the calling thread to `path` for the duration of the block."""
+    previous = getattr(_redirect, "path", None)
+    _redirect.path = Path(path)
+    try:
+        yield _redirect.path
+    finally:
+        _redirect.path = previous
 
 def ensure_dir_exists(*parts: tuple[Any, ...]) -> Path:
     """
@@ -25,13 +47,21 @@ def ensure_dir_exists(*parts: tuple[Any, ...]) -> Path:
     >>> ensure_dir_exists("models")
     path/to/models/
     """
-    path = ARTIFACTS_DIR.joinpath(*parts)
+    path = artifacts_dir().joinpath(*parts)
     path.mkdir(parents=True, exist_ok=True)
     return path
 
+def _write_df(df: pd.DataFrame, out_path: Path, fmt: str) -> None:
+    """Writes a DataFrame to `out_path`; runs on a writer thread when artifacts are written in the background."""
+    if fmt == "csv":
+        df.to_csv(out_path, index=True)
+    elif fmt == "parquet":
+        df.to_parquet(out_path, index=False)
+
 def save_df(df: pd.DataFrame, *parts: tuple[Any, ...], fmt: str = "csv") -> Path:
     """
-    Saves a DataFrame to either a CSV or parquet output file and returns the path.
+    Saves a DataFrame to either a CSV or parquet output file and returns the path. The write runs in
+    the background when `ASYNC_ARTIFACTS` is set.
 
     Parameters
     ----------
@@ -58,15 +88,17 @@ def save_df(df: pd.DataFrame, *parts: tuple[Any, ...], fmt: str = "csv") -> Path
     """
     out_dir = ensure_dir_exists("data")
     out_path = out_dir.joinpath(*parts)
-    if fmt == "csv":
-        df.to_csv(out_path, index=True)
-    elif fmt == "parquet":
-        df.to_parquet(out_path, index=False)
+    if ASYNC_ARTIFACTS:
+        # df is written as it is when the write runs, so callers hand it over rather than keep mutating it
+        WRITER.submit(out_path, _write_df, df, out_path, fmt)
+    else:
+        _write_df(df, out_path, fmt)
     return out_path
 
 def save_fig(fig: Figure, *parts: tuple[Any, ...], dpi: int = 300) -> Path:
     """
-    Saves figure to disk as an image and returns the path.
+    Saves figure to disk as an image, closes it and returns the path. The figure is rendered here;
+    writing the image file runs in the background when `ASYNC_ARTIFACTS` is set.
 
     Parameters
     ----------
@@ -90,5 +122,13 @@ def save_fig(fig: Figure, *parts: tuple[Any, ...], dpi: int = 300) -> Path:
     *folder_parts, filename = parts
     out_dir = ensure_dir_exists(*folder_parts)
     out_path = out_dir / filename
-    fig.savefig(out_path, dpi=dpi, bbox_inches="tight")
+    if ASYNC_ARTIFACTS:
+        # matplotlib is not thread-safe, so the figure is rendered here and only its bytes go to the writer
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=out_path.suffix.lstrip(".") or None, dpi=dpi, bbox_inches="tight")
+        WRITER.submit(out_path, out_path.write_bytes, buffer.getvalue())
+    else:
+        fig.savefig(out_path, dpi=dpi, bbox_inches="tight")
+    # release the canvas and pixel buffers; pyplot would otherwise keep every figure alive
+    plt.close(fig)
     return out_path
@@ -0,0 +1,204 @@
+"""label_store.py
+
+Columnar on-disk store of the responses, written once, and the cluster labels of every run next to them.
+
+Layout of a store directory::
+
+    responses.npy   (n_rows, n_questions) uint8 responses
+    index.npy       (n_rows,) row labels of the original dataset
+    labels.npy      (n_rows, n_columns) int8 labels, column-major so each column is contiguous
+    manifest.json   question names, data fingerprint and the name of every label column
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from setup.responses import ResponseMatrix
+from .io_utils import ensure_dir_exists
+
+LABEL_STORE_DIR: str = "labels"
+
+def _save_atomic(path: Path, array: np.ndarray) -> None:
+    """Writes a .npy file through a temporary file so memory-mapped readers never see a partial array."""
+    tmp_path = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array, allow_pickle=False)
+    os.replace(tmp_path, path)
+
+def _read_manifest(store_dir: Path) -> dict:
+    manifest_path = store_dir / "manifest.json"
+    return json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+def _write_manifest(store_dir: Path, manifest: dict) -> None:
+    tmp_path = store_dir / f".manifest.json.tmp-{os.getpid()}"
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, store_dir / "manifest.json")
+
+def save_responses(X: ResponseMatrix, store_dir: Path | None = None) -> Path:
+    """
+    Writes the responses and their row index to a label store, once per distinct dataset.
+
+    Nothing is rewritten when the store already holds data with the same fingerprint. Writing
+    different data resets the store, dropping label columns that belonged to the old rows.
+
+    Parameters
+    ----------
+        X : ResponseMatrix
+            The uint8 matrix containing question responses.
+        store_dir : Path | None
+            The store directory. Default is `None`, which uses `labels` under the artifacts directory.
+
+    Returns
+    -------
+        Path
+            The store directory.
+    """
+    store_dir = ensure_dir_exists(LABEL_STORE_DIR) if store_dir is None else Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    if _read_manifest(store_dir).get("fingerprint") == X.fingerprint():
+        return store_dir
+
+    index = X.index.to_numpy()
+    if index.dtype == object:
+        index = index.astype(str)
+    _save_atomic(store_dir / "responses.npy", X.values)
+    _save_atomic(store_dir / "index.npy", index)
+    (store_dir / "labels.npy").unlink(missing_ok=True)
+    _write_manifest(store_dir, dict(fingerprint=X.fingerprint(), n_rows=len(X), questions=X.columns, labels=[]))
+    return store_dir
+
+def save_labels(X: ResponseMatrix, labels: dict[str, np.ndarray], store_dir: Path | None = None) -> Path:
+    """
+    Adds or replaces label columns in a label store, writing the responses first if needed.
+
+    Parameters
+    ----------
+        X : ResponseMatrix
+            The uint8 matrix the labels belong to, row for row.
+        labels : dict[str, NDArray]
+            The labels to store, keyed by column name, such as `"kmeans_k3"`.
+        store_dir : Path | None
+            The store directory. Default is `None`, which uses `labels` under the artifacts directory.
+
+    Returns
+    -------
+        Path
+            The store directory.
+
+    Usage
+    -----
+    >>> save_labels(X, {f"kmeans_k{k}": results[k]["labels"] for k in ks})
+    path/to/labels/
+    """
+    store_dir = save_responses(X, store_dir)
+    _add_columns(store_dir, labels)
+    return store_dir
+
+def _add_columns(store_dir: Path, labels: dict[str, np.ndarray]) -> None:
+    """Adds or replaces label columns in a store whose responses are already written."""
+    manifest = _read_manifest(store_dir)
+    n_rows = manifest["n_rows"]
+    names = list(manifest["labels"])
+    columns = {}
+    if names:
+        existing = np.load(store_dir / "labels.npy")
+        columns = {name: existing[:, j] for j, name in enumerate(names)}
+
+    for name, values in labels.items():
+        values = np.asarray(values)
+        if len(values) != n_rows:
+            raise ValueError(f"Label column {name!r} has {len(values)} rows, expected {n_rows}.")
+        if values.size and (values.min() < np.iinfo(np.int8).min or values.max() > np.iinfo(np.int8).max):
+            raise ValueError(f"Label column {name!r} does not fit in int8.")
+        if name not in columns:
+            names.append(name)
+        columns[name] = values.astype(np.int8)
+
+    table = np.empty((n_rows, len(names)), dtype=np.int8, order="F")
+    for j, name in enumerate(names):
+        table[:, j] = columns[name]
+    _save_atomic(store_dir / "labels.npy", table)
+    manifest["labels"] = names
+    _write_manifest(store_dir, manifest)
+
+def merge_store(src_dir: Path, store_dir: Path) -> Path:
+    """
+    Adds every label column of one store to another, linking the responses instead of copying them.
+
+    When `store_dir` holds no data or different data, it is reset to the source's data first, with
+    `responses.npy` and `index.npy` as symbolic links to the source's files (copies where links are
+    unsupported).
+
+    Parameters
+    ----------
+        src_dir : Path
+            The store to read, such as the label store of a cached stage.
+        store_dir : Path
+            The store to add the columns to, such as the label store of the run directory.
+
+    Returns
+    -------
+        Path
+            The store directory.
+    """
+    src_dir, store_dir = Path(src_dir), Path(store_dir)
+    source = _read_manifest(src_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    if _read_manifest(store_dir).get("fingerprint") != source["fingerprint"]:
+        for name in ("responses.npy", "index.npy", "labels.npy"):
+            (store_dir / name).unlink(missing_ok=True)
+        for name in ("responses.npy", "index.npy"):
+            try:
+                (store_dir / name).symlink_to((src_dir / name).resolve())
+            except OSError:
+                shutil.copy2(src_dir / name, store_dir / name)
+        _write_manifest(store_dir, dict(source, labels=[]))
+
+    if source["labels"]:
+        table = np.load(src_dir / "labels.npy")
+        _add_columns(store_dir, {name: table[:, j] for j, name in enumerate(source["labels"])})
+    return store_dir
+
+def is_label_store(path: Path) -> bool:
+    """Returns whether a path is a label store directory or a file inside one."""
+    path = Path(path)
+    store_dir = path if path.is_dir() else path.parent
+    return (store_dir / "manifest.json").exists()
+
+def load_labeled(path: Path, column: str | None = None, name: str = "Cluster") -> pd.DataFrame:
+    """
+    Memory-maps a label store and returns the responses with one label column.
+
+    Parameters
+    ----------
+        path : Path
+            The store directory or any file inside it.
+        column : str | None
+            The label column to attach. Default is `None`, which is only allowed when the store
+            holds a single column.
+        name : str
+            The name of the label column in the returned DataFrame. Default is `"Cluster"`.
+
+    Returns
+    -------
+        DataFrame
+            The responses indexed by the original row labels, plus the label column.
+    """
+    path = Path(path)
+    store_dir = path if path.is_dir() else path.parent
+    manifest = _read_manifest(store_dir)
+    names = manifest.get("labels", [])
+    if column is None:
+        if len(names) != 1:
+            raise ValueError(f"Choose one of the label columns {names} in {store_dir}.")
+        column = names[0]
+    if column not in names:
+        raise KeyError(f"No label column {column!r} in {store_dir}, expected one of {names}.")
+
+    responses = np.load(store_dir / "responses.npy", mmap_mode="r")
+    index = np.load(store_dir / "index.npy", mmap_mode="r")
+    labels = np.load(store_dir / "labels.npy", mmap_mode="r")[:, names.index(column)]
+    X = ResponseMatrix(responses, index=index, columns=manifest["questions"])
+    return X.with_labels(labels, name=name)
@@ -0,0 +1,108 @@
+"""render.py
+
+Renders figures in background worker processes so the pipeline keeps computing while plots are saved.
+"""
+import multiprocessing
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+from setup.config import RENDER_WORKERS
+from . import io_utils
+
+def _init_worker() -> None:
+    """Switches a worker to the non-interactive Agg backend."""
+    import matplotlib
+    matplotlib.use("Agg")
+    # a job counts as rendered once its file exists, so workers write synchronously
+    io_utils.ASYNC_ARTIFACTS = False
+
+def _render(artifacts_dir: Path, plot_fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    """Worker task running one plotting job against the artifacts directory it was submitted from."""
+    with io_utils.redirect_artifacts(artifacts_dir):
+        return plot_fn(*args, **kwargs)
+
+class FigureRenderer:
+    """
+    A pool of worker processes that run plotting functions and save their figures.
+
+    A job is a module-level plotting function and its arguments; the worker builds the figure, saves
+    it through `save_fig`, which closes it, and returns the function's result. Each job saves into the
+    artifacts directory of the thread that submitted it, e.g. a cache stage's staging directory, and
+    workers are spawned rather than forked, so they never inherit the locks of the writer or scheduler
+    threads running in this process. At most `max_pending`
+    jobs are queued or running at once, so `submit` blocks instead of letting pickled plot inputs pile
+    up. With `n_workers <= 1` jobs run immediately in the calling process.
+
+    Parameters
+    ----------
+        n_workers : int
+            The number of rendering processes. Default is `RENDER_WORKERS`.
+        max_pending : int | None
+            The maximum number of unfinished jobs. Default is `None`, which allows two per worker.
+
+    Usage
+    -----
+    >>> RENDERER.submit(plot_mode_cluster_heatmaps, df_labeled, "kmeans_response_heatmap_k_2")
+    >>> RENDERER.wait()
+    """
+    def __init__(self, n_workers: int = RENDER_WORKERS, max_pending: int | None = None) -> None:
+        self.n_workers = n_workers
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * max(n_workers, 1))
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._futures: list[Future] = []
+
+    def submit(self, plot_fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Queues one plotting job, blocking while `max_pending` jobs are unfinished, and returns its future."""
+        if self.n_workers <= 1:
+            future = Future()
+            try:
+                future.set_result(plot_fn(*args, **kwargs))
+            except Exception as exc:
+                future.set_exception(exc)
+            self._futures.append(future)
+            return future
+
+        self._slots.acquire()
+        with self._lock:
+            # stages on several threads may submit the first job at once
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.n_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_worker)
+        try:
+            # resolved, as the caller may change directory before the job runs
+            future = self._pool.submit(_render, io_utils.artifacts_dir().resolve(), plot_fn, args, kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+        return future
+
+    def wait(self) -> list[Any]:
+        """Waits for every submitted job and returns their results, raising the first error after all finish."""
+        futures, self._futures = self._futures, []
+        results, error = [], None
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                results.append(None)
+                error = error or exc
+        if error is not None:
+            raise error
+        return results
+
+    def close(self) -> None:
+        """Waits for the pending jobs and shuts the worker processes down."""
+        try:
+            self.wait()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+RENDERER = FigureRenderer()
@@ -2,24 +2,28 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
+from typing import Literal
 from sklearn.decomposition import PCA
 from .io_utils import save_fig
+from .density import draw_clusters
 from setup.config import QUESTION_COLS
+from setup.responses import ResponseMatrix
+from setup.profiles import ResponseDistribution
 import textwrap
 
-def plot_pca_clusters(X: pd.DataFrame,
-                      filename: str, 
-                      ks: tuple[int, ...] = (2, 3, 4)) -> None:
-    """Creates a plot of the principal component analysis using provided cluster sizes."""
+def plot_pca_clusters(X: ResponseMatrix,
+                      labels_by_k: dict[int, np.ndarray],
+                      filename: str,
+                      render: Literal["auto", "scatter", "density"] = "auto",
+                      overlay: int = 0) -> None:
+    """Creates a plot of the principal component analysis using the saved cluster labels of each k instead of refitting. Large samples are drawn as per-cluster density images, see `draw_clusters`."""
+    X_fit = X.to_float()
     pca = PCA(n_components=2)
-    X_pca = pca.fit_transform(X)
+    X_pca = pca.fit_transform(X_fit)
 
-    fig, ax = plt.subplots(1, len(ks), figsize=(5 * len(ks), 5))
-    for i, k in enumerate(ks):
-        kmeans = KMeans(n_clusters=k, init='k-means++', random_state=42)
-        labels = kmeans.fit_predict(X)
-        ax[i].scatter(X_pca[:, 0], X_pca[:, 1], c=labels, cmap="tab10", s=15)
+    fig, ax = plt.subplots(1, len(labels_by_k), figsize=(5 * len(labels_by_k), 5))
+    for i, (k, labels) in enumerate(labels_by_k.items()):
+        draw_clusters(ax[i], X_pca, labels, "tab10", render=render, overlay=overlay, s=15)
         ax[i].set_title(f"PCA, k={k}")
         ax[i].set_xlabel("PC1")
         ax[i].set_ylabel("PC2")
@@ -27,12 +31,10 @@ def plot_pca_clusters(X: pd.DataFrame,
     plt.tight_layout()
     save_fig(fig, "plots", "pca", f"{filename}.png")
 
-def plot_mode_cluster_heatmaps(df_labeled: pd.DataFrame, filename: str) -> pd.DataFrame:
-    """Creates a heatmap of the modes by cluster per question response and returns a DataFrame of the modes."""
-    columns = df_labeled.columns.to_list()
-    modes = df_labeled.groupby("Cluster")[[col for col in columns if col != "Cluster"]].agg(
-        lambda x: x.mode().iloc[0]
-    )
+def plot_mode_cluster_heatmaps(df_labeled: pd.DataFrame | ResponseDistribution, filename: str) -> pd.DataFrame:
+    """Creates a heatmap of the modes by cluster per response column and returns a DataFrame of the modes, read from a `ResponseDistribution`."""
+    dist = df_labeled if isinstance(df_labeled, ResponseDistribution) else ResponseDistribution.from_frame(df_labeled)
+    modes = dist.modes()
 
     fig, ax = plt.subplots(figsize=(15, 6))
     sns.heatmap(modes, annot=True, cmap="coolwarm", ax=ax)
@@ -8,3 +8,11 @@ DATA_PATH: Path = Path("../data/MACH_data/data.cleaned.csv")
 QUESTION_COLS: list[str] = [f"Q{i}A" for i in range(1, 21)]
 RANDOM_STATE: int = 42
 SAMPLE_N: int = 5000
+CACHE_DIR: Path = Path("../data/MACH_data/.cache")
+USE_DATA_CACHE: bool = True
+RENDER_WORKERS: int = 2
+DENSITY_BINS: int = 400
+DENSITY_MIN_POINTS: int = 20000
+ASYNC_ARTIFACTS: bool = True
+ARTIFACT_WRITER_THREADS: int = 2
+ARTIFACT_QUEUE_SIZE: int = 16
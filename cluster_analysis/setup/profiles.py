@@ -0,0 +1,124 @@
+"""profiles.py
+
+Per-cluster response distributions counted in one vectorized pass.
+"""
+from typing import Any
+import numpy as np
+import pandas as pd
+
+class ResponseDistribution:
+    """
+    Count tensor of how often each cluster gave each response level to each question.
+
+    `counts[c, q, l]` is the number of rows of cluster `clusters[c]` that answered `levels[l]` to
+    question `columns[q]`. The whole tensor is filled by one `bincount` over the flattened
+    (cluster, question, level) index, so no per-cell Python work is done. Modes, means, proportions
+    and full distributions are all read from it. Missing values are not counted.
+
+    Attributes
+    ----------
+        counts : NDArray
+            The (n_clusters, n_questions, n_levels) int64 count tensor.
+        clusters : NDArray
+            The sorted cluster labels.
+        columns : list[str]
+            The question column names.
+        levels : NDArray
+            The sorted response values seen in any question.
+    """
+
+    def __init__(self, counts: np.ndarray, clusters: np.ndarray, columns: list[str], levels: np.ndarray) -> None:
+        self.counts = counts
+        self.clusters = clusters
+        self.columns = list(columns)
+        self.levels = levels
+
+    @classmethod
+    def from_labels(cls, values: Any, labels: np.ndarray, columns: list[str]) -> "ResponseDistribution":
+        """
+        Counts the responses of every (cluster, question) pair.
+
+        Parameters
+        ----------
+            values : NDArray or array-like
+                The (n_rows, n_questions) responses, such as `ResponseMatrix.values`.
+            labels : NDArray
+                The cluster label of each row.
+            columns : list[str]
+                The question column names.
+
+        Returns
+        -------
+            ResponseDistribution
+                The count tensor with its cluster, question and level axes.
+
+        Usage
+        -----
+        >>> dist = ResponseDistribution.from_labels(X.values, labels, X.columns)
+        >>> dist.modes()
+        """
+        values = np.asarray(values)
+        clusters, cluster_codes = np.unique(np.asarray(labels), return_inverse=True)
+        n_rows, n_questions = values.shape
+
+        if np.issubdtype(values.dtype, np.unsignedinteger) and values.dtype.itemsize <= 2:
+            # small unsigned responses index a lookup table directly instead of being sorted
+            seen = np.bincount(values.ravel())
+            levels = np.flatnonzero(seen).astype(values.dtype)
+            lookup = np.cumsum(seen > 0) - 1
+            codes, valid = lookup[values], np.ones(values.shape, dtype=bool)
+        else:
+            valid = ~pd.isna(values)
+            levels, inverse = np.unique(values[valid], return_inverse=True)
+            codes = np.zeros(values.shape, dtype=np.int64)
+            codes[valid] = inverse
+
+        n_levels = len(levels)
+        flat = (cluster_codes[:, None] * n_questions + np.arange(n_questions)) * n_levels + codes
+        counts = np.bincount(flat[valid], minlength=len(clusters) * n_questions * n_levels)
+        return cls(counts.reshape(len(clusters), n_questions, n_levels), clusters, columns, levels)
+
+    @classmethod
+    def from_frame(cls, df_labeled: pd.DataFrame,
+                   columns: list[str] | None = None,
+                   label_col: str = "Cluster") -> "ResponseDistribution":
+        """Counts the responses of a labeled DataFrame, by default over every column except `label_col`."""
+        columns = [col for col in df_labeled.columns if col != label_col] if columns is None else list(columns)
+        return cls.from_labels(df_labeled[columns].to_numpy(), df_labeled[label_col].to_numpy(), columns)
+
+    def _frame(self, values: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame(values, index=pd.Index(self.clusters, name="Cluster"), columns=self.columns)
+
+    def sizes(self) -> np.ndarray:
+        """Returns the number of answered responses per (cluster, question) pair."""
+        return self.counts.sum(axis=2)
+
+    def proportions(self) -> np.ndarray:
+        """Returns the counts normalized to proportions over the levels of each (cluster, question) pair."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.counts / self.sizes()[..., None]
+
+    def modes(self) -> pd.DataFrame:
+        """Returns the most frequent level per cluster and question, the smallest on ties like `Series.mode`."""
+        modes = self.levels[self.counts.argmax(axis=2)]
+        if (self.sizes() == 0).any():
+            modes = np.where(self.sizes() > 0, modes, np.nan)
+        return self._frame(modes)
+
+    def means(self) -> pd.DataFrame:
+        """Returns the mean response per cluster and question."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._frame(self.counts @ self.levels.astype(np.float64) / self.sizes())
+
+    def distribution(self, column: str, normalize: bool = True) -> pd.DataFrame:
+        """Returns the level proportions, or counts, of one question as a clusters x levels DataFrame."""
+        q = self.columns.index(column)
+        values = self.proportions()[:, q] if normalize else self.counts[:, q]
+        return pd.DataFrame(values, index=pd.Index(self.clusters, name="Cluster"),
+                            columns=pd.Index(self.levels, name=column))
+
+    def to_frame(self) -> pd.DataFrame:
+        """Returns the tensor as a long table of cluster, question, level, count and proportion."""
+        index = pd.MultiIndex.from_product([self.clusters, self.columns, self.levels],
+                                           names=["Cluster", "Question", "Level"])
+        return pd.DataFrame(dict(count=self.counts.ravel(), proportion=self.proportions().ravel()), index=index)
@@ -1,49 +1,93 @@
 import numpy as np
 import pandas as pd
 from sklearn.mixture import GaussianMixture
-from sklearn.metrics import silhouette_score
 from pipelineio.io_utils import save_df
+from pipelineio.label_store import save_labels
+from setup.responses import ResponseMatrix
+from .silhouette import score_labelings
+from .mixture import WeightedGaussianMixture
+from .sweep import run_sweep
+from .store import FIT_STORE, FitResult, FitStore
 from typing import Any, Literal
 
-def label_and_score(X: pd.DataFrame, 
+def _fit_gmm(X: np.ndarray,
+             k: int,
+             sample_weight: np.ndarray | None) -> tuple[np.ndarray, GaussianMixture | WeightedGaussianMixture]:
+    """Fits one mixture, weighted when sample weights are given, and returns its labels and the estimator."""
+    if sample_weight is not None:
+        gmm = WeightedGaussianMixture(n_components=k, random_state=42)
+        return gmm.fit_predict(X, sample_weight=sample_weight), gmm
+    gmm = GaussianMixture(n_components=k, random_state=42)
+    return gmm.fit_predict(X), gmm
+
+def label_and_score(X: ResponseMatrix, 
                     ks: tuple[int, ...] = (2, 4, 6), 
-                    save: bool = True) -> tuple[dict[int, dict[Any, float]], pd.DataFrame]:
+                    save: bool = True, 
+                    dedup: bool = False,
+                    sil_mode: Literal["exact", "sampled"] | None = "exact",
+                    n_jobs: int = 1,
+                    store: FitStore = FIT_STORE) -> tuple[dict[int, dict[Any, float]], pd.DataFrame]:
     """
     Labels each data point and calculates a Silhouette score per k-cluster.
 
     Parameters
     ----------
-        X : DataFrame
-            The DataFrame containing question responses.
+        X : ResponseMatrix
+            The uint8 matrix containing question responses.
         ks : tuple[int, ...]
             One or values to use as the number of clusters.
         save : bool
-            Set to `True` to save the DataFrame to a CSV file. Default is `False`.
+            Set to `True` to save the labels to the label store and the summary to a CSV file. Default is `True`.
+        dedup : bool
+            Set to `True` to fit on the distinct answer patterns weighted by their counts and scatter
+            the labels back to rows. Fit time and memory then scale with the number of patterns rather
+            than respondents. Default is `False`.
+        sil_mode : Literal["exact", "sampled"] | None
+            `"exact"` scores every row. `"sampled"` estimates the scores from stratified per-cluster
+            subsamples with bootstrap confidence intervals. `None` leaves the scores empty for the
+            caller to compute and write, as `run_all` does across algorithms. Default is `"exact"`.
+        n_jobs : int
+            The number of processes fitting the ks in parallel over a shared-memory copy of the data.
+            `-1` uses every CPU. Labels match the serial fits. Default is `1`.
+        store : FitStore
+            Where each fitted model is kept for plotting and analysis. Default is `FIT_STORE`.
 
     Returns
     -------
         results : dict[int, dict[Any, float]
             A dictionary mapping cluster sizes to a dictionary of labels and Silhouette scores.
         summary : DataFrame
-            A summary DataFrame of the cluster size and Silhouette scores.
+            A summary DataFrame of the cluster size, Silhouette scores and the mode that produced them.
     """
     # output dict and/or df
     results = {}
+    if dedup:
+        patterns, counts, inverse = X.unique_patterns()
+        X_train, sample_weight = patterns.astype(np.float64), counts
+    else:
+        X_train, sample_weight, inverse = X.to_float(), None, None
+
+    fits = run_sweep(_fit_gmm, X_train, ks, sample_weight=sample_weight, n_jobs=n_jobs)
+    train_labels = {k: fits[k][0] for k in ks}
     for k in ks:
-        gmm = GaussianMixture(n_components=k, random_state=42)
-        labels = gmm.fit_predict(X)
-        score = silhouette_score(X, labels)
-        results[k] = dict(labels=labels, sil=score)
+        labels = train_labels[k][inverse] if dedup else train_labels[k]
+        gmm = fits[k][1]
+        results[k] = dict(labels=labels)
+        store.put("gmm", X, FitResult(labels, gmm.means_, gmm), k=k, dedup=dedup)
+
+    if save:
+        save_labels(X, {f"gmm_k{k}": results[k]["labels"] for k in ks})
 
-        df_labels = X.copy()
-        df_labels["Cluster"] = labels
-        if save:
-            save_df(df_labels, f"{k}_clusters_labels.csv")
+    # one streamed distance pass scores every k; weighted patterns give the same scores as all rows
+    scores = score_labelings(X_train, train_labels, sample_weight=sample_weight, mode=sil_mode)
+    for k in ks:
+        results[k].update(scores[k])
 
     # save summary df
-    summary_rows = [dict(k=k, sil=results[k]["sil"]) for k in ks]
+    summary_rows = [dict(k=k, **scores[k]) for k in ks]
     summary = pd.DataFrame(summary_rows)
-    if save:
+    # a deferred summary has no scores yet, so the caller writes it
+    if save and sil_mode is not None:
         save_df(summary, f"sil_score_summary.csv")
 
     return results, summary
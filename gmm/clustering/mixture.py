@@ -0,0 +1,146 @@
+import warnings
+import numpy as np
+from scipy import linalg
+from scipy.special import logsumexp
+from sklearn.cluster import KMeans
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.utils import check_random_state
+
+class WeightedGaussianMixture:
+    """
+    Full-covariance Gaussian mixture fitted by EM with per-sample weights.
+
+    Follows the defaults of `sklearn.mixture.GaussianMixture` (k-means initialization, `tol=1e-3`,
+    `reg_covar=1e-6`, `max_iter=100`), but every sufficient statistic is weighted by `sample_weight`.
+    Fitting unique response patterns weighted by their counts therefore optimizes the same likelihood
+    as fitting every respondent, and with unit weights it reproduces `GaussianMixture`.
+
+    Parameters
+    ----------
+        n_components : int
+            The number of mixture components.
+        tol : float
+            The convergence threshold on the change of the weighted mean log-likelihood. Default is `1e-3`.
+        reg_covar : float
+            Non-negative regularization added to the diagonal of each covariance. Default is `1e-6`.
+        max_iter : int
+            The maximum number of EM iterations. Default is `100`.
+        random_state : int | None
+            Seed for the k-means initialization. Default is `None`.
+    """
+
+    def __init__(self,
+                 n_components: int = 1,
+                 tol: float = 1e-3,
+                 reg_covar: float = 1e-6,
+                 max_iter: int = 100,
+                 random_state: int | None = None) -> None:
+        self.n_components = n_components
+        self.tol = tol
+        self.reg_covar = reg_covar
+        self.max_iter = max_iter
+        self.random_state = random_state
+
+    def _m_step(self, X: np.ndarray, resp: np.ndarray, sample_weight: np.ndarray) -> None:
+        """Re-estimates weights, means and covariances from weighted responsibilities."""
+        resp = resp * sample_weight[:, None]
+        nk = resp.sum(axis=0) + 10 * np.finfo(resp.dtype).eps
+        means = resp.T @ X / nk[:, None]
+
+        n_features = X.shape[1]
+        covariances = np.empty((self.n_components, n_features, n_features))
+        precisions_cholesky = np.empty_like(covariances)
+        for k in range(self.n_components):
+            diff = X - means[k]
+            covariances[k] = (resp[:, k] * diff.T) @ diff / nk[k]
+            covariances[k].flat[:: n_features + 1] += self.reg_covar
+            try:
+                cov_chol = linalg.cholesky(covariances[k], lower=True)
+            except linalg.LinAlgError:
+                raise ValueError("Fitting the mixture model failed because some components have "
+                                 "ill-defined empirical covariance. Try increasing reg_covar.")
+            precisions_cholesky[k] = linalg.solve_triangular(cov_chol, np.eye(n_features), lower=True).T
+
+        self.weights_ = nk / sample_weight.sum()
+        self.means_ = means
+        self.covariances_ = covariances
+        self.precisions_cholesky_ = precisions_cholesky
+
+    def _estimate_weighted_log_prob(self, X: np.ndarray) -> np.ndarray:
+        """Returns log(weight_k) + log N(x | mean_k, cov_k) for every sample and component."""
+        n_samples, n_features = X.shape
+        log_prob = np.empty((n_samples, self.n_components))
+        for k in range(self.n_components):
+            prec_chol = self.precisions_cholesky_[k]
+            y = X @ prec_chol - self.means_[k] @ prec_chol
+            log_prob[:, k] = np.sum(np.square(y), axis=1)
+        log_det = np.sum(np.log(np.diagonal(self.precisions_cholesky_, axis1=1, axis2=2)), axis=1)
+        return -0.5 * (n_features * np.log(2 * np.pi) + log_prob) + log_det + np.log(self.weights_)
+
+    def _e_step(self, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the per-sample log-likelihood and the log responsibilities."""
+        weighted_log_prob = self._estimate_weighted_log_prob(X)
+        log_prob_norm = logsumexp(weighted_log_prob, axis=1)
+        return log_prob_norm, weighted_log_prob - log_prob_norm[:, None]
+
+    def fit_predict(self, X: np.ndarray, sample_weight: np.ndarray | None = None) -> np.ndarray:
+        """
+        Fits the mixture with weighted EM and returns the component of each sample.
+
+        Parameters
+        ----------
+            X : NDArray
+                The (n_samples, n_features) training data.
+            sample_weight : NDArray | None
+                Non-negative weight of each sample, e.g. pattern counts. Default is `None` (unit weights).
+
+        Returns
+        -------
+            NDArray
+                The most likely component of each sample.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        sample_weight = (np.ones(len(X)) if sample_weight is None
+                         else np.asarray(sample_weight, dtype=np.float64))
+        if len(X) < self.n_components:
+            raise ValueError(f"Expected n_samples >= n_components but got n_components = "
+                             f"{self.n_components}, n_samples = {len(X)}")
+
+        random_state = check_random_state(self.random_state)
+        kmeans_labels = KMeans(n_clusters=self.n_components, n_init=1, random_state=random_state).fit(
+            X, sample_weight=sample_weight).labels_
+        resp = np.zeros((len(X), self.n_components))
+        resp[np.arange(len(X)), kmeans_labels] = 1
+        self._m_step(X, resp, sample_weight)
+
+        self.converged_ = False
+        lower_bound = -np.inf
+        total_weight = sample_weight.sum()
+        for n_iter in range(1, self.max_iter + 1):
+            prev_lower_bound = lower_bound
+            log_prob_norm, log_resp = self._e_step(X)
+            self._m_step(X, np.exp(log_resp), sample_weight)
+            lower_bound = np.dot(sample_weight, log_prob_norm) / total_weight
+            if abs(lower_bound - prev_lower_bound) < self.tol:
+                self.converged_ = True
+                break
+
+        if not self.converged_:
+            warnings.warn("Best performing initialization did not converge. Try different init "
+                          "parameters, or increase max_iter, tol, or check for degenerate data.",
+                          ConvergenceWarning)
+        self.n_iter_ = n_iter
+        self.lower_bound_ = lower_bound
+
+        # final e-step so the labels agree with predict
+        _, log_resp = self._e_step(X)
+        return log_resp.argmax(axis=1)
+
+    def fit(self, X: np.ndarray, sample_weight: np.ndarray | None = None) -> "WeightedGaussianMixture":
+        """Fits the mixture with weighted EM and returns the fitted estimator."""
+        self.fit_predict(X, sample_weight=sample_weight)
+        return self
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Returns the most likely component of each sample."""
+        return self._estimate_weighted_log_prob(np.asarray(X, dtype=np.float64)).argmax(axis=1)
@@ -1,23 +1,67 @@
 from setup.preprocess import prep_sample
 from clustering.cluster import label_and_score
+from clustering.store import FIT_STORE
 from pipelineio.visualization import plot_pca_clusters, plot_mode_cluster_heatmaps
+from pipelineio.render import RENDERER
+from pipelineio.writer import WRITER
+from pipelineio.io_utils import save_df
+from pipelineio.artifact_cache import CACHE
+from pipelineio.scheduler import StageScheduler
+from setup.config import DATA_PATH
+from setup.profiles import ResponseDistribution
+from setup.responses import ResponseMatrix
+from typing import Literal
+import numpy as np
+import pandas as pd
 
-def main() -> None:
-    """Main script to run pipeline. Using k=2 as best seen in Jupyter Notebook testing."""
-    X = prep_sample(save=True, use_all=True)
-    results, summary = label_and_score(X, save=True)
-    print(summary)
+def _profile_clusters(X: ResponseMatrix, results: dict, ks: tuple[int, ...], prefix: str) -> None:
+    """Saves the response distribution of each k and queues its heatmap."""
+    for k in ks:
+        labels_best = results[k]["labels"]
+
+        # one count tensor feeds the heatmap and the saved per-cluster response distributions
+        dist = ResponseDistribution.from_labels(X.values, labels_best, X.columns)
+        save_df(dist.to_frame(), f"{k}_response_distribution.csv")
 
-    plot_pca_clusters(X, "gmm_pca")
+        RENDERER.submit(plot_mode_cluster_heatmaps, dist, f"{prefix}_response_heatmap_k_{k}")
 
-    for k in (2, 4, 6):
-        k_best = k
-        labels_best = results[k_best]["labels"]
+def run(X: ResponseMatrix, X_pca: np.ndarray | None = None,
+        sil_mode: Literal["exact", "sampled"] | None = "exact") -> tuple[dict, pd.DataFrame]:
+    """
+    Runs the pipeline on loaded responses, optionally reusing a PCA projection, and returns the results
+    and score summary. `sil_mode=None` leaves the scores to the caller, see `label_and_score`.
+    """
+    float_gb = X.values.size * 8 / 2**30
+    scheduler = StageScheduler()
+    # each stage is skipped when its inputs, parameters and code match a cached run; the PCA plot
+    # reuses the fitted models, which a cached fit restores, so it follows the fit; it draws with pyplot,
+    # so it runs on this thread, with the profiles declared first to run beside it on a worker
+    scheduler.add("fit", lambda: CACHE.run("fit", label_and_score, X, save=True, sil_mode=sil_mode,
+                                                 fits=FIT_STORE),
+                  cores=scheduler.cores, mem_gb=4 * float_gb)
+    scheduler.add("profiles", lambda fit: _profile_clusters(X, fit[0], (2, 4, 6), "gmm"), deps=("fit",))
+    # the figure draws the fit's labels from FIT_STORE, so they are part of its key
+    scheduler.add("plot", lambda fit: CACHE.run("plot", plot_pca_clusters, X, "gmm_pca", X_pca=X_pca,
+                                                  inputs=(X, "gmm_pca", {k: r["labels"] for k, r in fit[0].items()}),
+                                                  fits=FIT_STORE),
+                  deps=("fit",), mem_gb=2 * float_gb, main_thread=True)
+    stage_results = scheduler.run()
+    results, summary = stage_results["fit"]
+    if sil_mode is not None:
+        print(summary)
+    print("Critical path:", " -> ".join(scheduler.critical_path()))
 
-        df_labeled = X.copy()
-        df_labeled["Cluster"] = labels_best
+    RENDERER.close()
+    # surface failed writes here rather than at exit, then keep the per-artifact write times
+    WRITER.flush()
+    save_df(scheduler.timeline(), "stage_timeline.csv")
+    save_df(WRITER.timing_frame(), "artifact_timings.csv")
+    return results, summary
 
-        cluster_modes = plot_mode_cluster_heatmaps(df_labeled, f"gmm_response_heatmap_k_{k}")
+def main() -> None:
+    """Main script to run pipeline. Using k=2 as best seen in Jupyter Notebook testing."""
+    X = CACHE.run("preprocess", prep_sample, inputs=DATA_PATH, save=True, use_all=True)
+    run(X)
 
 if __name__ == "__main__":
     main()
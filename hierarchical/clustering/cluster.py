@@ -1,54 +1,74 @@
 import numpy as np
 import pandas as pd
-from scipy.cluster.hierarchy import fcluster
-from sklearn.metrics import silhouette_score
 from pipelineio.io_utils import save_df
+from pipelineio.label_store import save_labels
+from setup.responses import ResponseMatrix
+from .silhouette import score_labelings
+from .cuts import cut_table, labels_for, save_cut_table
+from .store import FIT_STORE, FitResult, FitStore, cluster_centroids, tree_fingerprint
 from typing import Any, Literal
 
-def label_and_score(X: pd.DataFrame, 
+def label_and_score(X: ResponseMatrix, 
                     Z: np.ndarray, 
                     ks: tuple[int, ...] = (2, 3, 4), 
                     save: bool = True, 
-                    linkage: Literal["single", "complete", "average", "ward"] = "") -> tuple[dict[int, dict[Any, float]], pd.DataFrame]:
+                    linkage: Literal["single", "complete", "average", "ward"] = "",
+                    sil_mode: Literal["exact", "sampled"] | None = "exact",
+                    store: FitStore = FIT_STORE) -> tuple[dict[int, dict[Any, float]], pd.DataFrame]:
     """
     Labels each data point and calculates a Silhouette score per k-cluster.
 
     Parameters
     ----------
-        X : DataFrame
-            The DataFrame containing question responses.
+        X : ResponseMatrix
+            The uint8 matrix containing question responses.
         Z : NDArray
             The linkage to use for clustering.
         ks : tuple[int, ...]
             One or values to use as the number of clusters.
         save : bool
-            Set to `True` to save the DataFrame to a CSV file. Default is `False`.
+            Set to `True` to save the labels to the label store and the summary to a CSV file. Default is `True`.
         linkage : LiteralString
             The type of linkage used for Z.
+        sil_mode : Literal["exact", "sampled"] | None
+            `"exact"` scores every row. `"sampled"` estimates the scores from stratified per-cluster
+            subsamples with bootstrap confidence intervals. `None` leaves the scores empty for the
+            caller to compute and write, as `run_all` does across algorithms. Default is `"exact"`.
+        store : FitStore
+            Where each cut of the tree is kept for plotting and analysis. Default is `FIT_STORE`.
 
     Returns
     -------
         results : dict[int, dict[Any, float]
             A dictionary mapping cluster sizes to a dictionary of labels and Silhouette scores.
         summary : DataFrame
-            A summary DataFrame of the cluster size and Silhouette scores.
+            A summary DataFrame of the cluster size, Silhouette scores and the mode that produced them.
     """
     # output dict and/or df
     results = {}
+    tree = tree_fingerprint(Z)
+    # one pass over Z cuts every k; the table is saved next to the linkages for later lookups
+    table = cut_table(Z, max(ks))
+    if save:
+        save_cut_table(table, linkage or "tree")
     for k in ks:
-        labels = fcluster(Z, k, criterion="maxclust")
-        score = silhouette_score(X, labels)
-        results[k] = dict(labels=labels, sil=score)
+        labels = labels_for(table, k)
+        results[k] = dict(labels=labels)
+        store.put("hierarchical", X, FitResult(labels, cluster_centroids(X, labels)), k=k, linkage=linkage, tree=tree)
 
-        df_labels = X.copy()
-        df_labels["Cluster"] = labels
-        if save:
-            save_df(df_labels, f"{linkage}_{k}_clusters_labels.csv")
+    if save:
+        save_labels(X, {f"{linkage or 'tree'}_k{k}": results[k]["labels"] for k in ks})
+
+    # one streamed distance pass scores every k
+    scores = score_labelings(X.to_float(), {k: results[k]["labels"] for k in ks}, mode=sil_mode)
+    for k in ks:
+        results[k].update(scores[k])
 
     # save summary df
-    summary_rows = [dict(k=k, sil=results[k]["sil"]) for k in ks]
+    summary_rows = [dict(k=k, **scores[k]) for k in ks]
     summary = pd.DataFrame(summary_rows)
-    if save:
+    # a deferred summary has no scores yet, so the caller writes it
+    if save and sil_mode is not None:
         save_df(summary, f"{linkage}_sil_score_summary.csv")
 
     return results, summary
@@ -0,0 +1,96 @@
+from pathlib import Path
+import numpy as np
+from scipy.cluster.hierarchy import leaves_list
+from pipelineio.io_utils import ensure_dir_exists
+
+def _max_dists(Z: np.ndarray) -> np.ndarray:
+    """Returns the largest merge height within each node's subtree, as `fcluster` uses for `maxclust`."""
+    n = len(Z) + 1
+    max_dists = Z[:, 2].copy()
+    for i, (a, b) in enumerate(Z[:, :2].astype(np.intp)):
+        if a >= n:
+            max_dists[i] = max(max_dists[i], max_dists[a - n])
+        if b >= n:
+            max_dists[i] = max(max_dists[i], max_dists[b - n])
+    return max_dists
+
+def cut_table(Z: np.ndarray, k_max: int) -> np.ndarray:
+    """
+    Cuts a tree into every k from 2 to `k_max` in a single pass and returns the labels as one table.
+
+    Column `k - 2` holds the labels `fcluster(Z, k, criterion="maxclust")` gives, numbered the same
+    way. Only the few nodes above the deepest cut are visited one by one; each subtree below it is a
+    contiguous range of `leaves_list(Z)` and is labeled for all ks with one assignment.
+
+    Parameters
+    ----------
+        Z : NDArray
+            A scipy-compatible linkage matrix.
+        k_max : int
+            The largest number of clusters.
+
+    Returns
+    -------
+        NDArray
+            The (n, k_max - 1) label table, int8 when the labels fit and int16 otherwise.
+
+    Usage
+    -----
+    >>> table = cut_table(Z_ward, 10)
+    >>> table[:, 4 - 2]  # labels for k=4
+    array([1, 3, 3, ..., 2], dtype=int8)
+    """
+    n = len(Z) + 1
+    ks = np.arange(2, k_max + 1)
+    max_dists = _max_dists(Z)
+
+    # like fcluster, cut at the smallest merge height that leaves at most k clusters
+    sorted_dists = np.sort(max_dists)
+    thresholds = np.where(n - ks - 1 >= 0, sorted_dists[np.clip(n - ks - 1, 0, None)], -np.inf)
+
+    order = leaves_list(Z)
+    table = np.zeros((n, len(ks)), dtype=np.int8 if k_max <= np.iinfo(np.int8).max else np.int16)
+    next_label = np.ones(len(ks), dtype=table.dtype)
+
+    # depth-first in fcluster's order, carrying the labels already fixed above each node (0 = not yet)
+    stack = [(2 * n - 2, 0, np.zeros(len(ks), dtype=table.dtype))]
+    while stack:
+        node, start, labels = stack.pop()
+        is_leaf = node < n
+        closed = labels == 0
+        if not is_leaf:
+            closed &= max_dists[node - n] <= thresholds
+        labels = labels.copy()
+        labels[closed] = next_label[closed]
+        next_label[closed] += 1
+
+        if is_leaf:
+            table[order[start]] = labels
+        elif labels.all():
+            count = int(Z[node - n, 3])
+            table[order[start:start + count]] = labels
+        else:
+            left, right = Z[node - n, :2].astype(np.intp)
+            left_count = 1 if left < n else int(Z[left - n, 3])
+            children = [(left, start, labels), (right, start + left_count, labels)]
+            # fcluster numbers internal children before leaf children, left before right
+            children.sort(key=lambda child: child[0] < n)
+            stack.extend(reversed(children))
+
+    # fcluster numbers singletons by row once k reaches n
+    table[:, ks >= n] = np.arange(1, n + 1, dtype=table.dtype)[:, None]
+    return table
+
+def save_cut_table(table: np.ndarray, name: str) -> Path:
+    """Saves a cut table as `cut_tables/<name>_cut_table.npy` next to the linkages and returns the path."""
+    out_path = ensure_dir_exists("cut_tables") / f"{name}_cut_table.npy"
+    np.save(out_path, table)
+    return out_path
+
+def load_cut_table(path: Path) -> np.ndarray:
+    """Reopens a saved cut table as a read-only memory map."""
+    return np.load(path, mmap_mode="r")
+
+def labels_for(table: np.ndarray, k: int) -> np.ndarray:
+    """Returns the labels for k clusters from a cut table."""
+    return np.asarray(table[:, k - 2])
@@ -1,69 +1,256 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
 import pandas as pd
 import numpy as np
-from scipy.spatial.distance import pdist, squareform
 from scipy.cluster.hierarchy import linkage
+from scipy.spatial.distance import cdist
+from threadpoolctl import threadpool_limits
 from pipelineio.io_utils import ensure_dir_exists
+from typing import Literal
+from setup.config import DISTANCE_DTYPE, DISTANCE_WORKING_MEMORY_MB, LINKAGE_MODE
+from .linkages import bisecting_linkage, precomputed_linkage, two_stage_ward
 import joblib
 
-def compute_distances(X: pd.DataFrame, save: bool = False) -> tuple[np.ndarray, np.ndarray]:
+# metrics that only produce integers on integer responses, so they can be stored in integer dtypes
+INTEGER_METRICS: tuple[str, ...] = ("cityblock", "sqeuclidean", "chebyshev")
+
+def condensed_distances(X: pd.DataFrame | np.ndarray,
+                        metric: str = "euclidean",
+                        dtype: str | np.dtype = DISTANCE_DTYPE,
+                        path: Path | None = None,
+                        working_memory: int = DISTANCE_WORKING_MEMORY_MB) -> np.ndarray:
     """
-    Computes Euclidean and Manhattan distance matrices and optionally saves to .npy files.
+    Computes the condensed pairwise distance vector of X in row blocks, optionally straight into a file.
+
+    The vector has the layout of `scipy.spatial.distance.pdist`, n * (n - 1) / 2 entries. Rows are
+    processed in blocks of at most `working_memory` MiB of float64 distances, and each block's upper
+    triangle is a contiguous slice of the vector, so it is written in place without ever building
+    the square matrix. With a `path`, the vector is a memory-mapped .npy file that `open_distances`
+    reopens without loading it into RAM.
+
+    Parameters
+    ----------
+        X : DataFrame or array-like
+            The (n_samples, n_features) input array.
+        metric : str
+            Any `scipy.spatial.distance.cdist` metric. Default is `"euclidean"`.
+        dtype : str | dtype
+            The stored dtype. Integer dtypes are only allowed for `INTEGER_METRICS` on integer data,
+            and a `ValueError` is raised if a distance exceeds the dtype's range. Default is `DISTANCE_DTYPE`.
+        path : Path | None
+            The .npy file to write the distances to. Default is `None`, which keeps them in memory.
+        working_memory : int
+            The maximum size in MiB of a block of distances. Default is `DISTANCE_WORKING_MEMORY_MB`.
+
+    Returns
+    -------
+        NDArray
+            The condensed distances, memory-mapped when `path` is given.
+
+    Usage
+    -----
+    >>> condensed_distances(X, metric="cityblock", dtype="uint8", path=out_dir / "manhattan.npy")
+    memmap([...], dtype=uint8)
+    """
+    X = np.asarray(X)
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer):
+        if metric not in INTEGER_METRICS or not np.all(np.mod(X, 1) == 0):
+            raise ValueError(f"Integer dtype {dtype} needs integer data and a metric in {INTEGER_METRICS}, got {metric!r}.")
+    X = X.astype(np.float64)
+    n = len(X)
+    size = n * (n - 1) // 2
+
+    if path is None:
+        out = np.empty(size, dtype=dtype)
+    else:
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(size,))
+
+    # the upper triangles of consecutive rows are consecutive slices of the condensed vector
+    block_rows = max(1, int(working_memory * 2**20 // (8 * max(n, 1))))
+    offset = 0
+    for start in range(0, n - 1, block_rows):
+        stop = min(start + block_rows, n - 1)
+        block = cdist(X[start:stop], X[start:], metric=metric)
+        # row t of the block starts at column start + t, so its upper triangle is right of the diagonal
+        values = block[np.arange(block.shape[1])[None, :] > np.arange(stop - start)[:, None]]
+        if np.issubdtype(dtype, np.integer):
+            np.rint(values, out=values)
+            if len(values) and values.max() > np.iinfo(dtype).max:
+                raise ValueError(f"{metric} distances up to {values.max():g} overflow {dtype}; "
+                                 f"use a wider dtype such as uint16 or a float dtype.")
+        out[offset:offset + len(values)] = values
+        offset += len(values)
+
+    if path is not None:
+        out.flush()
+    return out
+
+def open_distances(path: Path) -> np.ndarray:
+    """Reopens a condensed distance file written by `condensed_distances` as a read-only memory map."""
+    return np.load(path, mmap_mode="r")
+
+def compute_distances(X: pd.DataFrame,
+                      save: bool = False,
+                      dtype: str | np.dtype = DISTANCE_DTYPE) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Computes condensed Euclidean and Manhattan distances and optionally saves them to .npy files.
 
     Parameters
     ----------
         X : DataFrame or array-like
             The input array for calculating distance matrices.
         save : bool
-            Set to `True` to save the DataFrame to a CSV file. Default is `False`.
+            Set to `True` to write the distances to memory-mapped .npy files under `distance_matrices`.
+            Default is `False`.
+        dtype : str | dtype
+            The stored dtype of the Euclidean distances. Manhattan distances use it too unless it is a
+            float, in which case integer responses are stored as `uint16`. Default is `DISTANCE_DTYPE`.
 
     Returns
     -------
         euclidean : NDArray
-            The computed Euclidean distance matrix.
+            The condensed Euclidean distances, in `pdist` layout.
         manhattan : NDArray
-            The computed Manhattan distance matrix.  
+            The condensed Manhattan distances, in `pdist` layout.
     """
-    euclidean = squareform(pdist(X, metric="euclidean"))
-    manhattan = squareform(pdist(X, metric="cityblock"))
-
-    if save:
-        out_dir = ensure_dir_exists("distance_matrices")
-        np.save(out_dir / "euclidean.npy", euclidean)
-        np.save(out_dir / "manhattan.npy", manhattan)
+    X = np.asarray(X)
+    manhattan_dtype = dtype
+    if not np.issubdtype(np.dtype(dtype), np.integer) and np.all(np.mod(X, 1) == 0):
+        manhattan_dtype = np.uint16
+    euclidean_dtype = np.float32 if np.issubdtype(np.dtype(dtype), np.integer) else dtype
 
+    out_dir = ensure_dir_exists("distance_matrices") if save else None
+    euclidean = condensed_distances(X, "euclidean", euclidean_dtype,
+                                    path=out_dir / "euclidean.npy" if save else None)
+    manhattan = condensed_distances(X, "cityblock", manhattan_dtype,
+                                    path=out_dir / "manhattan.npy" if save else None)
     return euclidean, manhattan
 
+def default_linkages_memory_gb(n_samples: int, n_jobs: int = 4) -> float:
+    """
+    Returns the peak memory in GiB of `compute_default_linkages` on `n_samples` rows.
+
+    scipy's nearest-neighbor chain updates distances in place, so each of complete, average and Ward
+    works on a private float64 copy of the condensed vector, and up to `n_jobs` of them run at once.
+    The shared memory map counts once more, as the page cache holds it while the copies are made.
+    """
+    condensed_gb = n_samples * (n_samples - 1) // 2 * 8 / 2**30
+    return condensed_gb * (1 + max(1, min(n_jobs, 3)))
+
+# per-worker BLAS/OpenMP limit, kept alive for the life of the worker by _limit_threads
+_worker_limits: list[threadpool_limits] = []
+
+def _limit_threads(blas_threads: int) -> None:
+    """Worker initializer that caps BLAS/OpenMP threads, which a parent's `threadpool_limits` does not reach."""
+    _worker_limits.append(threadpool_limits(limits=blas_threads))
+
+def _default_linkage(method: str, distances_path: Path) -> np.ndarray:
+    """Worker task computing one default linkage, reading the shared distances through a memory map."""
+    # single linkage is scipy's minimum spanning tree, which only reads the map; the C chain of the
+    # other methods copies it into memory, which the memory estimate counts, and is about twice as
+    # fast as the out-of-core nn_chain_linkage
+    return linkage(open_distances(distances_path), method)
+
+def _dump_atomic(obj: dict[str, np.ndarray], out_path: Path) -> None:
+    """Writes a joblib file through a temporary file so readers never see a partial dump."""
+    tmp_path = out_path.with_name(f".{out_path.name}.tmp-{os.getpid()}")
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, out_path)
+
 def compute_default_linkages(X: pd.DataFrame, 
-                             save: bool = False) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+                             save: bool = False,
+                             n_jobs: int = 4) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """
     Computes linkage using default input DataFrame.
 
+    The condensed Euclidean distances are computed once into a memory-mapped file that every worker
+    process maps read-only, so every method reads the same distances. Single linkage is scipy's
+    minimum spanning tree straight over the map; complete, average and Ward run scipy's
+    nearest-neighbor chain on a private copy of it, because the chain overwrites the distances it merges. The four methods run in
+    parallel, so the wall time approaches that of the slowest one, and peak memory is one condensed
+    matrix per concurrent chain plus the memory map, see `default_linkages_memory_gb`.
+
     Parameters
     ----------
         X : DataFrame or array-like
             The input array for computing linkages.
         save : bool
-            Set to `True` to save the linkage results to a .joblib file. Default is `False`.
+            Set to `True` to save the linkage results to a .joblib file, rewritten as each method
+            finishes. Default is `False`.
+        n_jobs : int
+            The number of cores to use. Up to four worker processes run with one BLAS/OpenMP thread
+            each, so the methods keep within `n_jobs` cores. `1` computes them one after another in
+            this process. Default is `4`.
 
     Returns
     -------
         Z_single, Z_complete, Z_average, Z_ward : four NDArrays
             The computed linkage results.
     """
-    Z_single = linkage(X, method="single")
-    Z_complete = linkage(X, method="complete")
-    Z_average = linkage(X, method="average")
-    Z_ward = linkage(X, method="ward")
+    X = np.asarray(X, dtype=np.float64)
+    methods = ("single", "complete", "average", "ward")
+    out_path = ensure_dir_exists("default_linkages") / "default_linkages.joblib" if save else None
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # float64 distances keep the trees identical to scipy; float32 rounding can break Ward ties differently
+        distances_path = Path(tmp_dir) / "euclidean.npy"
+        condensed_distances(X, dtype=np.float64, path=distances_path)
+
+        def finish(method: str, Z: np.ndarray) -> None:
+            results[method] = Z
+            if save:
+                _dump_atomic({f"Z_{m}_default": results[m] for m in methods if m in results}, out_path)
+
+        if n_jobs == 1:
+            for method in methods:
+                finish(method, _default_linkage(method, distances_path))
+        else:
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(methods)), initializer=_limit_threads,
+                                     initargs=(1,)) as pool:
+                futures = {pool.submit(_default_linkage, method, distances_path): method for method in methods}
+                for future in as_completed(futures):
+                    finish(futures[future], future.result())
+
+    return results["single"], results["complete"], results["average"], results["ward"]
+
+def compute_ward_linkage(X: pd.DataFrame,
+                         mode: Literal["two_stage", "bisecting"] = LINKAGE_MODE,
+                         save: bool = False) -> np.ndarray:
+    """
+    Computes an approximate Ward linkage over every row without the quadratic distance matrix.
+
+    Parameters
+    ----------
+        X : DataFrame or array-like
+            The input array for computing the linkage.
+        mode : Literal["two_stage", "bisecting"]
+            `"two_stage"` agglomerates `MICRO_CLUSTERS` mini-batch k-means micro-clusters, see
+            `two_stage_ward`. `"bisecting"` splits top-down with 2-means down to groups of
+            `BISECT_LEAF_SIZE` rows, see `bisecting_linkage`. Default is `LINKAGE_MODE`.
+        save : bool
+            Set to `True` to save the linkage to a .joblib file. Default is `False`.
+
+    Returns
+    -------
+        NDArray
+            The scipy-compatible (n - 1, 4) linkage matrix over the rows of X.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    if mode == "two_stage":
+        Z = two_stage_ward(X)
+    elif mode == "bisecting":
+        Z = bisecting_linkage(X)
+    else:
+        raise ValueError(f"Unknown approximate linkage mode {mode!r}, expected 'two_stage' or 'bisecting'.")
 
     if save:
-        out_dir = ensure_dir_exists("default_linkages")
-        joblib.dump(dict(Z_single_default=Z_single,
-                         Z_complete_default=Z_complete,
-                         Z_average_default=Z_average,
-                         Z_ward_default=Z_ward), 
-                    out_dir / "default_linkages.joblib")
-        
-    return Z_single, Z_complete, Z_average, Z_ward
+        out_dir = ensure_dir_exists("ward_linkage")
+        _dump_atomic({f"Z_ward_{mode}": Z}, out_dir / f"ward_{mode}_linkage.joblib")
+    return Z
 
 def compute_euclidean_linkages(X_euclidean: np.ndarray, 
                                save: bool = False) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
@@ -73,7 +260,7 @@ def compute_euclidean_linkages(X_euclidean: np.ndarray,
     Parameters
     ----------
         X_euclidean : NDArray or array-like
-            The precomputed pairwise Euclidean input array for computing linkages.
+            The precomputed Euclidean distances from `compute_distances`, condensed or square.
         save : bool
             Set to `True` to save the linkage results to a .joblib file. Default is `False`.
 
@@ -82,9 +269,9 @@ def compute_euclidean_linkages(X_euclidean: np.ndarray,
         Z_single, Z_complete, Z_average : three NDArrays
             The computed linkage results using precomputed Euclidean pairwise distance matrices.
     """
-    Z_single = linkage(X_euclidean, method="single")
-    Z_complete = linkage(X_euclidean, method="complete")
-    Z_average = linkage(X_euclidean, method="average")
+    Z_single = precomputed_linkage(X_euclidean, "single", metric="euclidean")
+    Z_complete = precomputed_linkage(X_euclidean, "complete", metric="euclidean")
+    Z_average = precomputed_linkage(X_euclidean, "average", metric="euclidean")
 
     if save:
         out_dir = ensure_dir_exists("euclidean_linkages")
@@ -103,7 +290,7 @@ def compute_manhattan_linkages(X_manhattan: np.ndarray,
     Parameters
     ----------
         X_manhattan : NDArray or array-like
-            The precomputed pairwise Manhattan input array for computing linkages.
+            The precomputed Manhattan distances from `compute_distances`, condensed or square.
         save : bool
             Set to `True` to save the linkage results to a .joblib file. Default is `False`.
 
@@ -112,9 +299,9 @@ def compute_manhattan_linkages(X_manhattan: np.ndarray,
         Z_single, Z_complete, Z_average : three NDArrays
             The computed linkage results using precomputed Manhattan pairwise distance matrices.
     """
-    Z_single = linkage(X_manhattan, method="single")
-    Z_complete = linkage(X_manhattan, method="complete")
-    Z_average = linkage(X_manhattan, method="average")
+    Z_single = precomputed_linkage(X_manhattan, "single", metric="cityblock")
+    Z_complete = precomputed_linkage(X_manhattan, "complete", metric="cityblock")
+    Z_average = precomputed_linkage(X_manhattan, "average", metric="cityblock")
 
     if save:
         out_dir = ensure_dir_exists("manhattan_linkages")
@@ -0,0 +1,386 @@
+from typing import Literal
+import numpy as np
+from scipy.cluster.hierarchy import linkage
+from scipy.spatial.distance import cdist, pdist, squareform
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from setup.config import BISECT_LEAF_SIZE, MICRO_CLUSTERS, RANDOM_STATE
+
+def _condensed_index(n: int, i: int | np.ndarray, j: int | np.ndarray) -> int | np.ndarray:
+    """Returns the position of the pair (i, j) in a condensed distance vector, for any order of i and j."""
+    lo, hi = np.minimum(i, j), np.maximum(i, j)
+    return n * lo - lo * (lo + 1) // 2 + hi - lo - 1
+
+def _label_merges(merges: np.ndarray, n: int) -> np.ndarray:
+    """
+    Turns merges of original slots (x, y, distance) into a scipy linkage matrix.
+
+    The merges are sorted by distance (stable, as scipy does) and each slot is mapped to the id of the
+    cluster that currently holds it, with new clusters numbered n, n + 1, ... in merge order.
+    """
+    merges = merges[np.argsort(merges[:, 2], kind="mergesort")]
+    parent = np.arange(2 * n - 1)
+    size = np.ones(2 * n - 1, dtype=np.int64)
+
+    def find(x: int) -> int:
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    Z = np.empty((n - 1, 4))
+    for i, (x, y, dist) in enumerate(merges):
+        a, b = find(int(x)), find(int(y))
+        parent[a] = parent[b] = n + i
+        size[n + i] = size[a] + size[b]
+        Z[i] = min(a, b), max(a, b), dist, size[n + i]
+    return Z
+
+def single_linkage_mst(X: np.ndarray, metric: str = "euclidean") -> np.ndarray:
+    """
+    Computes single linkage as a minimum spanning tree built with Prim's algorithm.
+
+    Each step computes one row of distances, from the vertex that just joined the tree to the vertices
+    outside it, so memory is O(n) and no distance matrix is ever stored. Recomputing the distances
+    makes it slower than scipy's single linkage on a condensed matrix (1.8 s against 1.1 s at
+    n = 8000), so use it only where the O(n^2) distances cannot be built.
+
+    Parameters
+    ----------
+        X : NDArray
+            The (n_samples, n_features) input array.
+        metric : str
+            Any `scipy.spatial.distance.cdist` metric. Default is `"euclidean"`.
+
+    Returns
+    -------
+        NDArray
+            The scipy-compatible (n - 1, 4) linkage matrix.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n = len(X)
+    outside = np.ones(n, dtype=bool)
+    to_tree = np.full(n, np.inf)
+    nearest = np.zeros(n, dtype=np.intp)
+    merges = np.empty((n - 1, 3))
+
+    current = 0
+    outside[current] = False
+    for step in range(n - 1):
+        rest = np.flatnonzero(outside)
+        dist = cdist(X[current:current + 1], X[rest], metric=metric)[0]
+        closer = dist < to_tree[rest]
+        to_tree[rest[closer]] = dist[closer]
+        nearest[rest[closer]] = current
+
+        current = rest[np.argmin(to_tree[rest])]
+        merges[step] = nearest[current], current, to_tree[current]
+        outside[current] = False
+    return _label_merges(merges, n)
+
+def nn_chain_linkage(d: np.ndarray,
+                     method: Literal["complete", "average", "ward"] = "ward",
+                     copy: bool = True,
+                     sizes: np.ndarray | None = None) -> np.ndarray:
+    """
+    Computes complete, average or Ward linkage from condensed distances with the nearest-neighbor chain.
+
+    The chain follows nearest neighbors until it reaches a reciprocal pair, merges it and updates the
+    merged cluster's distances with the Lance-Williams formula, in place in the condensed vector. Every
+    step is a vectorized pass over one row, so the only O(n^2) memory is the condensed vector itself,
+    kept in its own dtype (e.g. float32) rather than converted to float64, and with `copy=False` a
+    writable memory map is updated on disk. This is the out-of-core engine: scipy's C chain, which
+    works on a float64 copy in memory, is about twice as fast wherever that copy fits, and it is what
+    `precomputed_linkage` and `compute_default_linkages` use for in-memory distances.
+
+    Parameters
+    ----------
+        d : NDArray
+            The condensed pairwise distances, Euclidean for `"ward"`. Integer distances are copied to float64.
+        method : Literal["complete", "average", "ward"]
+            The linkage method. Default is `"ward"`.
+        copy : bool
+            Set to `False` to update `d` in place, which destroys it. Default is `True`.
+        sizes : NDArray | None
+            The initial size of each point when the points stand for groups, e.g. micro-cluster
+            centroids. Default is `None`, which means every point is a single sample.
+
+    Returns
+    -------
+        NDArray
+            The scipy-compatible (n - 1, 4) linkage matrix. Counts in column 3 are points, not sizes.
+    """
+    if method not in ("complete", "average", "ward"):
+        raise ValueError(f"Unknown nearest-neighbor-chain method {method!r}.")
+    if not np.issubdtype(d.dtype, np.floating):
+        # merged distances are not integers, e.g. averages of Manhattan distances
+        d = d.astype(np.float64)
+    elif copy or not d.flags.writeable:
+        d = np.array(d, copy=True)
+    n = int(np.ceil(np.sqrt(2 * len(d)))) or 1
+    if n * (n - 1) // 2 != len(d):
+        raise ValueError(f"A condensed distance vector of length {len(d)} does not match any number of samples.")
+
+    active = np.ones(n, dtype=bool)
+    size = np.ones(n) if sizes is None else np.asarray(sizes, dtype=np.float64).copy()
+    merges = np.empty((n - 1, 3))
+    chain: list[int] = []
+
+    for step in range(n - 1):
+        if not chain:
+            chain.append(int(np.argmax(active)))
+        while True:
+            x = chain[-1]
+            others = np.flatnonzero(active)
+            others = others[others != x]
+            dist = d[_condensed_index(n, x, others)]
+            j = int(np.argmin(dist))
+            y, best = int(others[j]), dist[j]
+            # on ties keep the previous chain element so the chain always terminates
+            if len(chain) > 1 and d[_condensed_index(n, x, chain[-2])] <= best:
+                y = chain[-2]
+                break
+            chain.append(y)
+
+        chain.pop()
+        chain.pop()
+        x, y = min(x, y), max(x, y)
+        dxy = float(d[_condensed_index(n, x, y)])
+        merges[step] = x, y, dxy
+
+        # the merged cluster lives on in slot y
+        active[x] = False
+        others = np.flatnonzero(active)
+        others = others[others != y]
+        ix, iy = _condensed_index(n, x, others), _condensed_index(n, y, others)
+        dkx, dky = d[ix].astype(np.float64), d[iy].astype(np.float64)
+        nx, ny = size[x], size[y]
+        if method == "complete":
+            d[iy] = np.maximum(dkx, dky)
+        elif method == "average":
+            d[iy] = (nx * dkx + ny * dky) / (nx + ny)
+        else:
+            nk = size[others]
+            t = 1.0 / (nx + ny + nk)
+            # same operation order as scipy, so ties on integer responses break the same way
+            d[iy] = np.sqrt((nk + nx) * t * dkx * dkx + (nk + ny) * t * dky * dky - nk * t * dxy * dxy)
+        size[y] = nx + ny
+    return _label_merges(merges, n)
+
+def validate_condensed(distances: np.ndarray, chunk: int = 2**24) -> tuple[np.ndarray, int]:
+    """
+    Checks a precomputed distance matrix and returns it in condensed form with its number of samples.
+
+    A square matrix must be symmetric with a zero diagonal and is converted with `squareform`. A
+    condensed vector must have a triangular length. Every distance must be finite and non-negative;
+    these checks run in chunks so memory-mapped vectors are never loaded whole.
+
+    Parameters
+    ----------
+        distances : NDArray
+            A condensed distance vector in `pdist` layout, or a square distance matrix.
+        chunk : int
+            The number of distances checked at a time. Default is `2**24`.
+
+    Returns
+    -------
+        distances : NDArray
+            The condensed distances, the input itself when it was already condensed.
+        n : int
+            The number of samples.
+    """
+    if distances.ndim == 2:
+        if distances.shape[0] != distances.shape[1]:
+            raise ValueError(f"A square distance matrix is required, got shape {distances.shape}.")
+        if not np.allclose(np.diagonal(distances), 0) or not np.allclose(distances, distances.T):
+            raise ValueError("A square distance matrix must be symmetric with a zero diagonal.")
+        distances = squareform(distances, checks=False)
+    elif distances.ndim != 1:
+        raise ValueError(f"Distances must be condensed (1D) or square (2D), got {distances.ndim} dimensions.")
+
+    n = int(np.ceil(np.sqrt(2 * len(distances)))) or 1
+    if n * (n - 1) // 2 != len(distances):
+        raise ValueError(f"A condensed distance vector of length {len(distances)} does not match any number of samples.")
+    for start in range(0, len(distances), chunk):
+        part = distances[start:start + chunk]
+        if not np.all(np.isfinite(part)) or np.any(part < 0):
+            raise ValueError("Distances must be finite and non-negative.")
+    return distances, n
+
+def precomputed_linkage(distances: np.ndarray,
+                        method: Literal["single", "complete", "average", "weighted", "ward"] = "average",
+                        metric: str = "euclidean") -> np.ndarray:
+    """
+    Computes a linkage directly from precomputed distances of any metric.
+
+    The distances are validated once and used as they are, so `linkage` never mistakes a square
+    matrix for n observations of n features. In-memory distances go to scipy. For memory-mapped
+    distances, complete, average and Ward run `nn_chain_linkage` in the distances' own dtype
+    rather than on a float64 copy; single and weighted still use scipy, which reads them without copying.
+
+    Parameters
+    ----------
+        distances : NDArray
+            A condensed distance vector in `pdist` layout, or a square distance matrix.
+        method : Literal["single", "complete", "average", "weighted", "ward"]
+            The linkage method. Default is `"average"`.
+        metric : str
+            The metric the distances were computed with. Ward is only defined for `"euclidean"`.
+            Default is `"euclidean"`.
+
+    Returns
+    -------
+        NDArray
+            The scipy-compatible (n - 1, 4) linkage matrix.
+
+    Usage
+    -----
+    >>> precomputed_linkage(condensed_distances(X, metric="cityblock"), "complete", metric="cityblock")
+    array([[...]])
+    """
+    if method == "ward" and metric != "euclidean":
+        raise ValueError(f"Ward linkage needs Euclidean distances, got {metric!r}.")
+    if method not in ("single", "complete", "average", "weighted", "ward"):
+        raise ValueError(f"Unknown linkage method {method!r}.")
+    out_of_core = isinstance(distances, np.memmap)
+    distances, _ = validate_condensed(distances if out_of_core else np.asarray(distances))
+    if out_of_core and method in ("complete", "average", "ward"):
+        return nn_chain_linkage(distances, method)
+    return linkage(np.asarray(distances, dtype=np.float64), method=method)
+
+def two_stage_ward(X: np.ndarray,
+                   n_micro: int = MICRO_CLUSTERS,
+                   random_state: int | None = RANDOM_STATE) -> np.ndarray:
+    """
+    Approximates Ward linkage for large n by agglomerating mini-batch k-means micro-clusters.
+
+    X is first compressed into at most `n_micro` micro-clusters with `MiniBatchKMeans`. Ward then runs
+    on the micro-cluster means, starting from the Ward distance between groups of their sizes,
+    sqrt(2 * n_a * n_b / (n_a + n_b)) * ||c_a - c_b||, so each merge costs what it would on the rows.
+    The rows of each micro-cluster are joined at height 0 beneath it, which gives a linkage over all
+    n rows: `fcluster`, cut tables and dendrograms use it like any other Z, and cuts into at most
+    `n_micro` clusters never split a micro-cluster.
+
+    Parameters
+    ----------
+        X : NDArray
+            The (n_samples, n_features) input array.
+        n_micro : int
+            The number of micro-clusters. Default is `MICRO_CLUSTERS`.
+        random_state : int | None
+            Seed for the micro-clustering. Default is `RANDOM_STATE`.
+
+    Returns
+    -------
+        NDArray
+            The scipy-compatible (n - 1, 4) linkage matrix over the rows of X.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n = len(X)
+    if n <= n_micro:
+        return linkage(pdist(X), "ward")
+
+    micro = MiniBatchKMeans(n_clusters=n_micro, random_state=random_state, n_init="auto").fit_predict(X)
+    # drop micro-clusters that ended up empty and use exact member means as centroids
+    _, micro = np.unique(micro, return_inverse=True)
+    micro = micro.reshape(-1)
+    sizes = np.bincount(micro).astype(np.float64)
+    centroids = np.zeros((len(sizes), X.shape[1]))
+    np.add.at(centroids, micro, X)
+    centroids /= sizes[:, None]
+
+    i, j = np.triu_indices(len(sizes), k=1)
+    d = pdist(centroids) * np.sqrt(2 * sizes[i] * sizes[j] / (sizes[i] + sizes[j]))
+    del i, j
+    Z_micro = nn_chain_linkage(d, "ward", copy=False, sizes=sizes)
+
+    # a representative row per micro-cluster; every other member joins it at height 0
+    order = np.argsort(micro, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(sizes.astype(np.intp))[:-1]])
+    representative = order[starts]
+    members = np.ones(n, dtype=bool)
+    members[representative] = False
+    inner = np.column_stack([representative[micro[members]], np.flatnonzero(members), np.zeros(members.sum())])
+
+    # replay the micro merges on the representatives; the new cluster id n_micro + t stays on a representative
+    slot = np.concatenate([representative, np.empty(len(Z_micro), dtype=np.intp)])
+    outer = np.empty((len(Z_micro), 3))
+    for t, (a, b, dist, _) in enumerate(Z_micro):
+        outer[t] = slot[int(a)], slot[int(b)], dist
+        slot[len(sizes) + t] = slot[int(a)]
+    return _label_merges(np.vstack([inner, outer]), n)
+
+def _ward_gap(X_a: np.ndarray, X_b: np.ndarray) -> float:
+    """Returns the Ward distance between two groups of rows, as scipy's Ward linkage defines it."""
+    n_a, n_b = len(X_a), len(X_b)
+    return float(np.sqrt(2 * n_a * n_b / (n_a + n_b)) * np.linalg.norm(X_a.mean(axis=0) - X_b.mean(axis=0)))
+
+def bisecting_linkage(X: np.ndarray,
+                      leaf_size: int = BISECT_LEAF_SIZE,
+                      random_state: int | None = RANDOM_STATE) -> np.ndarray:
+    """
+    Builds a divisive hierarchy by recursive 2-means bisection and returns it as a linkage matrix.
+
+    Every group larger than `leaf_size` is split in two by k-means, and the split is recorded as a
+    merge at the Ward distance between its halves. Groups of at most `leaf_size` rows are finished
+    with exact Ward. Heights are raised to at least those of the merges below them, so Z is monotone.
+    Balanced splits cost O(n log n * d) instead of the quadratic agglomeration, and the result feeds
+    `fcluster`, cut tables, `plot_dendrograms` and `label_and_score` like any other Z.
+
+    Parameters
+    ----------
+        X : NDArray
+            The (n_samples, n_features) input array.
+        leaf_size : int
+            The largest group that is not bisected further. Default is `BISECT_LEAF_SIZE`.
+        random_state : int | None
+            Seed for the bisections. Default is `RANDOM_STATE`.
+
+    Returns
+    -------
+        NDArray
+            The scipy-compatible (n - 1, 4) linkage matrix over the rows of X.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    merges: list[tuple[int, int, float]] = []
+    done: dict[int, tuple[int, float]] = {}  # node -> (representative row, height)
+    stack: list[tuple] = [("visit", 0, np.arange(len(X)))]
+    next_node = 1
+
+    while stack:
+        task = stack.pop()
+        if task[0] == "combine":
+            _, node, left, right, gap = task
+            (rep_a, h_a), (rep_b, h_b) = done.pop(left), done.pop(right)
+            height = max(gap, h_a, h_b)
+            merges.append((rep_a, rep_b, height))
+            done[node] = (rep_a, height)
+            continue
+
+        _, node, rows = task
+        halves = None
+        if len(rows) > leaf_size and np.ptp(X[rows], axis=0).any():
+            labels = KMeans(n_clusters=2, n_init=1, random_state=random_state).fit_predict(X[rows])
+            if 0 < labels.sum() < len(rows):
+                halves = rows[labels == 0], rows[labels == 1]
+        if halves is not None:
+            left, right = next_node, next_node + 1
+            next_node += 2
+            stack.append(("combine", node, left, right, _ward_gap(X[halves[0]], X[halves[1]])))
+            stack.append(("visit", right, halves[1]))
+            stack.append(("visit", left, halves[0]))
+            continue
+
+        # a leaf (or a group of identical rows k-means cannot split) is finished with exact Ward
+        if len(rows) == 1:
+            done[node] = (int(rows[0]), 0.0)
+            continue
+        Z_leaf = linkage(pdist(X[rows]), "ward")
+        slot = np.concatenate([rows, np.empty(len(Z_leaf), dtype=np.intp)])
+        for t, (a, b, dist, _) in enumerate(Z_leaf):
+            merges.append((int(slot[int(a)]), int(slot[int(b)]), dist))
+            slot[len(rows) + t] = slot[int(a)]
+        done[node] = (int(rows[0]) if len(Z_leaf) == 0 else int(slot[-1]), float(Z_leaf[-1, 2]))
+
+    return _label_merges(np.array(merges, dtype=np.float64).reshape(-1, 3), len(X))
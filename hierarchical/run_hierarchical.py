@@ -1,26 +1,83 @@
 from setup.preprocess import prep_sample
-from clustering.distances import compute_default_linkages
+from clustering.distances import compute_default_linkages, compute_ward_linkage, default_linkages_memory_gb
 from clustering.cluster import label_and_score
+from clustering.store import FIT_STORE
 from pipelineio.visualization import plot_dendrograms, plot_pca_clusters, plot_mode_cluster_heatmaps
+from pipelineio.render import RENDERER
+from pipelineio.writer import WRITER
+from pipelineio.io_utils import save_df
+from pipelineio.artifact_cache import CACHE
+from pipelineio.scheduler import StageScheduler
+from setup.config import DATA_PATH, LINKAGE_MODE
+from setup.profiles import ResponseDistribution
+from setup.responses import ResponseMatrix
+from typing import Literal
+import numpy as np
+import pandas as pd
 
-def main() -> None:
-    """Main script to run pipeline. Using Ward linkage as best linkage as seen in Jupyter Notebook testing."""
-    X = prep_sample(save=True, use_all=True)
-    Z_single, Z_complete, Z_average, Z_ward = compute_default_linkages(X)
-    plot_dendrograms(Z_single, Z_complete, Z_average, Z_ward, "default_dendrograms")
-    results, summary = label_and_score(X, Z_ward, save=True, linkage="ward")
-    print(summary)
+def _profile_clusters(X: ResponseMatrix, results: dict, ks: tuple[int, ...], prefix: str) -> None:
+    """Saves the response distribution of each k and queues its heatmap."""
+    for k in ks:
+        labels_best = results[k]["labels"]
+
+        # one count tensor feeds the heatmap and the saved per-cluster response distributions
+        dist = ResponseDistribution.from_labels(X.values, labels_best, X.columns)
+        save_df(dist.to_frame(), f"{k}_response_distribution.csv")
 
-    plot_pca_clusters(X, Z_ward, f"ward_linkage_pca_k")
+        RENDERER.submit(plot_mode_cluster_heatmaps, dist, f"{prefix}_response_heatmap_k_{k}")
 
-    for k in (2, 3, 4):
-        k_best = k
-        labels_best = results[k_best]["labels"]
+def run(X: ResponseMatrix, X_pca: np.ndarray | None = None,
+        sil_mode: Literal["exact", "sampled"] | None = "exact") -> tuple[dict, pd.DataFrame]:
+    """
+    Runs the pipeline on loaded responses, optionally reusing a PCA projection, and returns the results
+    and score summary. `sil_mode=None` leaves the scores to the caller, see `label_and_score`.
+    """
+    float_gb = X.values.size * 8 / 2**30
+    scheduler = StageScheduler()
+    # each stage is skipped when its inputs, parameters and code match a cached run
+    if LINKAGE_MODE == "exact":
+        # each method is saved to default_linkages.joblib as soon as it finishes; its worker processes
+        # are outside the stage's thread limits, so they get the stage's cores explicitly
+        linkage_cores = min(4, scheduler.cores)
+        scheduler.add("linkage", lambda: CACHE.run("linkage", compute_default_linkages, X.to_float(), save=True,
+                                                   n_jobs=linkage_cores, params=dict(save=True)),
+                      cores=linkage_cores, mem_gb=default_linkages_memory_gb(len(X), linkage_cores))
+        # the dendrograms render in the background while the tree is cut and scored
+        scheduler.add("dendrograms", lambda Zs: RENDERER.submit(plot_dendrograms, *Zs, "default_dendrograms"),
+                      deps=("linkage",))
+        ward, tree = (lambda Zs: Zs[3]), "ward"
+    else:
+        # the approximate modes build only the Ward tree, never the quadratic distance matrix
+        scheduler.add("linkage", lambda: CACHE.run("linkage", compute_ward_linkage, X.to_float(), save=True,
+                                                   mode=LINKAGE_MODE),
+                      mem_gb=2 * float_gb)
+        ward, tree = (lambda Z: Z), f"{LINKAGE_MODE}_ward"
+    scheduler.add("fit", lambda Zs: CACHE.run("fit", label_and_score, X, ward(Zs), save=True, linkage=tree,
+                                                  sil_mode=sil_mode, fits=FIT_STORE),
+                  deps=("linkage",), cores=scheduler.cores, mem_gb=4 * float_gb)
+    scheduler.add("profiles", lambda fit: _profile_clusters(X, fit[0], (2, 3, 4), "ward_linkage"), deps=("fit",))
+    # the PCA plot reuses the cuts of the fit, so it follows it; it draws with pyplot, so it runs on this
+    # thread, with the profiles declared first to run beside it on a worker
+    scheduler.add("plot", lambda Zs, fit: CACHE.run("plot", plot_pca_clusters, X, ward(Zs), f"ward_linkage_pca_k",
+                                                    X_pca=X_pca, fits=FIT_STORE),
+                  deps=("linkage", "fit"), mem_gb=2 * float_gb, main_thread=True)
+    stage_results = scheduler.run()
+    results, summary = stage_results["fit"]
+    if sil_mode is not None:
+        print(summary)
+    print("Critical path:", " -> ".join(scheduler.critical_path()))
 
-        df_labeled = X.copy()
-        df_labeled["Cluster"] = labels_best
+    RENDERER.close()
+    # surface failed writes here rather than at exit, then keep the per-artifact write times
+    WRITER.flush()
+    save_df(scheduler.timeline(), "stage_timeline.csv")
+    save_df(WRITER.timing_frame(), "artifact_timings.csv")
+    return results, summary
 
-        cluster_modes = plot_mode_cluster_heatmaps(df_labeled, f"ward_linkage_response_heatmap_k_{k}")
+def main() -> None:
+    """Main script to run pipeline. Using Ward linkage as best linkage as seen in Jupyter Notebook testing."""
+    X = CACHE.run("preprocess", prep_sample, inputs=DATA_PATH, save=True, use_all=True)
+    run(X)
 
 if __name__ == "__main__":
     main()
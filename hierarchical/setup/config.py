@@ -8,3 +8,26 @@ DATA_PATH: Path = Path("../data/MACH_data/data.cleaned.csv")
 QUESTION_COLS: list[str] = [f"Q{i}A" for i in range(1, 21)]
 RANDOM_STATE: int = 42
 SAMPLE_N: int = 5000
+CACHE_DIR: Path = Path("../data/MACH_data/.cache")
+USE_DATA_CACHE: bool = True
+SILHOUETTE_WORKING_MEMORY_MB: int = 1024
+SILHOUETTE_SAMPLE_SIZE: int = 2000
+SILHOUETTE_CI_TOL: float = 0.02
+SILHOUETTE_CONFIDENCE: float = 0.95
+SILHOUETTE_N_BOOT: int = 1000
+DISTANCE_DTYPE: str = "float32"
+DISTANCE_WORKING_MEMORY_MB: int = 1024
+LINKAGE_MODE: str = "exact"
+MICRO_CLUSTERS: int = 2000
+BISECT_LEAF_SIZE: int = 64
+RENDER_WORKERS: int = 2
+DENSITY_BINS: int = 400
+DENSITY_MIN_POINTS: int = 20000
+ASYNC_ARTIFACTS: bool = True
+ARTIFACT_WRITER_THREADS: int = 2
+ARTIFACT_QUEUE_SIZE: int = 16
+USE_ARTIFACT_CACHE: bool = True
+ARTIFACT_CACHE_DIR: Path = Path("../.artifact_cache")
+ARTIFACT_CACHE_MAX_GB: float = 20.0
+SCHEDULER_CORES: int | None = None
+SCHEDULER_MEMORY_GB: float | None = None
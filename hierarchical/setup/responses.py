@@ -0,0 +1,138 @@
+"""responses.py
+
+Compact in-memory representation of the Likert response matrix used throughout the pipeline.
+"""
+import hashlib
+from typing import Any
+import numpy as np
+import pandas as pd
+from .config import QUESTION_COLS
+
+class ResponseMatrix:
+    """
+    Response matrix backed by a single C-contiguous uint8 array.
+
+    The uint8 values are the only copy of the responses that lives for the whole run. DataFrames
+    handed out by `to_frame` and `with_labels` are views over that array, and the float copy that
+    scikit-learn and SciPy need is built lazily, once, by `to_float`.
+
+    Attributes
+    ----------
+        values : NDArray
+            The (n_rows, n_questions) uint8 response array.
+        index : Index
+            The row labels of the original dataset.
+        columns : list[str]
+            The question column names.
+    """
+
+    def __init__(self, values: np.ndarray, index: Any = None, columns: list[str] | None = None) -> None:
+        values = np.asarray(values)
+        if values.ndim != 2:
+            raise ValueError(f"Expected a 2D response array, got shape {values.shape}.")
+        if values.dtype != np.uint8:
+            if values.size and (np.nanmin(values) < 0 or np.nanmax(values) > 255):
+                raise ValueError("Responses must be integers in [0, 255] to fit in uint8.")
+            values = values.astype(np.uint8)
+        self.values = np.ascontiguousarray(values)
+        self.index = pd.RangeIndex(len(values)) if index is None else pd.Index(index)
+        self.columns = list(QUESTION_COLS if columns is None else columns)
+        self._float: np.ndarray | None = None
+        self._patterns: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+        self._fingerprint: str | None = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "ResponseMatrix":
+        """Builds a response matrix from a DataFrame of complete integer responses."""
+        return cls(df.to_numpy(dtype=np.uint8), index=df.index, columns=df.columns.to_list())
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.values.shape
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __array__(self, dtype: Any = None, copy: bool | None = None) -> np.ndarray:
+        if dtype is not None and np.dtype(dtype) == np.float64 and not copy:
+            return self.to_float()
+        values = self.values if dtype is None else self.values.astype(dtype)
+        return values.copy() if copy else values
+
+    def take(self, rows: np.ndarray) -> "ResponseMatrix":
+        """Returns a new response matrix holding the rows at the given positions."""
+        return ResponseMatrix(self.values[rows], index=self.index[rows], columns=self.columns)
+
+    def sample(self, n: int, random_state: int | None = None) -> "ResponseMatrix":
+        """Samples `n` rows without replacement, drawing the same rows as `DataFrame.sample`."""
+        rows = pd.Series(np.arange(len(self))).sample(n=n, random_state=random_state).to_numpy()
+        return self.take(rows)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Returns a DataFrame view over the uint8 values without copying them."""
+        return pd.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+
+    def with_labels(self, labels: np.ndarray, name: str = "Cluster") -> pd.DataFrame:
+        """
+        Returns a DataFrame of the responses plus a label column, sharing the uint8 values.
+
+        Parameters
+        ----------
+            labels : NDArray
+                One label per row.
+            name : str
+                The name of the label column. Default is `"Cluster"`.
+
+        Returns
+        -------
+            DataFrame
+                The labeled responses.
+        """
+        df_labeled = self.to_frame()
+        df_labeled[name] = np.asarray(labels)
+        return df_labeled
+
+    def unique_patterns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Collapses the rows into their distinct answer patterns.
+
+        Returns
+        -------
+            patterns : NDArray
+                The (n_patterns, n_questions) uint8 distinct rows, in lexicographic order.
+            counts : NDArray
+                The number of rows sharing each pattern, usable as `sample_weight`.
+            inverse : NDArray
+                The pattern of each row, so `patterns[inverse]` rebuilds the responses and
+                `pattern_labels[inverse]` scatters per-pattern labels back to rows.
+        """
+        if self._patterns is None:
+            # view each row as one opaque byte string so uniqueness is a single 1D sort
+            rows = self.values.view(np.dtype((np.void, self.values.shape[1])))[:, 0]
+            _, first, inverse, counts = np.unique(rows, return_index=True, return_inverse=True, return_counts=True)
+            self._patterns = (self.values[first], counts, inverse.reshape(-1))
+        return self._patterns
+
+    def fingerprint(self) -> str:
+        """Returns a SHA-256 digest of the shape and uint8 values, computed once, identifying this data."""
+        if self._fingerprint is None:
+            digest = hashlib.sha256(repr(self.values.shape).encode())
+            digest.update(memoryview(self.values).cast("B"))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def to_float(self) -> np.ndarray:
+        """
+        Returns a read-only float64 copy of the responses for estimators that require floats.
+
+        The copy is built on first use and reused afterwards, so each fit and score of a run shares
+        the same float array instead of converting the responses again. Call `release_float` to free it.
+        """
+        if self._float is None:
+            self._float = self.values.astype(np.float64)
+            self._float.flags.writeable = False
+        return self._float
+
+    def release_float(self) -> None:
+        """Drops the cached float copy built by `to_float`."""
+        self._float = None
@@ -1,47 +1,207 @@
+from collections.abc import Callable, Iterable
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from pipelineio.io_utils import save_df
+from pipelineio.label_store import save_labels
+from setup.config import RANDOM_STATE, STREAM_BATCH_SIZE
+from setup.preprocess import iter_response_chunks
+from setup.responses import ResponseMatrix
+from .silhouette import score_labelings
+from .sweep import run_sweep
+from .incremental import inertia_curve, warm_start_sweep
+from .store import FIT_STORE, FitResult, FitStore
 from typing import Any, Literal
 
-def label_and_score(X: pd.DataFrame, 
+def _fit_kmeans(X: np.ndarray, k: int, sample_weight: np.ndarray | None) -> KMeans:
+    """Fits one k-means model and returns the fitted estimator."""
+    kmeans = KMeans(n_clusters=k, init='k-means++', random_state=42)
+    return kmeans.fit(X, sample_weight=sample_weight)
+
+def label_and_score(X: ResponseMatrix, 
                     ks: tuple[int, ...] = (2, 3, 4), 
-                    save: bool = True) -> tuple[dict[int, dict[Any, float]], pd.DataFrame]:
+                    save: bool = True, 
+                    dedup: bool = False,
+                    sil_mode: Literal["exact", "sampled"] | None = "exact",
+                    n_jobs: int = 1,
+                    store: FitStore = FIT_STORE,
+                    warm_start: bool = False) -> tuple[dict[int, dict[Any, float]], pd.DataFrame]:
     """
     Labels each data point and calculates a Silhouette score per k-cluster.
 
     Parameters
     ----------
-        X : DataFrame
-            The DataFrame containing question responses.
+        X : ResponseMatrix
+            The uint8 matrix containing question responses.
         ks : tuple[int, ...]
             One or values to use as the number of clusters.
         save : bool
-            Set to `True` to save the DataFrame to a CSV file. Default is `False`.
+            Set to `True` to save the labels to the label store and the summary to a CSV file. Default is `True`.
+        dedup : bool
+            Set to `True` to fit on the distinct answer patterns weighted by their counts and scatter
+            the labels back to rows. Fit time and memory then scale with the number of patterns rather
+            than respondents. Default is `False`.
+        sil_mode : Literal["exact", "sampled"] | None
+            `"exact"` scores every row. `"sampled"` estimates the scores from stratified per-cluster
+            subsamples with bootstrap confidence intervals. `None` leaves the scores empty for the
+            caller to compute and write, as `run_all` does across algorithms. Default is `"exact"`.
+        n_jobs : int
+            The number of processes fitting the ks in parallel over a shared-memory copy of the data.
+            `-1` uses every CPU. Labels match the serial fits. Default is `1`.
+        store : FitStore
+            Where each fitted model is kept for plotting and analysis. Default is `FIT_STORE`.
+        warm_start : bool
+            Set to `True` to fit every k between the smallest and largest of `ks` in one incremental
+            sweep, seeding each k + 1 by bisecting the worst cluster of the k solution or keeping a fresh
+            k-means++ fit where it reaches a lower inertia, and save the inertia curve to
+            `inertia_summary.csv`. `n_jobs` is ignored. Default is `False`.
 
     Returns
     -------
         results : dict[int, dict[Any, float]
-            A dictionary mapping cluster sizes to a dictionary of labels and Silhouette scores.
+            A dictionary mapping cluster sizes to a dictionary of labels, Silhouette scores and inertia.
         summary : DataFrame
-            A summary DataFrame of the cluster size and Silhouette scores.
+            A summary DataFrame of the cluster size, Silhouette scores and the mode that produced them.
     """
     # output dict and/or df
     results = {}
-    for k in ks:
-        kmeans = KMeans(n_clusters=k, init='k-means++', random_state=42)
-        labels = kmeans.fit_predict(X)
-        score = silhouette_score(X, labels)
-        results[k] = dict(labels=labels, sil=score)
+    if dedup:
+        patterns, counts, inverse = X.unique_patterns()
+        X_train, sample_weight = patterns.astype(np.float64), counts
+    else:
+        X_train, sample_weight, inverse = X.to_float(), None, None
 
-        df_labels = X.copy()
-        df_labels["Cluster"] = labels
+    if warm_start:
+        models = warm_start_sweep(X_train, ks, sample_weight=sample_weight)
         if save:
-            save_df(df_labels, f"{k}_clusters_labels.csv")
+            save_df(inertia_curve(models), "inertia_summary.csv")
+    else:
+        models = run_sweep(_fit_kmeans, X_train, ks, sample_weight=sample_weight, n_jobs=n_jobs)
+    train_labels = {k: models[k].labels_ for k in ks}
+    for k in ks:
+        labels = train_labels[k][inverse] if dedup else train_labels[k]
+        results[k] = dict(labels=labels, inertia=models[k].inertia_)
+        store.put("kmeans", X, FitResult(labels, models[k].cluster_centers_, models[k]),
+                  k=k, dedup=dedup, warm_start=warm_start)
+
+
+    if save:
+        save_labels(X, {f"kmeans_k{k}": results[k]["labels"] for k in ks})
+
+    # one streamed distance pass scores every k; weighted patterns give the same scores as all rows
+    scores = score_labelings(X_train, train_labels, sample_weight=sample_weight, mode=sil_mode)
+    for k in ks:
+        results[k].update(scores[k])
 
     # save summary df
-    summary_rows = [dict(k=k, sil=results[k]["sil"]) for k in ks]
+    summary_rows = [dict(k=k, **scores[k], inertia=results[k]["inertia"]) for k in ks]
+    summary = pd.DataFrame(summary_rows)
+    # a deferred summary has no scores yet, so the caller writes it
+    if save and sil_mode is not None:
+        save_df(summary, f"sil_score_summary.csv")
+
+    return results, summary
+
+def _centroid_silhouette(X: np.ndarray, centers: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the nearest center, squared distance to it and simplified Silhouette of each row."""
+    sq_dist = (X ** 2).sum(axis=1)[:, None] - 2 * X @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+    dist = np.sqrt(np.maximum(sq_dist, 0.0))
+    order = np.argsort(dist, axis=1)[:, :2]
+    a = np.take_along_axis(dist, order[:, :1], axis=1)[:, 0]
+    b = np.take_along_axis(dist, order[:, 1:], axis=1)[:, 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sil = np.nan_to_num((b - a) / np.maximum(a, b))
+    return order[:, 0], a ** 2, sil
+
+def stream_label_and_score(chunks: Callable[[], Iterable[ResponseMatrix]] = iter_response_chunks,
+                           ks: tuple[int, ...] = (2, 3, 4),
+                           save: bool = True,
+                           n_passes: int = 1,
+                           batch_size: int = STREAM_BATCH_SIZE) -> tuple[dict[int, dict[str, Any]], pd.DataFrame]:
+    """
+    Clusters data larger than memory with mini-batch k-means, reading the responses chunk by chunk.
+
+    The first stage streams the chunks `n_passes` times and updates one `MiniBatchKMeans` per k on
+    every mini-batch, so all ks train in the same read. The second stage streams the chunks once more
+    to assign labels, appending them to the label CSVs, and to accumulate per-cluster sizes, means,
+    standard deviations, inertia and the simplified (centroid) Silhouette. Memory stays constant in
+    the number of rows; the exact Silhouette needs all pairwise distances and is not computed.
+
+    Parameters
+    ----------
+        chunks : Callable[[], Iterable[ResponseMatrix]]
+            Returns a fresh iterable of response chunks per pass. Default is `iter_response_chunks`.
+        ks : tuple[int, ...]
+            One or values to use as the number of clusters.
+        save : bool
+            Set to `True` to save the labels, cluster statistics and summary to CSV files. Default is `True`.
+        n_passes : int
+            The number of training passes over the data. Default is `1`.
+        batch_size : int
+            The number of rows per mini-batch update. Default is `STREAM_BATCH_SIZE`.
+
+    Returns
+    -------
+        results : dict[int, dict[str, Any]]
+            A dictionary mapping cluster sizes to the fitted model, centroids, cluster statistics,
+            inertia and simplified Silhouette score.
+        summary : DataFrame
+            A summary DataFrame of the cluster size, simplified Silhouette scores and inertia.
+
+    Usage
+    -----
+    >>> results, summary = stream_label_and_score(ks=(2, 3, 4))
+    """
+    models = {k: MiniBatchKMeans(n_clusters=k, batch_size=batch_size, random_state=RANDOM_STATE) for k in ks}
+    for _ in range(n_passes):
+        for chunk in chunks():
+            X_chunk = chunk.to_float()
+            for start in range(0, len(X_chunk), batch_size):
+                batch = X_chunk[start:start + batch_size]
+                for k, model in models.items():
+                    # the first update must see at least k rows to seed the centers
+                    if len(batch) >= k or hasattr(model, "cluster_centers_"):
+                        model.partial_fit(batch)
+
+    columns, stats = None, {}
+    for chunk in chunks():
+        X_chunk = chunk.to_float()
+        first = columns is None
+        if first:
+            columns = chunk.columns
+            stats = {k: dict(n=np.zeros(k), sum=np.zeros((k, len(columns))), sumsq=np.zeros((k, len(columns))),
+                             inertia=0.0, sil=0.0) for k in ks}
+        for k, model in models.items():
+            labels, sq_dist, sil = _centroid_silhouette(X_chunk, model.cluster_centers_)
+            acc = stats[k]
+            acc["n"] += np.bincount(labels, minlength=k)
+            np.add.at(acc["sum"], labels, X_chunk)
+            np.add.at(acc["sumsq"], labels, X_chunk ** 2)
+            acc["inertia"] += sq_dist.sum()
+            acc["sil"] += sil.sum()
+
+            if save:
+                save_df(chunk.with_labels(labels), f"{k}_clusters_labels.csv", append=not first)
+
+    results = {}
+    for k, model in models.items():
+        acc = stats[k]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = acc["sum"] / acc["n"][:, None]
+            stds = np.sqrt(np.maximum(acc["sumsq"] / acc["n"][:, None] - means ** 2, 0.0))
+        n = int(acc["n"].sum())
+        results[k] = dict(model=model, centroids=model.cluster_centers_, sizes=acc["n"].astype(np.int64),
+                          means=means, stds=stds, inertia=acc["inertia"], sil=acc["sil"] / n)
+
+        if save:
+            cluster_stats = pd.concat([pd.DataFrame(dict(size=results[k]["sizes"])),
+                                       pd.DataFrame(means, columns=columns).add_prefix("mean_"),
+                                       pd.DataFrame(stds, columns=columns).add_prefix("std_")], axis=1)
+            cluster_stats.index.name = "Cluster"
+            save_df(cluster_stats, f"{k}_cluster_stats.csv")
+
+    summary_rows = [dict(k=k, sil=results[k]["sil"], sil_mode="simplified", sil_ci_low=np.nan, sil_ci_high=np.nan,
+                         sil_n=int(results[k]["sizes"].sum()), inertia=results[k]["inertia"]) for k in ks]
     summary = pd.DataFrame(summary_rows)
     if save:
         save_df(summary, f"sil_score_summary.csv")
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from setup.config import RANDOM_STATE
+
+def _split_worst_cluster(X: np.ndarray,
+                         model: KMeans,
+                         sample_weight: np.ndarray,
+                         random_state: int | None) -> np.ndarray:
+    """Returns k + 1 initial centers: the converged ones with the highest-SSE cluster bisected by 2-means."""
+    centers, labels = model.cluster_centers_, model.labels_
+    sq_dist = ((X - centers[labels]) ** 2).sum(axis=1)
+    sse = np.bincount(labels, weights=sample_weight * sq_dist, minlength=len(centers))
+    # a cluster with a single distinct point cannot be bisected
+    n_distinct = np.bincount(labels, weights=(sq_dist > 0), minlength=len(centers))
+    sse[n_distinct == 0] = -np.inf
+    worst = int(np.argmax(sse))
+
+    members = labels == worst
+    halves = KMeans(n_clusters=2, n_init=1, random_state=random_state).fit(
+        X[members], sample_weight=sample_weight[members]).cluster_centers_
+    return np.vstack([np.delete(centers, worst, axis=0), halves])
+
+def warm_start_sweep(X: np.ndarray,
+                     ks: tuple[int, ...] | range = range(2, 41),
+                     sample_weight: np.ndarray | None = None,
+                     random_state: int | None = RANDOM_STATE) -> dict[int, KMeans]:
+    """
+    Fits k-means for a range of ks, seeding each k + 1 from the converged k solution.
+
+    The smallest k is fitted with k-means++. Every following k starts from the previous centers with
+    the cluster of highest within-cluster sum of squares bisected by a 2-means fit on its members, so
+    Lloyd's iterations only have to refine an already good solution. Over a long k range this needs far
+    fewer iterations than independent fits, which makes elbow scans affordable on the full dataset.
+
+    A single bisect-and-refine run can settle in a worse local minimum than a fresh start, so each
+    requested k is also fitted once with k-means++ and the fit of lower inertia is kept and seeds the
+    next k.
+
+    Parameters
+    ----------
+        X : NDArray
+            The (n_samples, n_features) training data.
+        ks : tuple[int, ...] | range
+            The ks to return. Every k between the smallest and largest is fitted. Default is `range(2, 41)`.
+        sample_weight : NDArray | None
+            Per-sample weights, e.g. pattern counts. Default is `None`.
+        random_state : int | None
+            Seed for the first k-means++ fit and the bisections. Default is `RANDOM_STATE`.
+
+    Returns
+    -------
+        dict[int, KMeans]
+            The fitted estimator of each requested k, with `inertia_` and `n_iter_` set. Its `init` is
+            `"k-means++"` when the fresh fit won, otherwise the warm-start centers.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    weight = np.ones(len(X)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    wanted = sorted(set(ks))
+
+    models = {}
+    model = KMeans(n_clusters=wanted[0], init='k-means++', random_state=random_state).fit(X, sample_weight=weight)
+    for k in range(wanted[0], wanted[-1] + 1):
+        if k > wanted[0]:
+            init = _split_worst_cluster(X, model, weight, random_state)
+            model = KMeans(n_clusters=k, init=init, n_init=1, random_state=random_state).fit(X, sample_weight=weight)
+            if k in wanted:
+                fresh = KMeans(n_clusters=k, init='k-means++', random_state=random_state).fit(X, sample_weight=weight)
+                if fresh.inertia_ < model.inertia_:
+                    model = fresh
+        if k in wanted:
+            models[k] = model
+    return models
+
+def inertia_curve(models: dict[int, KMeans]) -> pd.DataFrame:
+    """Returns each fitted k's inertia, Lloyd iterations and winning initialization as an elbow-plot DataFrame."""
+    return pd.DataFrame([dict(k=k, inertia=m.inertia_, n_iter=m.n_iter_,
+                              init=m.init if isinstance(m.init, str) else "warm-start")
+                         for k, m in sorted(models.items())])
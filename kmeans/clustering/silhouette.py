@@ -0,0 +1,280 @@
+from collections.abc import Hashable
+from typing import Any, Literal
+import numpy as np
+from sklearn.metrics.pairwise import euclidean_distances
+from setup.config import (RANDOM_STATE, SILHOUETTE_WORKING_MEMORY_MB, SILHOUETTE_SAMPLE_SIZE,
+                          SILHOUETTE_CI_TOL, SILHOUETTE_CONFIDENCE, SILHOUETTE_N_BOOT)
+
+def _encode_labelings(labelings: dict[Hashable, np.ndarray],
+                      n_samples: int,
+                      total_weight: float) -> tuple[list[np.ndarray], np.ndarray]:
+    """Returns the 0..k-1 codes of each labeling and the column offset of each labeling's clusters."""
+    codes, n_clusters = [], []
+    for key, labels in labelings.items():
+        labels = np.asarray(labels)
+        if len(labels) != n_samples:
+            raise ValueError(f"Labeling {key!r} has {len(labels)} labels for {n_samples} samples.")
+        _, code = np.unique(labels, return_inverse=True)
+        k = int(code.max()) + 1
+        if not 2 <= k <= total_weight - 1:
+            raise ValueError(f"Number of labels is {k}. Valid values are 2 to n_samples - 1 (inclusive)")
+        codes.append(code.reshape(-1))
+        n_clusters.append(k)
+    return codes, np.concatenate([[0], np.cumsum(n_clusters)])
+
+def silhouette_samples_multi(X: np.ndarray,
+                             labelings: dict[Hashable, np.ndarray],
+                             rows: np.ndarray | None = None,
+                             sample_weight: np.ndarray | None = None,
+                             working_memory: int = SILHOUETTE_WORKING_MEMORY_MB) -> dict[Hashable, np.ndarray]:
+    """
+    Computes exact per-sample Silhouette values for many labelings of the same data in one distance pass.
+
+    Pairwise Euclidean distances are streamed in blocks of rows against all of X and multiplied by a
+    stacked one-hot membership matrix, which yields the distance sums from every row to every cluster
+    of every labeling at once. Each distance is therefore computed once no matter how many labelings
+    (ks and algorithms) are scored, and at most `working_memory` MiB of distances is held at a time.
+
+    Parameters
+    ----------
+        X : NDArray
+            The (n_samples, n_features) data the labelings were fitted on.
+        labelings : dict[Hashable, NDArray]
+            One array of labels per labeling, e.g. keyed by k or by (algorithm, k).
+        rows : NDArray | None
+            Positions of the samples to compute values for. Default is `None`, which means every sample.
+        sample_weight : NDArray | None
+            Multiplicity of each sample. A sample with weight w counts as w identical rows, so scoring
+            unique patterns weighted by their counts gives the Silhouette of the full data. Default is `None`.
+        working_memory : int
+            The maximum size in MiB of a block of pairwise distances. Default is `SILHOUETTE_WORKING_MEMORY_MB`.
+
+    Returns
+    -------
+        dict[Hashable, NDArray]
+            The Silhouette value of each requested row, per labeling.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n_samples = len(X)
+    weight = np.ones(n_samples) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    rows = np.arange(n_samples) if rows is None else np.asarray(rows)
+
+    codes, offsets = _encode_labelings(labelings, n_samples, weight.sum())
+    membership = np.zeros((n_samples, offsets[-1]))
+    for code, offset in zip(codes, offsets):
+        membership[np.arange(n_samples), offset + code] = weight
+    cluster_weight = membership.sum(axis=0)
+
+    block_rows = max(1, int(working_memory * 2**20 // (8 * (n_samples + offsets[-1]))))
+    values = {key: np.empty(len(rows)) for key in labelings}
+    for start in range(0, len(rows), block_rows):
+        block = rows[start:start + block_rows]
+        distances = euclidean_distances(X[block], X)
+        distances[np.arange(len(block)), block] = 0.0
+        cluster_sums = distances @ membership
+        for key, code, offset, end in zip(labelings, codes, offsets, offsets[1:]):
+            sums = cluster_sums[:, offset:end]
+            sizes = cluster_weight[offset:end]
+            own = code[block]
+            own_size = sizes[own]
+
+            # a: mean distance to the rest of the own cluster, b: lowest mean distance to another cluster
+            with np.errstate(divide="ignore", invalid="ignore"):
+                a = sums[np.arange(len(block)), own] / (own_size - 1)
+                means = sums / sizes
+                means[np.arange(len(block)), own] = np.inf
+                b = means.min(axis=1)
+                s = (b - a) / np.maximum(a, b)
+            values[key][start:start + len(block)] = np.where(own_size > 1, np.nan_to_num(s), 0.0)
+    return values
+
+def silhouette_scores(X: np.ndarray,
+                      labelings: dict[Hashable, np.ndarray],
+                      sample_weight: np.ndarray | None = None,
+                      working_memory: int = SILHOUETTE_WORKING_MEMORY_MB) -> dict[Hashable, float]:
+    """
+    Computes the exact mean Silhouette score of many labelings with a single streamed distance pass.
+
+    Parameters
+    ----------
+        X : NDArray
+            The (n_samples, n_features) data the labelings were fitted on.
+        labelings : dict[Hashable, NDArray]
+            One array of labels per labeling, e.g. keyed by k or by (algorithm, k).
+        sample_weight : NDArray | None
+            Multiplicity of each sample, see `silhouette_samples_multi`. Default is `None`.
+        working_memory : int
+            The maximum size in MiB of a block of pairwise distances. Default is `SILHOUETTE_WORKING_MEMORY_MB`.
+
+    Returns
+    -------
+        dict[Hashable, float]
+            The Silhouette score of each labeling, equal to `sklearn.metrics.silhouette_score`.
+
+    Usage
+    -----
+    >>> silhouette_scores(X_fit, {k: results[k]["labels"] for k in (2, 3, 4)})
+    {2: 0.21, 3: 0.17, 4: 0.15}
+    """
+    values = silhouette_samples_multi(X, labelings, sample_weight=sample_weight, working_memory=working_memory)
+    weight = None if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    return {key: float(np.average(s, weights=weight)) for key, s in values.items()}
+
+def _stratified_draw(code: np.ndarray,
+                     weight: np.ndarray,
+                     n_draw: int,
+                     rng: np.random.Generator) -> list[np.ndarray]:
+    """Draws about `n_draw` rows with replacement, allocated to clusters in proportion to their weight."""
+    cluster_weight = np.bincount(code, weights=weight)
+    alloc = np.maximum(2, np.round(n_draw * cluster_weight / cluster_weight.sum())).astype(int)
+    draws = []
+    for c, size in enumerate(alloc):
+        members = np.flatnonzero(code == c)
+        draws.append(rng.choice(members, size=size, p=weight[members] / cluster_weight[c]))
+    return draws
+
+def _stratified_estimate(strata: list[np.ndarray],
+                         fractions: np.ndarray,
+                         n_boot: int,
+                         confidence: float,
+                         rng: np.random.Generator) -> tuple[float, float, float]:
+    """Returns the stratified mean of the sampled values and its percentile bootstrap interval."""
+    estimate = sum(f * s.mean() for f, s in zip(fractions, strata))
+    boot = np.zeros(n_boot)
+    for f, s in zip(fractions, strata):
+        boot += f * s[rng.integers(0, len(s), size=(n_boot, len(s)))].mean(axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(boot, [alpha, 1 - alpha])
+    return float(estimate), float(low), float(high)
+
+def sampled_silhouette_scores(X: np.ndarray,
+                              labelings: dict[Hashable, np.ndarray],
+                              sample_weight: np.ndarray | None = None,
+                              sample_size: int = SILHOUETTE_SAMPLE_SIZE,
+                              tol: float | None = SILHOUETTE_CI_TOL,
+                              confidence: float = SILHOUETTE_CONFIDENCE,
+                              n_boot: int = SILHOUETTE_N_BOOT,
+                              random_state: int | None = RANDOM_STATE,
+                              working_memory: int = SILHOUETTE_WORKING_MEMORY_MB) -> dict[Hashable, dict[str, float]]:
+    """
+    Estimates the Silhouette score of many labelings from stratified per-cluster subsamples.
+
+    Each labeling draws rows from every one of its clusters in proportion to the cluster's weight,
+    and only the drawn rows get their exact Silhouette value, still against all of X. The score is
+    the cluster-weighted mean of the sampled values and the interval comes from bootstrapping each
+    cluster's values. With a `tol`, labelings whose interval is wider than `tol` double their sample
+    and are rescored until it is narrow enough or the sample reaches the number of rows. When
+    `sample_size` already covers every row, the exact scores are returned with a zero-width interval.
+
+    Parameters
+    ----------
+        X : NDArray
+            The (n_samples, n_features) data the labelings were fitted on.
+        labelings : dict[Hashable, NDArray]
+            One array of labels per labeling, e.g. keyed by k or by (algorithm, k).
+        sample_weight : NDArray | None
+            Multiplicity of each sample, see `silhouette_samples_multi`. Default is `None`.
+        sample_size : int
+            The number of rows drawn per labeling in the first round. Default is `SILHOUETTE_SAMPLE_SIZE`.
+        tol : float | None
+            The widest acceptable confidence interval. `None` stops after the first round. Default is `SILHOUETTE_CI_TOL`.
+        confidence : float
+            The confidence level of the interval. Default is `SILHOUETTE_CONFIDENCE`.
+        n_boot : int
+            The number of bootstrap resamples. Default is `SILHOUETTE_N_BOOT`.
+        random_state : int | None
+            The seed of the subsampling and bootstrap. Default is `RANDOM_STATE`.
+        working_memory : int
+            The maximum size in MiB of a block of pairwise distances. Default is `SILHOUETTE_WORKING_MEMORY_MB`.
+
+    Returns
+    -------
+        dict[Hashable, dict[str, float]]
+            Per labeling, the estimate `sil`, the interval bounds `ci_low` and `ci_high`, and the
+            number of sampled rows `n`.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n_samples = len(X)
+    if sample_size >= n_samples:
+        # drawing as many rows with replacement costs as much as scoring them all and is noisier
+        scores = silhouette_scores(X, labelings, sample_weight=sample_weight, working_memory=working_memory)
+        n = int(n_samples if sample_weight is None else np.sum(sample_weight))
+        return {key: dict(sil=sil, ci_low=sil, ci_high=sil, n=n) for key, sil in scores.items()}
+    weight = np.ones(n_samples) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    codes, _ = _encode_labelings(labelings, n_samples, weight.sum())
+    codes = dict(zip(labelings, codes))
+    rng = np.random.default_rng(random_state)
+
+    # values already computed per labeling, so later rounds only score newly drawn rows
+    known = {key: np.full(n_samples, np.nan) for key in labelings}
+    strata = {key: [np.empty(0, dtype=np.intp)] * (int(code.max()) + 1) for key, code in codes.items()}
+    results: dict[Hashable, dict[str, float]] = {}
+    active, n_draw = list(labelings), sample_size
+    while active:
+        for key in active:
+            draws = _stratified_draw(codes[key], weight, n_draw, rng)
+            strata[key] = [np.concatenate([old, new]) for old, new in zip(strata[key], draws)]
+
+        needed = np.unique(np.concatenate([np.concatenate(strata[key]) for key in active]))
+        needed = needed[np.isnan(np.stack([known[key][needed] for key in active])).any(axis=0)]
+        if len(needed):
+            values = silhouette_samples_multi(X, {key: labelings[key] for key in active}, rows=needed,
+                                              sample_weight=sample_weight, working_memory=working_memory)
+            for key in active:
+                known[key][needed] = values[key]
+
+        still_active = []
+        for key in active:
+            fractions = np.bincount(codes[key], weights=weight) / weight.sum()
+            sampled = [known[key][rows] for rows in strata[key]]
+            sil, low, high = _stratified_estimate(sampled, fractions, n_boot, confidence, rng)
+            n_sampled = sum(len(rows) for rows in strata[key])
+            results[key] = dict(sil=sil, ci_low=low, ci_high=high, n=n_sampled)
+            if tol is not None and high - low > tol and 2 * n_sampled <= n_samples:
+                still_active.append(key)
+        # doubling the sample roughly shrinks the interval by a factor of sqrt(2) per round
+        active, n_draw = still_active, n_draw * 2
+    return results
+
+def score_labelings(X: np.ndarray,
+                    labelings: dict[Hashable, np.ndarray],
+                    sample_weight: np.ndarray | None = None,
+                    mode: Literal["exact", "sampled"] | None = "exact",
+                    **kwargs: Any) -> dict[Hashable, dict[str, Any]]:
+    """
+    Scores many labelings with either the exact or the sampled Silhouette, in the summary's columns.
+
+    Parameters
+    ----------
+        X : NDArray
+            The (n_samples, n_features) data the labelings were fitted on.
+        labelings : dict[Hashable, NDArray]
+            One array of labels per labeling, e.g. keyed by k or by (algorithm, k).
+        sample_weight : NDArray | None
+            Multiplicity of each sample, see `silhouette_samples_multi`. Default is `None`.
+        mode : Literal["exact", "sampled"] | None
+            `"exact"` scores every row, `"sampled"` uses `sampled_silhouette_scores`. `None` computes
+            nothing and leaves the columns empty, for callers that score the labelings of several
+            algorithms together. Default is `"exact"`.
+        **kwargs : Any
+            Passed on to `silhouette_scores` or `sampled_silhouette_scores`.
+
+    Returns
+    -------
+        dict[Hashable, dict[str, Any]]
+            Per labeling, `sil`, `sil_mode`, `sil_ci_low`, `sil_ci_high` and `sil_n`. Exact scores
+            have no interval and count every row.
+    """
+    if mode is None:
+        return {key: dict(sil=np.nan, sil_mode=None, sil_ci_low=np.nan, sil_ci_high=np.nan, sil_n=0)
+                for key in labelings}
+    if mode == "exact":
+        scores = silhouette_scores(X, labelings, sample_weight=sample_weight, **kwargs)
+        n = int(len(X) if sample_weight is None else np.sum(sample_weight))
+        return {key: dict(sil=sil, sil_mode=mode, sil_ci_low=np.nan, sil_ci_high=np.nan, sil_n=n)
+                for key, sil in scores.items()}
+    if mode == "sampled":
+        scores = sampled_silhouette_scores(X, labelings, sample_weight=sample_weight, **kwargs)
+        return {key: dict(sil=s["sil"], sil_mode=mode, sil_ci_low=s["ci_low"], sil_ci_high=s["ci_high"], sil_n=s["n"])
+                for key, s in scores.items()}
+    raise ValueError(f"Unknown silhouette mode {mode!r}, expected 'exact', 'sampled' or None.")
@@ -0,0 +1,114 @@
+import contextlib
+import threading
+from collections.abc import Callable, Iterator
+from typing import Any
+import numpy as np
+from setup.responses import ResponseMatrix
+
+class FitResult:
+    """
+    The outcome of one fitted clustering model.
+
+    Attributes
+    ----------
+        labels : NDArray
+            One label per row of the data the model was fitted for.
+        centroids : NDArray | None
+            The (k, n_features) cluster centers, when the model has them.
+        estimator : Any
+            The fitted estimator, or `None` for models without one.
+    """
+
+    def __init__(self, labels: np.ndarray, centroids: np.ndarray | None = None, estimator: Any = None) -> None:
+        self.labels = np.asarray(labels)
+        self.centroids = centroids
+        self.estimator = estimator
+
+class FitStore:
+    """
+    In-memory store of fitted models keyed by (algorithm, params, data fingerprint).
+
+    `label_and_score` puts every model it fits here, and plotting and analysis read them back
+    instead of refitting, so each model is fitted once per run. A cached stage `record`s what it
+    puts, so a later cache hit can `restore` the same models without running the stage.
+    """
+
+    def __init__(self) -> None:
+        self._results: dict[tuple[str, tuple[tuple[str, Any], ...], str], FitResult] = {}
+        self._recording = threading.local()
+
+    @staticmethod
+    def _key(algorithm: str, X: ResponseMatrix, params: dict[str, Any]) -> tuple[str, tuple[tuple[str, Any], ...], str]:
+        return algorithm, tuple(sorted(params.items())), X.fingerprint()
+
+    def put(self, algorithm: str, X: ResponseMatrix, result: FitResult, **params: Any) -> FitResult:
+        """Stores a fit result for an algorithm, its parameters and the data it was fitted for."""
+        key = self._key(algorithm, X, params)
+        self._results[key] = result
+        recorded = getattr(self._recording, "entries", None)
+        if recorded is not None:
+            recorded[key] = result
+        return result
+
+    @contextlib.contextmanager
+    def record(self) -> Iterator[dict]:
+        """Yields a dict that gathers every result this thread puts inside the block, by key."""
+        outer = getattr(self._recording, "entries", None)
+        self._recording.entries = entries = {}
+        try:
+            yield entries
+        finally:
+            self._recording.entries = outer
+            if outer is not None:
+                outer.update(entries)
+
+    def restore(self, entries: dict) -> None:
+        """Puts back results gathered by `record`, e.g. when a cached stage is loaded instead of run."""
+        self._results.update(entries)
+
+    def get(self, algorithm: str, X: ResponseMatrix, **params: Any) -> FitResult | None:
+        """Returns the fit result with exactly these parameters, or `None` if it was never stored."""
+        return self._results.get(self._key(algorithm, X, params))
+
+    def find(self, algorithm: str, X: ResponseMatrix, **params: Any) -> FitResult | None:
+        """Returns the most recently stored fit result whose parameters include `params`, or `None`."""
+        fingerprint, wanted = X.fingerprint(), set(params.items())
+        for (name, stored, data), result in reversed(self._results.items()):
+            if name == algorithm and data == fingerprint and wanted <= set(stored):
+                return result
+        return None
+
+    def get_or_fit(self, algorithm: str, X: ResponseMatrix, fit: Callable[[], FitResult], **params: Any) -> FitResult:
+        """
+        Returns a stored fit result matching `params`, fitting and storing it first if there is none.
+
+        Parameters
+        ----------
+            algorithm : str
+                The name of the clustering algorithm, e.g. `"kmeans"`.
+            X : ResponseMatrix
+                The data the model is fitted for.
+            fit : Callable[[], FitResult]
+                Fits the model when no stored result matches.
+            **params : Any
+                The parameters identifying the model, e.g. `k=3`.
+
+        Returns
+        -------
+            FitResult
+                The stored or newly fitted result.
+
+        Usage
+        -----
+        >>> FIT_STORE.get_or_fit("kmeans", X, lambda: FitResult(KMeans(3).fit_predict(X_fit)), k=3)
+        <FitResult>
+        """
+        result = self.find(algorithm, X, **params)
+        return result if result is not None else self.put(algorithm, X, fit(), **params)
+
+    def clear(self) -> None:
+        """Drops every stored fit result."""
+        self._results.clear()
+
+# shared by label_and_score and the plotting functions within one run
+FIT_STORE = FitStore()
@@ -0,0 +1,80 @@
+import os
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any
+import numpy as np
+from threadpoolctl import threadpool_limits
+
+# per-worker view of the shared input, filled once by _attach_shared
+_shared: dict[str, Any] = {}
+
+def _attach_shared(name: str,
+                   shape: tuple[int, ...],
+                   dtype: str,
+                   sample_weight: np.ndarray | None,
+                   blas_threads: int) -> None:
+    """Worker initializer that maps the parent's shared-memory block and caps BLAS/OpenMP threads."""
+    shm = shared_memory.SharedMemory(name=name)
+    X = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    X.flags.writeable = False
+    _shared.update(shm=shm, X=X, sample_weight=sample_weight,
+                   limiter=threadpool_limits(limits=blas_threads))
+
+def _fit_shared(fit_fn: Callable[[np.ndarray, int, np.ndarray | None], Any], k: int) -> Any:
+    """Runs one fit in a worker against the shared input."""
+    return fit_fn(_shared["X"], k, _shared["sample_weight"])
+
+def run_sweep(fit_fn: Callable[[np.ndarray, int, np.ndarray | None], Any],
+              X: np.ndarray,
+              ks: tuple[int, ...],
+              sample_weight: np.ndarray | None = None,
+              n_jobs: int = 1) -> dict[int, Any]:
+    """
+    Fits one model per k, serially or in a process pool over a shared-memory copy of X.
+
+    With `n_jobs > 1`, X is copied once into a shared-memory block that every worker maps without
+    pickling it, and each worker's BLAS/OpenMP pools are limited to its share of the CPUs so the
+    fits do not oversubscribe the machine. Every fit seeds its own estimator, so the labels are the
+    same as on the serial path.
+
+    Parameters
+    ----------
+        fit_fn : Callable[[NDArray, int, NDArray | None], Any]
+            A module-level function mapping (X, k, sample_weight) to labels or a fitted estimator.
+            It and its return value must be picklable.
+        X : NDArray
+            The (n_samples, n_features) training data.
+        ks : tuple[int, ...]
+            One or values to use as the number of clusters.
+        sample_weight : NDArray | None
+            Per-sample weights passed on to `fit_fn`. Default is `None`.
+        n_jobs : int
+            The number of worker processes. `1` fits in this process and `-1` uses every CPU. Default is `1`.
+
+    Returns
+    -------
+        dict[int, Any]
+            The output of `fit_fn` for each k, in the order of `ks`.
+
+    Usage
+    -----
+    >>> run_sweep(_fit_kmeans, X_train, (2, 3, 4), n_jobs=3)
+    {2: KMeans(n_clusters=2, random_state=42), 3: KMeans(n_clusters=3, random_state=42), ...}
+    """
+    n_cpus = os.cpu_count() or 1
+    n_workers = min(len(ks), n_cpus if n_jobs == -1 else n_jobs)
+    if n_workers <= 1:
+        return {k: fit_fn(X, k, sample_weight) for k in ks}
+
+    X = np.ascontiguousarray(X)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, X.nbytes))
+    try:
+        np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[...] = X
+        initargs = (shm.name, X.shape, X.dtype.str, sample_weight, max(1, n_cpus // n_workers))
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_attach_shared, initargs=initargs) as pool:
+            futures = {k: pool.submit(_fit_shared, fit_fn, k) for k in ks}
+            return {k: futures[k].result() for k in ks}
+    finally:
+        shm.close()
+        shm.unlink()
@@ -2,23 +2,33 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 import numpy as np
+from typing import Literal
 from sklearn.cluster import KMeans
 from sklearn.decomposition import PCA
 from .io_utils import save_fig
+from .density import draw_clusters
 from setup.config import QUESTION_COLS
+from setup.responses import ResponseMatrix
+from setup.profiles import ResponseDistribution
+from clustering.store import FIT_STORE, FitResult, FitStore
 
-def plot_pca_clusters(X: pd.DataFrame,
+def plot_pca_clusters(X: ResponseMatrix,
                       filename: str, 
-                      ks: tuple[int, ...] = (2, 3, 4)) -> None:
-    """Creates a plot of the principal component analysis using provided cluster sizes."""
-    pca = PCA(n_components=2)
-    X_pca = pca.fit_transform(X)
+                      ks: tuple[int, ...] = (2, 3, 4),
+                      store: FitStore = FIT_STORE,
+                      render: Literal["auto", "scatter", "density"] = "auto",
+                      overlay: int = 0,
+                      X_pca: np.ndarray | None = None) -> None:
+    """Creates a plot of the principal component analysis using provided cluster sizes, reusing fits from `store`. Large samples are drawn as per-cluster density images, see `draw_clusters`. Pass `X_pca` to reuse a projection."""
+    X_fit = X.to_float()
+    if X_pca is None:
+        pca = PCA(n_components=2)
+        X_pca = pca.fit_transform(X_fit)
 
     fig, ax = plt.subplots(1, len(ks), figsize=(5 * len(ks), 5))
     for i, k in enumerate(ks):
-        kmeans = KMeans(n_clusters=k, init='k-means++', random_state=42)
-        labels = kmeans.fit_predict(X)
-        ax[i].scatter(X_pca[:, 0], X_pca[:, 1], c=labels, cmap="tab10", s=15)
+        labels = store.get_or_fit("kmeans", X, lambda: _fit_kmeans(X_fit, k), k=k).labels
+        draw_clusters(ax[i], X_pca, labels, "tab10", render=render, overlay=overlay, s=15)
         ax[i].set_title(f"PCA, k={k}")
         ax[i].set_xlabel("PC1")
         ax[i].set_ylabel("PC2")
@@ -26,11 +36,15 @@ def plot_pca_clusters(X: pd.DataFrame,
     plt.tight_layout()
     save_fig(fig, "plots", "pca", f"{filename}.png")
 
-def plot_mode_cluster_heatmaps(df_labeled: pd.DataFrame, filename: str) -> pd.DataFrame:
-    """Creates a heatmap of the modes by cluster per question response and returns a DataFrame of the modes."""
-    modes = df_labeled.groupby("Cluster")[QUESTION_COLS].agg(
-        lambda x: x.mode().iloc[0]
-    )
+def _fit_kmeans(X_fit: np.ndarray, k: int) -> FitResult:
+    """Fits k-means for a k that `label_and_score` did not fit."""
+    kmeans = KMeans(n_clusters=k, init='k-means++', random_state=42).fit(X_fit)
+    return FitResult(kmeans.labels_, kmeans.cluster_centers_, kmeans)
+
+def plot_mode_cluster_heatmaps(df_labeled: pd.DataFrame | ResponseDistribution, filename: str) -> pd.DataFrame:
+    """Creates a heatmap of the modes by cluster per question response and returns a DataFrame of the modes, read from a `ResponseDistribution`."""
+    dist = df_labeled if isinstance(df_labeled, ResponseDistribution) else ResponseDistribution.from_frame(df_labeled, QUESTION_COLS)
+    modes = dist.modes()
 
     fig, ax = plt.subplots(figsize=(10, 6))
     sns.heatmap(modes, annot=True, cmap="coolwarm", ax=ax)
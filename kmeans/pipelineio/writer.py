@@ -0,0 +1,165 @@
+"""writer.py
+
+Writes artifacts on background threads so the pipeline never waits on disk I/O.
+"""
+import atexit
+import contextlib
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+import pandas as pd
+from setup.config import ARTIFACT_QUEUE_SIZE, ARTIFACT_WRITER_THREADS
+
+class ArtifactWriter:
+    """
+    A bounded queue of artifact writes drained by a pool of background threads.
+
+    `submit` returns as soon as the write is queued. Once `max_queued` writes are unfinished it
+    blocks until one completes, so a fast producer cannot pile up DataFrames and figures in memory.
+    Writes to the same path run in submission order, which keeps appended CSV chunks in sequence.
+    Errors are collected and raised by `flush`; the writer flushes itself at interpreter exit and
+    prints any errors then. A caller that shares the writer with other threads can `collect` the
+    writes it submits and `wait` for only those. Every write's queue wait, duration and size is
+    recorded in `timings`.
+
+    Parameters
+    ----------
+        n_threads : int
+            The number of writer threads. Default is `ARTIFACT_WRITER_THREADS`.
+        max_queued : int
+            The maximum number of unfinished writes. Default is `ARTIFACT_QUEUE_SIZE`.
+
+    Usage
+    -----
+    >>> WRITER.submit(out_path, df.to_csv, out_path, index=True)
+    >>> WRITER.flush()
+    """
+    def __init__(self, n_threads: int = ARTIFACT_WRITER_THREADS, max_queued: int = ARTIFACT_QUEUE_SIZE) -> None:
+        self.n_threads = n_threads
+        self._slots = threading.BoundedSemaphore(max_queued)
+        self._lock = threading.Lock()
+        self._pool: ThreadPoolExecutor | None = None
+        self._pending: set[Future] = set()
+        self._last_by_path: dict[Path, Future] = {}
+        self._errors: list[tuple[Path, BaseException]] = []
+        # futures whose errors a `wait` has already raised, so `_done` must not queue them for `flush`
+        self._claimed: set[Future] = set()
+        self._collecting = threading.local()
+        self.timings: list[dict[str, Any]] = []
+
+    def _run(self, path: Path, write_fn: Callable[..., Any], args: tuple, kwargs: dict,
+             previous: Future | None, queued_at: float) -> None:
+        if previous is not None:
+            # the previous write to this path was queued first, so it is already running or done
+            try:
+                previous.result()
+            except BaseException:
+                pass
+        started = time.perf_counter()
+        write_fn(*args, **kwargs)
+        finished = time.perf_counter()
+        with self._lock:
+            self.timings.append(dict(path=str(path), queued_s=started - queued_at, write_s=finished - started,
+                                     bytes=path.stat().st_size if path.exists() else 0))
+
+    def _done(self, path: Path, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+            if self._last_by_path.get(path) is future:
+                del self._last_by_path[path]
+            if future in self._claimed:
+                self._claimed.discard(future)
+            elif future.exception() is not None:
+                self._errors.append((path, future.exception()))
+        self._slots.release()
+
+    def submit(self, path: Path, write_fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Queues `write_fn(*args, **kwargs)`, which writes `path`, blocking while the queue is full."""
+        path = Path(path)
+        self._slots.acquire()
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.n_threads, thread_name_prefix="artifact-writer")
+            previous = self._last_by_path.get(path)
+            future = self._pool.submit(self._run, path, write_fn, args, kwargs, previous, time.perf_counter())
+            self._pending.add(future)
+            self._last_by_path[path] = future
+        future.add_done_callback(lambda f: self._done(path, f))
+        collected = getattr(self._collecting, "futures", None)
+        if collected is not None:
+            collected.append(future)
+        return future
+
+    @contextlib.contextmanager
+    def collect(self) -> Iterator[list[Future]]:
+        """Yields a list that gathers the futures of every write this thread submits inside the block."""
+        outer = getattr(self._collecting, "futures", None)
+        self._collecting.futures = futures = []
+        try:
+            yield futures
+        finally:
+            self._collecting.futures = outer
+            if outer is not None:
+                outer.extend(futures)
+
+    def wait(self, futures: list[Future]) -> None:
+        """Waits for the given writes only and raises the first of their errors, leaving other writes queued."""
+        failed = []
+        for future in futures:
+            try:
+                future.result()
+            except BaseException as exc:
+                failed.append(exc)
+        if not failed:
+            return
+        with self._lock:
+            # errors `_done` already queued are dropped; the others are claimed before `_done` sees them
+            queued = [exc for _, exc in self._errors]
+            self._errors = [(path, exc) for path, exc in self._errors if exc not in failed]
+            self._claimed.update(f for f in futures if f.exception() is not None and f.exception() not in queued)
+        raise RuntimeError(f"{len(failed)} artifact write(s) failed: {failed[0]!r}") from failed[0]
+
+    def flush(self) -> None:
+        """Waits for every queued write and raises the first error, listing how many writes failed."""
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            for future in pending:
+                try:
+                    future.result()
+                except BaseException:
+                    pass
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            path, exc = errors[0]
+            raise RuntimeError(f"{len(errors)} artifact write(s) failed, first {path}: {exc!r}") from exc
+
+    def timing_frame(self) -> pd.DataFrame:
+        """Returns the recorded write timings as a DataFrame, one row per artifact."""
+        with self._lock:
+            return pd.DataFrame(self.timings, columns=["path", "queued_s", "write_s", "bytes"])
+
+    def close(self) -> None:
+        """Flushes the queue and stops the writer threads."""
+        try:
+            self.flush()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+def _close_at_exit() -> None:
+    try:
+        WRITER.close()
+    except RuntimeError as exc:
+        print(f"Artifact writer: {exc}", file=sys.stderr)
+
+WRITER = ArtifactWriter()
+atexit.register(_close_at_exit)
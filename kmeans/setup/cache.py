@@ -0,0 +1,173 @@
+"""cache.py
+
+Binary on-disk cache of the cleaned dataset. The CSV is parsed once and converted into a columnar
+layout (a uint8 response matrix, the row index and one .npy file per side column) keyed by the
+CSV's content hash, so later loads only memory-map the arrays instead of re-parsing text.
+"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from .config import CACHE_DIR, DATA_PATH, QUESTION_COLS
+
+CACHE_VERSION: int = 1
+MISSING: int = 0
+
+def file_digest(csv_path: Path = DATA_PATH) -> str:
+    """
+    Returns the SHA-256 content hash of a file, memoized on its size and modification time.
+
+    Parameters
+    ----------
+        csv_path : Path
+            The file to hash. Default is `DATA_PATH`.
+
+    Returns
+    -------
+        str
+            The hex digest of the file contents.
+    """
+    csv_path = Path(csv_path)
+    stat = csv_path.stat()
+    stamp_path = CACHE_DIR / f"{csv_path.stem}.stamp.json"
+    if stamp_path.exists():
+        stamp = json.loads(stamp_path.read_text())
+        if stamp["size"] == stat.st_size and stamp["mtime_ns"] == stat.st_mtime_ns:
+            return stamp["sha256"]
+
+    with open(csv_path, "rb") as f:
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    stamp_path.write_text(json.dumps(dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=digest)))
+    return digest
+
+def _write_cache(csv_path: Path, out_dir: Path) -> None:
+    """Parses the CSV once and writes the response matrix, index and side columns to `out_dir`."""
+    df = pd.read_csv(csv_path)
+
+    responses = df[QUESTION_COLS]
+    values = responses.to_numpy(dtype=np.float64, na_value=np.nan)
+    observed = values[~np.isnan(values)]
+    if observed.size and (observed.min() < 1 or observed.max() > 255 or not np.all(observed == np.round(observed))):
+        raise ValueError(f"Question columns in {csv_path} are not integer responses in [1, 255].")
+    np.save(out_dir / "responses.npy", np.nan_to_num(values, nan=MISSING).astype(np.uint8))
+    np.save(out_dir / "index.npy", df.index.to_numpy(dtype=np.int64))
+
+    columns = []
+    for i, col in enumerate(df.columns):
+        if col in QUESTION_COLS:
+            columns.append(dict(name=col, kind="question", integer=not responses[col].isna().any()))
+            continue
+        series = df[col]
+        filename = f"col_{i:03d}.npy"
+        if not pd.api.types.is_numeric_dtype(series):
+            np.save(out_dir / filename, series.fillna("").to_numpy(dtype=str))
+            np.save(out_dir / f"col_{i:03d}.isna.npy", series.isna().to_numpy())
+            columns.append(dict(name=col, kind="text", file=filename))
+        else:
+            np.save(out_dir / filename, series.to_numpy())
+            columns.append(dict(name=col, kind="numeric", file=filename))
+
+    meta = dict(version=CACHE_VERSION, source=str(csv_path), n_rows=len(df), columns=columns)
+    (out_dir / "meta.json").write_text(json.dumps(meta, indent=2))
+
+def ensure_cache(csv_path: Path = DATA_PATH) -> Path:
+    """
+    Builds the binary cache for a CSV if it does not already exist and returns its directory.
+
+    Parameters
+    ----------
+        csv_path : Path
+            The cleaned dataset CSV. Default is `DATA_PATH`.
+
+    Returns
+    -------
+        Path
+            The cache directory, named after the CSV stem and its content hash.
+    """
+    csv_path = Path(csv_path)
+    cache_dir = CACHE_DIR / f"{csv_path.stem}_v{CACHE_VERSION}_{file_digest(csv_path)[:16]}"
+    if cache_dir.joinpath("meta.json").exists():
+        return cache_dir
+
+    # build in a private directory and rename so concurrent runs never see a partial cache
+    tmp_dir = CACHE_DIR / f".{cache_dir.name}.tmp-{os.getpid()}"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        _write_cache(csv_path, tmp_dir)
+        os.replace(tmp_dir, cache_dir)
+    except OSError:
+        if not cache_dir.joinpath("meta.json").exists():
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return cache_dir
+
+class DatasetCache:
+    """
+    Read-only, memory-mapped view of a cached dataset.
+
+    Attributes
+    ----------
+        responses : NDArray
+            The (n_rows, n_questions) uint8 response matrix, with `MISSING` marking empty answers.
+        index : NDArray
+            The int64 row index of the original CSV.
+        columns : list[str]
+            All column names of the original CSV, in order.
+    """
+
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.meta = json.loads(self.cache_dir.joinpath("meta.json").read_text())
+        self.responses = np.load(self.cache_dir / "responses.npy", mmap_mode="r")
+        self.index = np.load(self.cache_dir / "index.npy", mmap_mode="r")
+        self.columns = [col["name"] for col in self.meta["columns"]]
+        self._specs = {col["name"]: col for col in self.meta["columns"]}
+
+    def column(self, name: str) -> np.ndarray:
+        """Returns a single column as an array, memory-mapped where the storage allows it."""
+        spec = self._specs[name]
+        if spec["kind"] == "question":
+            values = self.responses[:, QUESTION_COLS.index(name)]
+            if spec["integer"]:
+                return values.astype(np.int64)
+            return np.where(values == MISSING, np.nan, values.astype(np.float64))
+        values = np.load(self.cache_dir / spec["file"], mmap_mode="r")
+        if spec["kind"] == "text":
+            isna = np.load(self.cache_dir / spec["file"].replace(".npy", ".isna.npy"), mmap_mode="r")
+            values = values.astype(object)
+            values[isna] = np.nan
+        return values
+
+    def to_frame(self, columns: list[str] | None = None) -> pd.DataFrame:
+        """Materializes the requested columns (default all) as a DataFrame equivalent to `pd.read_csv`."""
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({col: self.column(col) for col in columns},
+                            index=pd.Index(self.index, dtype=np.int64))
+
+def open_cache(csv_path: Path = DATA_PATH) -> DatasetCache:
+    """
+    Opens the memory-mapped cache for a CSV, converting the CSV on first use.
+
+    Parameters
+    ----------
+        csv_path : Path
+            The cleaned dataset CSV. Default is `DATA_PATH`.
+
+    Returns
+    -------
+        DatasetCache
+            The cached dataset.
+
+    Usage
+    -----
+    >>> cache = open_cache()
+    >>> cache.responses.shape
+    (n_rows, 20)
+    """
+    return DatasetCache(ensure_cache(csv_path))
@@ -1,33 +1,87 @@
+from collections.abc import Iterator
 import pandas as pd
-from .config import DATA_PATH, QUESTION_COLS, RANDOM_STATE, SAMPLE_N
-from pipelineio.io_utils import save_df
+from .config import DATA_PATH, QUESTION_COLS, RANDOM_STATE, SAMPLE_N, STREAM_CHUNK_ROWS, USE_DATA_CACHE
+from .cache import MISSING, open_cache
+from .responses import ResponseMatrix
+from pipelineio.label_store import save_responses
 
-def load_raw() -> pd.DataFrame:
-    """Loads the complete CSV from disk into a DataFrame and returns for machine learning use."""
-    return pd.read_csv(DATA_PATH)
+def load_raw(columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Loads the complete dataset into a DataFrame and returns for machine learning use.
+
+    Parameters
+    ----------
+        columns : list[str] | None
+            The columns to load. Default is `None`, which loads every column.
+
+    Returns
+    -------
+        DataFrame
+            The dataset, read from the memory-mapped binary cache when `USE_DATA_CACHE` is set.
+    """
+    if USE_DATA_CACHE:
+        return open_cache(DATA_PATH).to_frame(columns)
+    return pd.read_csv(DATA_PATH, usecols=columns)
 
-def prep_sample(save: bool = False, use_all: bool = False) -> pd.DataFrame:
+def load_responses() -> ResponseMatrix:
+    """Loads the question responses of every complete row as a uint8 response matrix."""
+    if not USE_DATA_CACHE:
+        return ResponseMatrix.from_frame(load_raw(QUESTION_COLS).dropna())
+
+    cache = open_cache(DATA_PATH)
+    complete = (cache.responses != MISSING).all(axis=1)
+    return ResponseMatrix(cache.responses[complete], index=cache.index[complete], columns=QUESTION_COLS)
+
+def iter_response_chunks(chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[ResponseMatrix]:
+    """
+    Yields the complete rows of the dataset as consecutive uint8 response matrices of bounded size.
+
+    Chunks are sliced from the memory-mapped cache when `USE_DATA_CACHE` is set, otherwise the CSV is
+    parsed `chunk_rows` lines at a time, so at most one chunk of responses is in memory at once.
+
+    Parameters
+    ----------
+        chunk_rows : int
+            The number of dataset rows read per chunk, before incomplete rows are dropped. Default is `STREAM_CHUNK_ROWS`.
+
+    Returns
+    -------
+        Iterator[ResponseMatrix]
+            The non-empty chunks in dataset order.
+    """
+    if not USE_DATA_CACHE:
+        for df in pd.read_csv(DATA_PATH, usecols=QUESTION_COLS, chunksize=chunk_rows):
+            df = df[QUESTION_COLS].dropna()
+            if len(df):
+                yield ResponseMatrix.from_frame(df)
+        return
+
+    cache = open_cache(DATA_PATH)
+    for start in range(0, len(cache.responses), chunk_rows):
+        values = cache.responses[start:start + chunk_rows]
+        complete = (values != MISSING).all(axis=1)
+        if complete.any():
+            yield ResponseMatrix(values[complete], index=cache.index[start:start + chunk_rows][complete], columns=QUESTION_COLS)
+
+def prep_sample(save: bool = False, use_all: bool = False) -> ResponseMatrix:
     """
     Prepares the machine learning input data with N rows and optionally saves to output file.
 
     Parameters
     ----------
         save : bool
-            Set to `True` to save the DataFrame to a CSV file. Default is `False`.
+            Set to `True` to write the responses to the label store. Default is `False`.
         use_all : bool
             Set to `True` to use all rows in the dataset. Default is `False`, which samples `SAMPLE_N` rows.
 
     Returns
     -------
-        DataFrame
-            A DataFrame of size Nx20 ready for clustering.
+        ResponseMatrix
+            A uint8 response matrix of size Nx20 ready for clustering.
     """
-    df = load_raw()
-    X = df[QUESTION_COLS].copy()
-    X_clean = X.dropna().astype(int)
+    X_clean = load_responses()
     X_sample = X_clean.sample(n=SAMPLE_N, random_state=RANDOM_STATE) if not use_all else X_clean
-    if save and not use_all:
-        save_df(X_sample, f"Xs_{SAMPLE_N}.csv")
-    elif save and use_all:
-        save_df(X_sample, "Xs_all.csv")
+    if save:
+        # written once as uint8; every label column of the run is stored beside it
+        save_responses(X_sample)
     return X_sample
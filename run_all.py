@@ -0,0 +1,136 @@
+"""run_all.py
+
+Runs any subset of the clustering pipelines in one process and writes one comparison summary.
+
+Each algorithm directory is its own project with its own `setup`, `clustering` and `pipelineio`
+packages, so a project is imported while it is active: its packages are swapped into `sys.modules`,
+its directory is put first on `sys.path` and it runs from its directory, exactly as
+`python run_<algorithm>.py` would. The responses are loaded and cleaned once, and every pipeline
+shares that uint8 matrix, its float copy and one PCA projection instead of rebuilding them. The
+pipelines leave their Silhouette scores empty; the labelings of every algorithm and k are scored
+afterwards in one streamed distance pass, so each pairwise distance is computed once per run rather
+than once per algorithm.
+"""
+import argparse
+import contextlib
+import importlib
+import os
+import sys
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Literal
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+
+ROOT: Path = Path(__file__).resolve().parent
+ALGORITHMS: tuple[str, ...] = ("kmeans", "gmm", "hierarchical", "spectral")
+PROJECT_PACKAGES: tuple[str, ...] = ("setup", "clustering", "pipelineio")
+
+def _is_project_module(name: str) -> bool:
+    return name.split(".")[0] in PROJECT_PACKAGES or name.startswith("run_")
+
+class Project:
+    """One algorithm directory, imported under its own copies of the project packages."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.path = ROOT / name
+        self._modules: dict[str, ModuleType] = {}
+
+    @contextlib.contextmanager
+    def active(self) -> Iterator["Project"]:
+        """Makes this project's packages importable by their plain names and runs from its directory."""
+        others = {name: sys.modules.pop(name) for name in list(sys.modules) if _is_project_module(name)}
+        sys.modules.update(self._modules)
+        sys.path.insert(0, str(self.path))
+        cwd = os.getcwd()
+        os.chdir(self.path)
+        try:
+            yield self
+        finally:
+            os.chdir(cwd)
+            sys.path.remove(str(self.path))
+            self._modules = {name: sys.modules.pop(name) for name in list(sys.modules) if _is_project_module(name)}
+            sys.modules.update(others)
+
+    def module(self, name: str) -> ModuleType:
+        """Imports a module of this project; the project must be active."""
+        return importlib.import_module(name)
+
+    def adopt(self, X: Any, X_float: np.ndarray) -> Any:
+        """Rebuilds shared responses as this project's ResponseMatrix over the same uint8 and float arrays."""
+        X_own = self.module("setup.responses").ResponseMatrix(X.values, index=X.index, columns=X.columns)
+        # the float copy and fingerprint depend only on the values, so they carry over as is
+        X_own._float = X_float
+        X_own._fingerprint = X.fingerprint()
+        return X_own
+
+def run_all(algorithms: tuple[str, ...] = ALGORITHMS,
+            use_all: bool = True,
+            sil_mode: Literal["exact", "sampled"] = "exact") -> pd.DataFrame:
+    """
+    Runs the selected pipelines on one shared load of the responses and returns their combined summary.
+
+    Parameters
+    ----------
+        algorithms : tuple[str, ...]
+            The pipelines to run, in order, from `ALGORITHMS`. Default is all four.
+        use_all : bool
+            Set to `False` to run on a sample of `SAMPLE_N` rows. Default is `True`.
+        sil_mode : Literal["exact", "sampled"]
+            How the Silhouette of every labeling is computed, see `score_labelings`. Default is `"exact"`.
+
+    Returns
+    -------
+        DataFrame
+            One row per algorithm and k, with the algorithm name followed by its summary columns.
+    """
+    projects = [Project(name) for name in algorithms]
+    with projects[0].active() as project:
+        config = project.module("setup.config")
+        X = project.module("pipelineio.artifact_cache").CACHE.run(
+            "preprocess", project.module("setup.preprocess").prep_sample,
+            inputs=config.DATA_PATH, save=True, use_all=use_all)
+        X_float = X.to_float()
+        X_pca = PCA(n_components=2).fit_transform(X_float)
+
+    summaries, labelings = [], {}
+    for project in projects:
+        with project.active():
+            results, summary = project.module(f"run_{project.name}").run(project.adopt(X, X_float), X_pca=X_pca,
+                                                                          sil_mode=None)
+            # artifact paths are relative to the project directory, so queued writes finish before leaving it
+            project.module("pipelineio.writer").WRITER.flush()
+        summaries.append(summary.assign(algorithm=project.name))
+        labelings.update({(project.name, k): results[k]["labels"] for k in summary["k"]})
+
+    # every algorithm's labelings share one pass over the pairwise distances of X
+    with projects[0].active() as project:
+        scores = project.module("clustering.silhouette").score_labelings(X_float, labelings, mode=sil_mode)
+    comparison = pd.concat(summaries, ignore_index=True)
+    sil_columns = list(next(iter(scores.values())))
+    comparison[sil_columns] = pd.DataFrame([scores[key] for key in zip(comparison["algorithm"], comparison["k"])])
+    return comparison[["algorithm"] + [col for col in comparison.columns if col != "algorithm"]]
+
+def main() -> None:
+    """Main script to run several pipelines in one process and compare their scores."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-a", "--algorithms", nargs="+", choices=ALGORITHMS, default=list(ALGORITHMS),
+                        help="Pipelines to run, in order")
+    parser.add_argument("--sample", action="store_true", help="Run on a sample of SAMPLE_N rows instead of all rows")
+    parser.add_argument("--sil-mode", choices=("exact", "sampled"), default="exact",
+                        help="Score every row, or estimate the scores from subsamples")
+    args = parser.parse_args()
+
+    comparison = run_all(tuple(args.algorithms), use_all=not args.sample, sil_mode=args.sil_mode)
+    print(comparison)
+
+    out_dir = Path(f"artifacts_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    comparison.to_csv(out_dir / "comparison_summary.csv", index=False)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,23 @@
+import warnings
 import numpy as np
 import pandas as pd
-from typing import Any
+from typing import Any, Literal
 
 from sklearn.neighbors import kneighbors_graph
 from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+from sklearn.exceptions import ConvergenceWarning
 from scipy.sparse import csgraph
-from scipy.sparse.linalg import eigsh
 
 from pipelineio.io_utils import save_df
-from setup.config import RANDOM_STATE
+from pipelineio.label_store import save_labels
+from setup.config import EIGEN_SOLVER, RANDOM_STATE
+from setup.responses import ResponseMatrix
+from .eigensolvers import Solver, smallest_eigenpairs
+from .silhouette import score_labelings
 
 
 def _build_knn_rbf_similarity(
-    X: pd.DataFrame,
+    X: np.ndarray,
     n_neighbors: int = 15
 ):
     """
@@ -38,29 +42,33 @@ def _build_knn_rbf_similarity(
 
 
 def _compute_spectral_embedding(
-    X: pd.DataFrame,
+    X: np.ndarray,
     n_components: int = 3,
     n_neighbors: int = 15,
+    eigen_solver: Solver = EIGEN_SOLVER,
 ):
     """
     Compute spectral embedding using the normalized graph Laplacian.
-    Returns an (n_samples, n_components) array.
+    Returns an (n_samples, n_components) array and the eigen-solver
+    report (see `smallest_eigenpairs`).
     """
     W_sim = _build_knn_rbf_similarity(X, n_neighbors=n_neighbors)
 
     L = csgraph.laplacian(W_sim, normed=True)
 
-    vals, vecs = eigsh(L, k=n_components + 1, which="SM")
+    vals, vecs, info = smallest_eigenpairs(L, n_components + 1, solver=eigen_solver)
     embedding = vecs[:, 1 : n_components + 1]
-    return embedding
+    return embedding, info
 
 
 def label_and_score(
-    X: pd.DataFrame,
+    X: ResponseMatrix,
     ks: tuple[int, ...] = (2, 3, 4),
     save: bool = True,
     prefix: str = "spectral",
     n_neighbors: int = 15,
+    sil_mode: Literal["exact", "sampled"] | None = "exact",
+    eigen_solver: Solver = EIGEN_SOLVER,
 ) -> tuple[dict[int, dict[str, Any]], pd.DataFrame]:
     """
     Run spectral clustering for the given k values, compute
@@ -68,50 +76,70 @@ def label_and_score(
 
     Parameters
     ----------
-    X : DataFrame
-        Input features (MACH item responses).
+    X : ResponseMatrix
+        Input features (uint8 MACH item responses).
     ks : tuple[int, ...]
         Cluster counts (e.g., (2, 3, 4)).
     save : bool
-        If True, save labels and summary CSVs.
+        If True, save labels to the label store and the summary CSV.
     prefix : str
         Prefix used when naming output files.
     n_neighbors : int
         Number of neighbors for k-NN graph.
+    sil_mode : {"exact", "sampled", None}
+        "exact" scores every row, "sampled" estimates the scores from
+        stratified per-cluster subsamples with bootstrap confidence intervals.
+        None leaves the scores empty for the caller to compute and write.
+    eigen_solver : {"auto", "dense", "arpack", "shift-invert", "lobpcg", "adjacency"}
+        Solver for the Laplacian eigenvectors, see `smallest_eigenpairs`.
+        "auto" picks one from the graph's size and connectivity.
 
     Returns
     -------
     results : dict
-        results[k]["labels"] and results[k]["sil"]
+        results[k]["labels"] and results[k]["sil"], plus results["embedding"]
+        and the eigen-solver report in results["eigen"]
     summary : DataFrame
-        rows = (k, sil)
+        rows = (k, sil, sil_mode, sil_ci_low, sil_ci_high, sil_n)
     """
     n_components = max(ks)
-    embedding = _compute_spectral_embedding(
-        X,
+    X_fit = X.to_float()
+    embedding, eigen_info = _compute_spectral_embedding(
+        X_fit,
         n_components=n_components,
         n_neighbors=n_neighbors,
+        eigen_solver=eigen_solver,
     )
+    print(f"Spectral embedding: {eigen_info['solver']} solver, {eigen_info['seconds']:.2f}s, "
+          f"max residual {eigen_info['max_residual']:.1e}")
+    if not eigen_info["converged"]:
+        warnings.warn(f"The {eigen_info['solver']} eigen-solver did not converge. Try another "
+                      "`eigen_solver` or raise `EIGEN_MAX_ITER`.", ConvergenceWarning)
 
     results: dict[int, dict[str, Any]] = {}
 
     results["embedding"] = embedding
+    results["eigen"] = eigen_info
 
     for k in ks:
         km = KMeans(n_clusters=k, random_state=RANDOM_STATE, n_init="auto")
         labels = km.fit_predict(embedding[:, :n_components])
+        results[k] = {"labels": labels}
 
-        sil = silhouette_score(X, labels)
-        results[k] = {"labels": labels, "sil": sil}
+    if save:
+        save_labels(X, {f"{prefix}_k{k}": results[k]["labels"] for k in ks})
 
-        if save:
-            df_labels = X.copy()
-            df_labels["Cluster"] = labels
-            save_df(df_labels, f"{prefix}_{k}_clusters_labels.csv")
+    # one streamed distance pass scores every k
+    scores = score_labelings(X_fit, {k: results[k]["labels"] for k in ks}, mode=sil_mode)
+    for k in ks:
+        results[k].update(scores[k])
 
-    summary_rows = [dict(k=k, sil=results[k]["sil"]) for k in ks]
+    summary_rows = [dict(k=k, **scores[k]) for k in ks]
     summary = pd.DataFrame(summary_rows)
     if save:
-        save_df(summary, f"{prefix}_sil_score_summary.csv")
+        # a deferred summary has no scores yet, so the caller writes it
+        if sil_mode is not None:
+            save_df(summary, f"{prefix}_sil_score_summary.csv")
+        save_df(pd.DataFrame([eigen_info]), f"{prefix}_eigen_solver.csv")
 
     return results, summary
@@ -0,0 +1,206 @@
+"""eigensolvers.py
+
+Solvers for the smallest eigenpairs of a normalized graph Laplacian, which give the spectral embedding.
+
+Every solver targets the same eigenvectors, up to sign and rotation within repeated eigenvalues, and
+reports how it converged and how long it took, so they can be swapped by graph.
+"""
+import time
+from collections.abc import Callable
+from typing import Any, Literal
+import numpy as np
+import scipy.sparse as sp
+from scipy.linalg import eigh
+from scipy.sparse import csgraph
+from scipy.sparse.linalg import LinearOperator, eigsh, lobpcg, splu
+from setup.config import (RANDOM_STATE, EIGEN_SOLVER, EIGEN_DENSE_MAX_N, EIGEN_SHIFT,
+                          EIGEN_TOL, EIGEN_MAX_ITER, EIGEN_NEUMANN_DEGREE)
+
+Solver = Literal["auto", "dense", "arpack", "shift-invert", "lobpcg", "adjacency"]
+
+class _Counted:
+    """Wraps a vector operation and counts how many vectors it has been applied to."""
+
+    def __init__(self, fn: Callable[[np.ndarray], np.ndarray]) -> None:
+        self.fn = fn
+        self.count = 0
+
+    def __call__(self, v: np.ndarray) -> np.ndarray:
+        self.count += 1 if v.ndim == 1 else v.shape[1]
+        return self.fn(v)
+
+def choose_solver(n: int, n_components: int) -> str:
+    """
+    Returns the solver `"auto"` resolves to for a graph of `n` nodes in `n_components` connected components.
+
+    Graphs of up to `EIGEN_DENSE_MAX_N` nodes are solved densely. A connected graph has a single zero
+    eigenvalue, so Lanczos on the normalized adjacency, which needs the fewest products, is safe. Each
+    further component adds another zero eigenvalue, which single-vector Lanczos can skip while still
+    reporting converged pairs, so disconnected graphs go to block LOBPCG, which resolves them.
+    """
+    if n <= EIGEN_DENSE_MAX_N:
+        return "dense"
+    if n_components == 1:
+        return "adjacency"
+    return "lobpcg"
+
+def _dense(L: sp.spmatrix, k: int, tol: float, max_iter: int) -> tuple[np.ndarray, np.ndarray, dict[str, Any]]:
+    vals, vecs = eigh(L.toarray(), subset_by_index=[0, k - 1])
+    return vals, vecs, dict(n_ops=0, iterations=0)
+
+def _arpack(L: sp.spmatrix, k: int, tol: float, max_iter: int) -> tuple[np.ndarray, np.ndarray, dict[str, Any]]:
+    """ARPACK on the smallest-magnitude eigenvalues directly, its slowest mode, kept as the reference."""
+    matvec = _Counted(L.dot)
+    op = LinearOperator(L.shape, matvec=matvec, matmat=matvec, dtype=L.dtype)
+    vals, vecs = eigsh(op, k=k, which="SM", tol=tol, maxiter=max_iter)
+    return vals, vecs, dict(n_ops=matvec.count, iterations=None)
+
+def _shift_invert(L: sp.spmatrix, k: int, tol: float, max_iter: int) -> tuple[np.ndarray, np.ndarray, dict[str, Any]]:
+    """ARPACK on the largest eigenvalues of (L + shift I)^-1, whose top eigenvectors are the smallest of L."""
+    # L itself is singular, so it is factorized just below zero rather than at it
+    lu = splu(sp.csc_matrix(L + EIGEN_SHIFT * sp.identity(L.shape[0], format="csc")))
+    solve = _Counted(lu.solve)
+    op_inv = LinearOperator(L.shape, matvec=solve, matmat=solve, dtype=L.dtype)
+    vals, vecs = eigsh(L, k=k, sigma=-EIGEN_SHIFT, which="LM", OPinv=op_inv, tol=tol, maxiter=max_iter)
+    return vals, vecs, dict(n_ops=solve.count, iterations=None)
+
+def _amg_preconditioner(L: sp.spmatrix) -> LinearOperator | None:
+    """Returns an algebraic multigrid V-cycle for L + shift I when pyamg is installed, else `None`."""
+    try:
+        from pyamg import smoothed_aggregation_solver
+    except ImportError:
+        return None
+    ml = smoothed_aggregation_solver(sp.csr_matrix(L + EIGEN_SHIFT * sp.identity(L.shape[0], format="csr")))
+    return ml.aspreconditioner()
+
+def _neumann_preconditioner(L: sp.spmatrix, degree: int = EIGEN_NEUMANN_DEGREE) -> tuple[LinearOperator, _Counted]:
+    """
+    Returns the first `degree` + 1 terms of the Neumann series of (L + shift I)^-1 and the counter of its products.
+
+    With the normalized adjacency A = I - L, (L + shift I)^-1 = sum_j A^j / (1 + shift)^(j + 1), and
+    A's eigenvalues lie in [-1, 1], so a few terms already weigh the small eigenvalues of L above the
+    large ones, for `degree` products per vector and no setup.
+    """
+    A = sp.identity(L.shape[0], format="csr") - L
+    product = _Counted(A.dot)
+
+    def apply(v: np.ndarray) -> np.ndarray:
+        term = v / (1 + EIGEN_SHIFT)
+        out = term
+        for _ in range(degree):
+            term = product(term) / (1 + EIGEN_SHIFT)
+            out = out + term
+        return out
+
+    return LinearOperator(L.shape, matvec=apply, matmat=apply, dtype=L.dtype), product
+
+def _lobpcg(L: sp.spmatrix, k: int, tol: float, max_iter: int) -> tuple[np.ndarray, np.ndarray, dict[str, Any]]:
+    """
+    LOBPCG from a random block, preconditioned by algebraic multigrid where pyamg is installed and by a
+    polynomial in the adjacency otherwise.
+
+    A normalized Laplacian has a unit diagonal, so Jacobi preconditioning is the identity, and an
+    incomplete LU of the nearly singular shifted Laplacian costs more to build than the iterations it
+    saves. The Neumann polynomial costs nothing to build and about halves the iterations.
+    """
+    rng = np.random.default_rng(RANDOM_STATE)
+    X0 = rng.standard_normal((L.shape[0], k))
+    precondition, name, products = _amg_preconditioner(L), "amg", None
+    if precondition is None:
+        precondition, products = _neumann_preconditioner(L)
+        name = f"neumann{EIGEN_NEUMANN_DEGREE}"
+    matvec = _Counted(L.dot)
+    op = LinearOperator(L.shape, matvec=matvec, matmat=matvec, dtype=L.dtype)
+    # LOBPCG's own default of 20 iterations is too few for a weakly preconditioned graph
+    vals, vecs, history = lobpcg(op, X0, M=precondition, tol=tol, maxiter=max_iter or 500, largest=False,
+                                 retResidualNormsHistory=True)
+    n_ops = matvec.count + (products.count if products is not None else 0)
+    return vals, vecs, dict(n_ops=n_ops, iterations=len(history), preconditioner=name)
+
+def _adjacency(L: sp.spmatrix, k: int, tol: float, max_iter: int) -> tuple[np.ndarray, np.ndarray, dict[str, Any]]:
+    """ARPACK on the largest eigenvalues of the normalized adjacency I - L, which share L's eigenvectors."""
+    A = sp.identity(L.shape[0], format="csr") - L
+    matvec = _Counted(A.dot)
+    op = LinearOperator(L.shape, matvec=matvec, matmat=matvec, dtype=L.dtype)
+    vals, vecs = eigsh(op, k=k, which="LA", tol=tol, maxiter=max_iter)
+    return 1.0 - vals, vecs, dict(n_ops=matvec.count, iterations=None)
+
+SOLVERS: dict[str, Callable[..., tuple[np.ndarray, np.ndarray, dict[str, Any]]]] = {
+    "dense": _dense,
+    "arpack": _arpack,
+    "shift-invert": _shift_invert,
+    "lobpcg": _lobpcg,
+    "adjacency": _adjacency,
+}
+
+def smallest_eigenpairs(L: sp.spmatrix,
+                        k: int,
+                        solver: Solver = EIGEN_SOLVER,
+                        tol: float = EIGEN_TOL,
+                        max_iter: int | None = EIGEN_MAX_ITER) -> tuple[np.ndarray, np.ndarray, dict[str, Any]]:
+    """
+    Computes the `k` smallest eigenvalues and eigenvectors of a symmetric normalized Laplacian.
+
+    Isolated nodes are left out of the problem, so their trivial zero eigenvalues are not among the
+    `k`, and their rows of the eigenvectors are zero.
+
+    Parameters
+    ----------
+        L : spmatrix
+            The (n, n) normalized graph Laplacian.
+        k : int
+            The number of eigenpairs, including the trivial one.
+        solver : {"auto", "dense", "arpack", "shift-invert", "lobpcg", "adjacency"}
+            "arpack" asks ARPACK for the smallest eigenvalues directly; "shift-invert" factorizes L just below
+            zero and asks for the largest of its inverse; "lobpcg" iterates on a random block, preconditioned
+            by multigrid when pyamg is installed and by a Neumann polynomial otherwise; "adjacency" asks for
+            the largest eigenvalues of I - L; "dense" solves the full matrix. Default is `EIGEN_SOLVER`, where
+            "auto" picks by size and connectivity, see `choose_solver`.
+        tol : float
+            The solver tolerance. Default is `EIGEN_TOL`.
+        max_iter : int | None
+            The iteration cap. Default is `EIGEN_MAX_ITER`, where `None` leaves each solver's own default.
+
+    Returns
+    -------
+        vals : NDArray
+            The k eigenvalues, ascending.
+        vecs : NDArray
+            The (n, k) eigenvectors, in the order of `vals`.
+        info : dict[str, Any]
+            The solver used, n, k, the number of isolated nodes, the number of connected components
+            among the other nodes, seconds, n_ops (products or solves applied to a vector), iterations
+            where the solver reports them, the largest residual norm ||L v - λ v|| and whether that
+            residual is at most max(sqrt(tol), 1e-4) (`converged`).
+    """
+    if solver != "auto" and solver not in SOLVERS:
+        raise ValueError(f"Unknown eigen-solver {solver!r}. Valid values are 'auto' or one of {list(SOLVERS)}.")
+    L = sp.csr_matrix(L, dtype=np.float64)
+    n = L.shape[0]
+    # an isolated node has an all-zero row and adds a zero eigenvalue supported on itself alone, which
+    # carries no structure, so the solvers work on the rest and isolated nodes embed at the origin
+    connected = L.diagonal() != 0
+    n_isolated = int(n - connected.sum())
+    L_sub = L[connected][:, connected] if n_isolated else L
+    n_sub = L_sub.shape[0]
+    if k >= n_sub:
+        raise ValueError(f"{k} eigenpairs were requested from a graph with {n_sub} connected nodes.")
+
+    n_components = csgraph.connected_components(L_sub, directed=False, return_labels=False)
+    name = choose_solver(n_sub, n_components) if solver == "auto" else solver
+    if name != "dense" and k >= n_sub - 1:
+        # the iterative solvers need the subspace to be smaller than the graph
+        name = "dense"
+
+    started = time.perf_counter()
+    vals, vecs_sub, info = SOLVERS[name](L_sub, k, tol, max_iter)
+    seconds = time.perf_counter() - started
+
+    order = np.argsort(vals)
+    vals, vecs_sub = vals[order], vecs_sub[:, order]
+    residual = float(np.linalg.norm(L_sub @ vecs_sub - vecs_sub * vals, axis=0).max())
+    vecs = np.zeros((n, k))
+    vecs[connected] = vecs_sub
+    info = dict(solver=name, n=n, k=k, n_isolated=n_isolated, n_components=n_components, seconds=seconds,
+                **info, max_residual=residual, converged=residual <= max(np.sqrt(tol), 1e-4))
+    return vals, vecs, info
@@ -0,0 +1,369 @@
+"""artifact_cache.py
+
+Content-addressed cache of pipeline stage results, linked into each timestamped run directory.
+
+Every stage is keyed by a hash of its name, its inputs, its parameters and the source code of the
+project modules its function imports, so a rerun skips any stage whose key already has an entry. An
+entry holds the stage's return value and every artifact it saved::
+
+    <ARTIFACT_CACHE_DIR>/<key>/result.joblib
+    <ARTIFACT_CACHE_DIR>/<key>/fits.joblib      models the stage put in a FitStore, if one was given
+    <ARTIFACT_CACHE_DIR>/<key>/meta.json
+    <ARTIFACT_CACHE_DIR>/<key>/artifacts/...    files written through save_df/save_fig during the stage
+    <ARTIFACT_CACHE_DIR>/responses/<fingerprint>/responses.npy, index.npy
+
+Label stores keep only their label columns in an entry; the responses they were written with are
+stored once per dataset under `responses/` and linked from every entry. The run directory
+(`io_utils.ARTIFACTS_DIR`) then holds links to the entries' files and one label store merged from
+every stage that saved labels. Every entry and shared dataset lists the run directories and entries
+that link into it in `refs.json`, and eviction keeps it while any of them still exists, so old run
+directories never hold dangling links.
+"""
+import ast
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+import joblib
+import numpy as np
+import pandas as pd
+from setup.config import ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_MAX_GB, USE_ARTIFACT_CACHE
+from setup.responses import ResponseMatrix
+from . import io_utils
+from .label_store import LABEL_STORE_DIR, merge_store
+from .writer import WRITER
+
+PROJECT_ROOT: Path = Path(__file__).resolve().parent.parent
+SHARED_RESPONSES_DIR: str = "responses"
+REFS_FILE: str = "refs.json"
+
+def _module_path(name: str, root: Path = PROJECT_ROOT) -> Path | None:
+    """Returns the source file of a project module, or `None` for modules outside the project."""
+    path = root.joinpath(*name.split("."))
+    if path.with_suffix(".py").is_file():
+        return path.with_suffix(".py")
+    if (path / "__init__.py").is_file():
+        return path / "__init__.py"
+    return None
+
+def _project_imports(name: str, path: Path, root: Path = PROJECT_ROOT) -> set[str]:
+    """Returns the project modules and packages one source file imports, with relative imports resolved."""
+    package = name.split(".") if path.name == "__init__.py" else name.split(".")[:-1]
+    imported = set()
+    for node in ast.walk(ast.parse(path.read_bytes())):
+        if isinstance(node, ast.Import):
+            candidates = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            base = ".".join(package[:len(package) - node.level + 1]) if node.level else ""
+            module = ".".join(part for part in (base, node.module) if part)
+            # `from . import io_utils` imports a module, `from .store import FIT_STORE` a name
+            candidates = [module] + [f"{module}.{alias.name}" for alias in node.names]
+        else:
+            continue
+        for candidate in candidates:
+            parts = candidate.split(".")
+            # importing a submodule runs every enclosing package's __init__ too
+            imported.update(".".join(parts[:i]) for i in range(1, len(parts) + 1)
+                            if _module_path(".".join(parts[:i]), root) is not None)
+    return imported
+
+def code_version(module: str | None = None, root: Path = PROJECT_ROOT) -> str:
+    """
+    Returns a SHA-256 digest of the source code a stage depends on.
+
+    For a project `module`, that is its file and every project module it imports, directly or not,
+    so editing unrelated code, such as plotting for a linkage stage, keeps the stage's entries valid.
+    For `None` or a module outside the project, such as a run script's `__main__`, every Python file
+    of the project counts.
+    """
+    if module is None or _module_path(module, root) is None:
+        paths = [path for path in root.rglob("*.py")
+                 if path.parent.name != "__pycache__" and not path.name.startswith(".")]
+    else:
+        seen, pending = set(), [module]
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            pending.extend(_project_imports(name, _module_path(name, root), root) - seen)
+        paths = [_module_path(name, root) for name in seen]
+
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(str(path.relative_to(root)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+def _update_digest(digest: Any, obj: Any) -> None:
+    """Feeds one stage input into a digest by content rather than by identity."""
+    if isinstance(obj, ResponseMatrix):
+        digest.update(b"ResponseMatrix" + obj.fingerprint().encode())
+    elif isinstance(obj, np.ndarray):
+        array = np.ascontiguousarray(obj)
+        digest.update(f"ndarray{array.dtype.str}{array.shape}".encode())
+        digest.update(memoryview(array).cast("B"))
+    elif isinstance(obj, (pd.DataFrame, pd.Series)):
+        digest.update(f"pandas{list(getattr(obj, 'columns', [obj.name]))}".encode())
+        digest.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, Path):
+        # files are identified by name, size and modification time rather than by reading them
+        stat = obj.stat()
+        digest.update(f"Path{obj.resolve()}{stat.st_size}{stat.st_mtime_ns}".encode())
+    elif isinstance(obj, (list, tuple)):
+        digest.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            _update_digest(digest, item)
+    elif isinstance(obj, dict):
+        digest.update(f"dict{len(obj)}".encode())
+        for name in sorted(obj, key=repr):
+            _update_digest(digest, name)
+            _update_digest(digest, obj[name])
+    else:
+        digest.update(f"{type(obj).__name__}{obj!r}".encode())
+
+class ArtifactCache:
+    """
+    Stage results and artifacts stored by content key, with least-recently-used eviction.
+
+    Parameters
+    ----------
+        root : Path
+            The cache directory, shared by every run. Default is `ARTIFACT_CACHE_DIR`.
+        max_gb : float
+            The size cap in GiB, counting entries and shared responses. After each stage the least
+            recently used ones are deleted until the cache fits, never touching those used by this
+            process or linked from a run directory or entry that still exists. Delete old run
+            directories to release what they link to. Default is `ARTIFACT_CACHE_MAX_GB`.
+        enabled : bool
+            Set to `False` to run every stage directly into the run directory. Default is `USE_ARTIFACT_CACHE`.
+
+    Usage
+    -----
+    >>> results, summary = CACHE.run("fit", label_and_score, X, save=True, fits=FIT_STORE)
+    """
+    def __init__(self, root: Path = ARTIFACT_CACHE_DIR,
+                 max_gb: float = ARTIFACT_CACHE_MAX_GB,
+                 enabled: bool = USE_ARTIFACT_CACHE) -> None:
+        self.root = Path(root)
+        self.max_bytes = int(max_gb * 2**30)
+        self.enabled = enabled
+        self._code_versions: dict[str, str] = {}
+        self._used: set[str] = set()
+        self._lock = threading.Lock()
+
+    def key(self, stage: str, fn: Callable[..., Any], inputs: Any, params: dict[str, Any]) -> str:
+        """Returns the content key of a stage from its name, function, inputs, parameters and the code it depends on."""
+        if fn.__module__ not in self._code_versions:
+            self._code_versions[fn.__module__] = code_version(fn.__module__)
+        digest = hashlib.sha256(f"{stage}|{fn.__module__}.{fn.__qualname__}|{self._code_versions[fn.__module__]}".encode())
+        _update_digest(digest, inputs)
+        _update_digest(digest, params)
+        return digest.hexdigest()
+
+    def run(self, stage: str, fn: Callable[..., Any], *args: Any,
+            inputs: Any = None, params: dict[str, Any] | None = None, fits: Any = None, **kwargs: Any) -> Any:
+        """
+        Returns `fn(*args, **kwargs)` from the cache, computing and storing it on a miss.
+
+        On a miss the stage runs with its thread's artifacts redirected into a staging directory, so
+        everything it saves becomes part of the entry. Either way the entry's artifacts are then linked
+        into the run directory and its label columns merged into the run's label store.
+
+        Parameters
+        ----------
+            stage : str
+                The stage name, such as `"fit"` or `"linkage"`.
+            fn : Callable[..., Any]
+                The stage function. Its return value must be picklable.
+            args : Any
+                The positional arguments of `fn`.
+            inputs : Any
+                What the key hashes as the stage inputs. Default is `None`, which uses `args`.
+            params : dict[str, Any] | None
+                What the key hashes as the stage parameters. Default is `None`, which uses `kwargs`.
+            fits : FitStore | None
+                The store the stage puts its fitted models in. What it puts is cached with the entry
+                and restored on a hit, so later stages find the models without refitting. Default is `None`.
+            kwargs : Any
+                The keyword arguments of `fn`.
+
+        Returns
+        -------
+            Any
+                The stage result.
+        """
+        if not self.enabled:
+            return fn(*args, **kwargs)
+
+        key = self.key(stage, fn, args if inputs is None else inputs, kwargs if params is None else params)
+        entry = self.root / key
+        if (entry / "result.joblib").exists():
+            result = joblib.load(entry / "result.joblib")
+            if fits is not None and (entry / "fits.joblib").exists():
+                fits.restore(joblib.load(entry / "fits.joblib"))
+        else:
+            result = self._compute(entry, stage, fn, args, kwargs, fits)
+
+        run_dir = io_utils.artifacts_dir()
+        self._link(entry / "artifacts", run_dir)
+        with self._lock:
+            # stages may run on several scheduler threads; eviction must see every key in use
+            self._used.add(key)
+            os.utime(entry / "meta.json")
+            self._add_ref(entry, run_dir)
+            labels_dir = entry / "artifacts" / LABEL_STORE_DIR
+            if (labels_dir / "manifest.json").exists():
+                merge_store(labels_dir, run_dir / LABEL_STORE_DIR)
+                shared = self._shared_dir(labels_dir)
+                self._used.add(str(shared.relative_to(self.root)))
+                os.utime(shared / "meta.json")
+                self._add_ref(shared, run_dir)
+            self.evict()
+        return result
+
+    def _compute(self, entry: Path, stage: str, fn: Callable[..., Any], args: tuple, kwargs: dict, fits: Any) -> Any:
+        staging = entry.with_name(f".{entry.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        (staging / "artifacts").mkdir(parents=True)
+
+        try:
+            with WRITER.collect() as writes, \
+                    (fits.record() if fits is not None else contextlib.nullcontext({})) as recorded, \
+                    io_utils.redirect_artifacts(staging / "artifacts"):
+                started = time.perf_counter()
+                result = fn(*args, **kwargs)
+            # this stage's background writes must land before the entry is published; other stages'
+            # writes are theirs to wait for
+            WRITER.wait(writes)
+            elapsed = time.perf_counter() - started
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        if (staging / "artifacts" / LABEL_STORE_DIR / "manifest.json").exists():
+            self._share_responses(staging / "artifacts" / LABEL_STORE_DIR, entry)
+        joblib.dump(result, staging / "result.joblib")
+        if fits is not None:
+            joblib.dump(recorded, staging / "fits.joblib")
+        (staging / "meta.json").write_text(json.dumps(dict(stage=stage, fn=f"{fn.__module__}.{fn.__qualname__}",
+                                                           seconds=elapsed, created=time.time()), indent=2))
+        try:
+            os.replace(staging, entry)
+        except OSError:
+            # another run published the same key first; its entry is equivalent
+            shutil.rmtree(staging, ignore_errors=True)
+        return result
+
+    def _shared_dir(self, labels_dir: Path) -> Path:
+        """Returns where the responses of a label store's dataset are shared."""
+        fingerprint = json.loads((labels_dir / "manifest.json").read_text())["fingerprint"]
+        return self.root / SHARED_RESPONSES_DIR / fingerprint
+
+    def _share_responses(self, labels_dir: Path, entry: Path) -> None:
+        """Replaces the responses of a staged label store with links to the one shared copy of that dataset."""
+        shared = self._shared_dir(labels_dir)
+        names = ("responses.npy", "index.npy")
+        with self._lock:
+            if not shared.exists():
+                tmp = shared.with_name(f".{shared.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+                tmp.mkdir(parents=True)
+                for name in names:
+                    os.replace(labels_dir / name, tmp / name)
+                (tmp / "meta.json").write_text(json.dumps(dict(stage="responses", created=time.time()), indent=2))
+                try:
+                    os.replace(tmp, shared)
+                except OSError:
+                    # another run shared the same data first
+                    shutil.rmtree(tmp, ignore_errors=True)
+            self._used.add(str(shared.relative_to(self.root)))
+            # the entry is published under its final name, which is what must keep the data alive
+            self._add_ref(shared, entry)
+        for name in names:
+            (labels_dir / name).unlink(missing_ok=True)
+            try:
+                (labels_dir / name).symlink_to((shared / name).resolve())
+            except OSError:
+                shutil.copy2(shared / name, labels_dir / name)
+
+    @staticmethod
+    def _add_ref(item: Path, holder: Path) -> None:
+        """Records in an entry or shared dataset that `holder`, a run directory or entry, links into it."""
+        refs_path = item / REFS_FILE
+        refs = json.loads(refs_path.read_text()) if refs_path.exists() else []
+        holder = str(holder.resolve())
+        if holder not in refs:
+            tmp_path = refs_path.with_name(f".{REFS_FILE}.tmp-{os.getpid()}-{threading.get_ident()}")
+            tmp_path.write_text(json.dumps(refs + [holder], indent=2))
+            os.replace(tmp_path, refs_path)
+
+    @staticmethod
+    def _referenced(item: Path) -> bool:
+        """Returns whether any run directory or entry that linked into an item still exists."""
+        refs_path = item / REFS_FILE
+        return refs_path.exists() and any(Path(ref).exists() for ref in json.loads(refs_path.read_text()))
+
+    @staticmethod
+    def _link(src_dir: Path, run_dir: Path) -> None:
+        """
+        Mirrors the files of an entry into the run directory as symbolic links, copying where links are
+        unsupported. Label stores are skipped; `run` merges them column by column instead.
+        """
+        for src in src_dir.rglob("*"):
+            if src.is_dir() or src.relative_to(src_dir).parts[0] == LABEL_STORE_DIR:
+                continue
+            dst = run_dir / src.relative_to(src_dir)
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if dst.is_symlink() or dst.exists():
+                dst.unlink()
+            try:
+                dst.symlink_to(src.resolve())
+            except OSError:
+                shutil.copy2(src, dst)
+
+    def entries(self) -> pd.DataFrame:
+        """
+        Returns one row per cache entry and shared dataset with its key, which is its path under the
+        cache root, stage, size in bytes and last use time.
+        """
+        rows, items = [], []
+        for parent in (self.root, self.root / SHARED_RESPONSES_DIR):
+            if parent.exists():
+                items.extend(parent.iterdir())
+        for item in items:
+            meta_path = item / "meta.json"
+            if item.name.startswith(".") or not meta_path.exists():
+                continue
+            # linked shared responses are counted once, as their own item
+            size = sum(f.stat().st_size for f in item.rglob("*") if f.is_file() and not f.is_symlink())
+            rows.append(dict(key=str(item.relative_to(self.root)), stage=json.loads(meta_path.read_text())["stage"],
+                             bytes=size, last_used=meta_path.stat().st_mtime))
+        return pd.DataFrame(rows, columns=["key", "stage", "bytes", "last_used"])
+
+    def evict(self) -> list[str]:
+        """
+        Deletes least recently used entries and shared datasets until the cache fits, returning their keys.
+
+        Items used by this process or still linked from an existing run directory or entry are kept.
+        Shared datasets are usually used last, so the entries linking to them are considered first.
+        """
+        entries = self.entries().sort_values("last_used")
+        total = int(entries["bytes"].sum())
+        evicted = []
+        for row in entries.itertuples():
+            if total <= self.max_bytes:
+                break
+            if row.key in self._used or self._referenced(self.root / row.key):
+                continue
+            shutil.rmtree(self.root / row.key, ignore_errors=True)
+            total -= row.bytes
+            evicted.append(row.key)
+        return evicted
+
+CACHE = ArtifactCache()
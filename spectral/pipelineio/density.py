@@ -0,0 +1,112 @@
+"""density.py
+
+Draws large labeled point clouds as per-cluster density images instead of one marker per point.
+"""
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.colors import Normalize
+from setup.config import DENSITY_BINS, DENSITY_MIN_POINTS, RANDOM_STATE
+from typing import Any, Literal
+
+def density_image(points: np.ndarray,
+                  labels: np.ndarray,
+                  bins: int = DENSITY_BINS,
+                  cmap: str = "tab10") -> tuple[np.ndarray, tuple[float, float, float, float]]:
+    """
+    Bins labeled 2D points per cluster into a `bins` x `bins` grid and composites the cluster colors.
+
+    One `bincount` over the flattened (cluster, row, column) cell index counts every cluster at once.
+    Each pixel takes the count-weighted mean color of the clusters that fall in it, the same colors
+    `scatter(c=labels, cmap=cmap)` would give them, and an opacity that grows with the log of its total
+    count, so the cost and the image size depend on the grid, not on the number of points.
+
+    Parameters
+    ----------
+        points : NDArray
+            The (n_samples, 2) coordinates.
+        labels : NDArray
+            The cluster label of each point.
+        bins : int
+            The number of grid cells along each axis. Default is `DENSITY_BINS`.
+        cmap : str
+            The colormap the labels are mapped through. Default is `"tab10"`.
+
+    Returns
+    -------
+        image : NDArray
+            The (bins, bins, 4) RGBA image, row 0 at the bottom.
+        extent : tuple[float, float, float, float]
+            The (left, right, bottom, top) data limits of the image for `imshow`.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    codes, inverse = np.unique(np.asarray(labels), return_inverse=True)
+
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    span = np.where(hi > lo, hi - lo, 1.0)
+    cells = np.clip(((points - lo) / span * bins).astype(np.int64), 0, bins - 1)
+    flat = (inverse * bins + cells[:, 1]) * bins + cells[:, 0]
+    counts = np.bincount(flat, minlength=len(codes) * bins * bins).reshape(len(codes), bins, bins)
+
+    colors = plt.get_cmap(cmap)(Normalize(codes.min(), codes.max())(codes))[:, :3]
+    total = counts.sum(axis=0)
+    rgb = np.einsum("cyx,cd->yxd", counts, colors) / np.maximum(total, 1)[..., None]
+    alpha = np.zeros(total.shape)
+    if total.max() > 0:
+        alpha = np.where(total > 0, 0.25 + 0.75 * np.log1p(total) / np.log1p(total.max()), 0.0)
+
+    extent = (float(lo[0]), float(lo[0] + span[0]), float(lo[1]), float(lo[1] + span[1]))
+    return np.dstack([rgb, alpha]), extent
+
+def draw_clusters(ax: Axes,
+                  points: np.ndarray,
+                  labels: np.ndarray,
+                  cmap: str = "tab10",
+                  render: Literal["auto", "scatter", "density"] = "auto",
+                  bins: int = DENSITY_BINS,
+                  overlay: int = 0,
+                  **scatter_kwargs: Any) -> None:
+    """
+    Draws labeled 2D points on `ax` as a scatter plot or as an aggregated density image.
+
+    Parameters
+    ----------
+        ax : Axes
+            The axes to draw on.
+        points : NDArray
+            The (n_samples, 2) coordinates.
+        labels : NDArray
+            The cluster label of each point.
+        cmap : str
+            The colormap the labels are mapped through. Default is `"tab10"`.
+        render : Literal["auto", "scatter", "density"]
+            `"scatter"` draws every point, `"density"` draws the binned image from `density_image` and
+            `"auto"` picks density above `DENSITY_MIN_POINTS` points. Default is `"auto"`.
+        bins : int
+            The density grid resolution along each axis. Default is `DENSITY_BINS`.
+        overlay : int
+            The number of randomly sampled points scattered over the density image. Default is `0`.
+        scatter_kwargs : Any
+            Extra arguments to `Axes.scatter`, such as `s` or `alpha`.
+
+    Usage
+    -----
+    >>> draw_clusters(ax, X_pca, labels, render="density", overlay=2000, s=15)
+    """
+    points = np.asarray(points)
+    labels = np.asarray(labels)
+    if render == "auto":
+        render = "density" if len(points) > DENSITY_MIN_POINTS else "scatter"
+    if render == "scatter":
+        ax.scatter(points[:, 0], points[:, 1], c=labels, cmap=cmap, **scatter_kwargs)
+        return
+
+    image, extent = density_image(points, labels, bins=bins, cmap=cmap)
+    ax.imshow(image, extent=extent, origin="lower", aspect="auto", interpolation="nearest")
+    if overlay:
+        rng = np.random.default_rng(RANDOM_STATE)
+        idx = rng.choice(len(points), size=min(overlay, len(points)), replace=False)
+        # keep the full label range so the sampled colors match the image
+        scatter_kwargs["s"] = max(scatter_kwargs.get("s", 15) / 5, 1)
+        ax.scatter(points[idx, 0], points[idx, 1], c=labels[idx], cmap=cmap,
+                   norm=Normalize(labels.min(), labels.max()), edgecolors="none", **scatter_kwargs)
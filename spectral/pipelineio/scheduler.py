@@ -0,0 +1,184 @@
+"""scheduler.py
+
+Runs pipeline stages as a dependency graph on a worker pool under a global core and memory budget.
+"""
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any
+import pandas as pd
+from threadpoolctl import threadpool_limits
+from setup.config import SCHEDULER_CORES, SCHEDULER_MEMORY_GB
+
+def total_memory_gb() -> float:
+    """Returns the physical memory of the machine in GiB, or infinity where it cannot be read."""
+    try:
+        import psutil
+        return psutil.virtual_memory().total / 2**30
+    except ImportError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**30
+    except (AttributeError, ValueError, OSError):
+        return float("inf")
+
+class Stage:
+    """
+    One node of a pipeline graph.
+
+    Attributes
+    ----------
+        name : str
+            The unique stage name.
+        fn : Callable[..., Any]
+            Called with the results of `deps`, in order; its return value is the stage result.
+        deps : tuple[str, ...]
+            The names of the stages that must finish first.
+        cores : int
+            The estimated number of cores the stage keeps busy, also its BLAS/OpenMP thread share.
+        mem_gb : float
+            The estimated peak memory of the stage in GiB.
+        main_thread : bool
+            Whether the stage runs on the thread that called `StageScheduler.run`, e.g. because it
+            draws with pyplot, which is not thread-safe.
+    """
+
+    def __init__(self, name: str, fn: Callable[..., Any], deps: tuple[str, ...] = (),
+                 cores: int = 1, mem_gb: float = 0.5, main_thread: bool = False) -> None:
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.cores = cores
+        self.mem_gb = mem_gb
+        self.main_thread = main_thread
+
+class StageScheduler:
+    """
+    Runs a graph of `Stage`s as soon as their dependencies finish and the budget has room for them.
+
+    Ready stages start in declaration order while the cores and memory of the running stages stay
+    within the budget; a stage larger than the whole budget runs alone. Each stage runs on a worker
+    thread inside `threadpool_limits(cores)`, so the numerical libraries it calls use its share of
+    threads. BLAS pools are process-wide, so stages running together share the most recent BLAS limit,
+    while OpenMP limits apply per thread; worker processes a stage starts must be limited by the stage
+    itself. Stages declared with `main_thread=True` run on the calling thread instead, while the
+    worker stages already started keep running. Every stage's start and end are recorded for `timeline`.
+
+    Parameters
+    ----------
+        cores : int | None
+            The core budget. Default is `SCHEDULER_CORES`, where `None` means every CPU.
+        mem_gb : float | None
+            The memory budget in GiB. Default is `SCHEDULER_MEMORY_GB`, where `None` means physical memory.
+
+    Usage
+    -----
+    >>> scheduler = StageScheduler()
+    >>> scheduler.add("embedding", lambda: label_and_score(X), cores=scheduler.cores, mem_gb=1)
+    >>> scheduler.add("profiles", lambda fit: save_profiles(X, fit[0]), deps=("embedding",))
+    >>> results, summary = scheduler.run()["embedding"]
+    """
+    def __init__(self, cores: int | None = SCHEDULER_CORES, mem_gb: float | None = SCHEDULER_MEMORY_GB) -> None:
+        self.cores = cores or os.cpu_count() or 1
+        self.mem_gb = mem_gb or total_memory_gb()
+        self.stages: dict[str, Stage] = {}
+        self.records: list[dict[str, Any]] = []
+
+    def add(self, name: str, fn: Callable[..., Any], deps: tuple[str, ...] = (),
+            cores: int = 1, mem_gb: float = 0.5, main_thread: bool = False) -> Stage:
+        """Declares a stage; its dependencies must already be declared, which keeps the graph acyclic."""
+        if name in self.stages:
+            raise ValueError(f"Stage {name!r} is already declared.")
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {name!r} depends on undeclared stages {missing}.")
+        stage = Stage(name, fn, tuple(deps), max(1, min(cores, self.cores)), mem_gb, main_thread)
+        self.stages[name] = stage
+        return stage
+
+    def _run_stage(self, stage: Stage, args: list[Any], origin: float) -> Any:
+        started = time.perf_counter()
+        try:
+            with threadpool_limits(limits=stage.cores):
+                return stage.fn(*args)
+        finally:
+            self.records.append(dict(stage=stage.name, deps=",".join(stage.deps), cores=stage.cores,
+                                     mem_gb=stage.mem_gb, start_s=started - origin,
+                                     end_s=time.perf_counter() - origin))
+
+    def run(self) -> dict[str, Any]:
+        """
+        Runs every declared stage and returns their results by name.
+
+        When a stage fails no further stages start; the running ones finish and the first error is raised.
+
+        Returns
+        -------
+            dict[str, Any]
+                The result of each stage.
+        """
+        results: dict[str, Any] = {}
+        pending = list(self.stages.values())
+        running: dict[Future, Stage] = {}
+        used_cores, used_mem = 0, 0.0
+        error: BaseException | None = None
+        origin = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.cores, thread_name_prefix="stage") as pool:
+            while pending or running:
+                if error is None:
+                    for stage in list(pending):
+                        if not all(dep in results for dep in stage.deps):
+                            continue
+                        fits = used_cores + stage.cores <= self.cores and used_mem + stage.mem_gb <= self.mem_gb
+                        if fits or not running:
+                            args = [results[dep] for dep in stage.deps]
+                            pending.remove(stage)
+                            if stage.main_thread:
+                                # no further stages start until it returns; its dependents follow it
+                                # in declaration order, so this pass still reaches them
+                                try:
+                                    results[stage.name] = self._run_stage(stage, args, origin)
+                                except BaseException as exc:
+                                    error = error or exc
+                                    break
+                                continue
+                            running[pool.submit(self._run_stage, stage, args, origin)] = stage
+                            used_cores += stage.cores
+                            used_mem += stage.mem_gb
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    used_cores -= stage.cores
+                    used_mem -= stage.mem_gb
+                    try:
+                        results[stage.name] = future.result()
+                    except BaseException as exc:
+                        error = error or exc
+
+        if error is not None:
+            raise error
+        return results
+
+    def critical_path(self) -> list[str]:
+        """Returns the chain of dependent stages with the longest total measured duration."""
+        records = {r["stage"]: r for r in self.records}
+        longest: dict[str, tuple[float, list[str]]] = {}
+        # stages are declared after their dependencies, so one pass in declaration order suffices
+        for name, stage in self.stages.items():
+            if name not in records:
+                continue
+            duration = records[name]["end_s"] - records[name]["start_s"]
+            best = max((longest[dep] for dep in stage.deps if dep in longest), default=(0.0, []), key=lambda t: t[0])
+            longest[name] = (best[0] + duration, best[1] + [name])
+        return max(longest.values(), default=(0.0, []), key=lambda t: t[0])[1]
+
+    def timeline(self) -> pd.DataFrame:
+        """Returns one row per finished stage with its resources, start, end and whether it is on the critical path."""
+        timeline = pd.DataFrame(self.records, columns=["stage", "deps", "cores", "mem_gb", "start_s", "end_s"])
+        timeline["duration_s"] = timeline["end_s"] - timeline["start_s"]
+        timeline["critical"] = timeline["stage"].isin(self.critical_path())
+        return timeline.sort_values("start_s", ignore_index=True)
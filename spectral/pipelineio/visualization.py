@@ -2,11 +2,14 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 import numpy as np
+from typing import Literal
 from sklearn.decomposition import PCA
 from scipy.cluster.hierarchy import dendrogram, fcluster
 from .io_utils import save_fig
+from .density import draw_clusters
 from setup.config import QUESTION_COLS
-from pipelineio.io_utils import ensure_dir_exists
+from setup.responses import ResponseMatrix
+from setup.profiles import ResponseDistribution
 
 def plot_dendrograms(Z_single: np.ndarray, 
                      Z_complete: np.ndarray, 
@@ -68,18 +71,19 @@ def plot_dendrograms(Z_single: np.ndarray,
     plt.tight_layout()
     save_fig(fig, "plots", "dendrograms", f"{filename}.png")
 
-def plot_pca_clusters(X: pd.DataFrame, 
+def plot_pca_clusters(X: ResponseMatrix, 
                       Z: np.ndarray, 
                       filename: str, 
                       ks: tuple[int, ...] = (2, 3, 4)) -> None:
     """Creates a plot of the principal component analysis using provided cluster sizes."""
+    X_fit = X.to_float()
     pca = PCA(n_components=2)
-    X_pca = pca.fit_transform(X)
+    X_pca = pca.fit_transform(X_fit)
 
     fig, ax = plt.subplots(1, len(ks), figsize=(5 * len(ks), 5))
     for i, k in enumerate(ks):
         labels = fcluster(Z, k, criterion="maxclust")
-        ax[i].scatter(X_pca[:, 0], X_pca[:, 1], c=labels, cmap="tab10", s=15)
+        draw_clusters(ax[i], X_pca, labels, "tab10", s=15)
         ax[i].set_title(f"PCA, k={k}")
         ax[i].set_xlabel("PC1")
         ax[i].set_ylabel("PC2")
@@ -87,11 +91,10 @@ def plot_pca_clusters(X: pd.DataFrame,
     plt.tight_layout()
     save_fig(fig, "plots", "pca", f"{filename}.png")
 
-def plot_mode_cluster_heatmaps(df_labeled: pd.DataFrame, filename: str) -> pd.DataFrame:
-    """Creates a heatmap of the modes by cluster per question response and returns a DataFrame of the modes."""
-    modes = df_labeled.groupby("Cluster")[QUESTION_COLS].agg(
-        lambda x: x.mode().iloc[0]
-    )
+def plot_mode_cluster_heatmaps(df_labeled: pd.DataFrame | ResponseDistribution, filename: str) -> pd.DataFrame:
+    """Creates a heatmap of the modes by cluster per question response and returns a DataFrame of the modes, read from a `ResponseDistribution`."""
+    dist = df_labeled if isinstance(df_labeled, ResponseDistribution) else ResponseDistribution.from_frame(df_labeled, QUESTION_COLS)
+    modes = dist.modes()
 
     fig, ax = plt.subplots(figsize=(10, 6))
     sns.heatmap(modes, annot=True, cmap="coolwarm", ax=ax)
@@ -102,27 +105,21 @@ def plot_mode_cluster_heatmaps(df_labeled: pd.DataFrame, filename: str) -> pd.Da
     save_fig(fig, "plots", "heatmaps", f"{filename}.png")
     return modes
 
-def plot_spectral_embedding(embedding: np.ndarray, labels: np.ndarray, name: str = "spectral_embedding"):
+def plot_spectral_embedding(embedding: np.ndarray,
+                            labels: np.ndarray,
+                            name: str = "spectral_embedding",
+                            render: Literal["auto", "scatter", "density"] = "auto",
+                            overlay: int = 0):
     """
     Plot 2D spectral embedding colored by cluster labels.
+    Large embeddings are drawn as per-cluster density images, see `draw_clusters`.
     Saves to artifacts/.../plots/spectral_embedding/.
     """
-    plot_dir = ensure_dir_exists("spectral_embedding")
+    fig, ax = plt.subplots(figsize=(8, 6))
+    draw_clusters(ax, embedding[:, :2], labels, "Set1", render=render, overlay=overlay, s=10, alpha=0.9)
+    ax.set_title("Spectral Embedding (clusters)")
+    ax.set_xlabel("Eigenvector 2")
+    ax.set_ylabel("Eigenvector 3")
 
-    plt.figure(figsize=(8, 6))
-    plt.scatter(
-        embedding[:, 0],
-        embedding[:, 1],
-        c=labels,
-        cmap="Set1",
-        s=10,
-        alpha=0.9
-    )
-    plt.title("Spectral Embedding (clusters)")
-    plt.xlabel("Eigenvector 2")
-    plt.ylabel("Eigenvector 3")
-
-    outpath = plot_dir / f"{name}.png"
-    plt.savefig(outpath, dpi=300, bbox_inches="tight")
-    plt.close()
+    outpath = save_fig(fig, "spectral_embedding", f"{name}.png")
     print(f"Saved spectral embedding plot → {outpath}")
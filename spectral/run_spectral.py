@@ -1,36 +1,76 @@
 from setup.preprocess import prep_sample
 from clustering.cluster import label_and_score
 from pipelineio.visualization import plot_mode_cluster_heatmaps, plot_spectral_embedding
+from pipelineio.render import RENDERER
+from pipelineio.writer import WRITER
+from pipelineio.io_utils import save_df
+from pipelineio.artifact_cache import CACHE
+from pipelineio.scheduler import StageScheduler
+from setup.config import DATA_PATH
+from setup.profiles import ResponseDistribution
+from setup.responses import ResponseMatrix
+from typing import Literal
+import numpy as np
+import pandas as pd
 
 
-def main() -> None:
+def _profile_clusters(X: ResponseMatrix, results: dict, ks: tuple[int, ...], prefix: str) -> None:
+    """Saves the response distribution of each k and queues its heatmap."""
+    for k in ks:
+        labels_best = results[k]["labels"]
+        embedding = results["embedding"]
+
+        RENDERER.submit(plot_spectral_embedding, embedding[:, :2], labels_best, f"spectral_embedding_k_{k}")
+
+        # one count tensor feeds the heatmap and the saved per-cluster response distributions
+        dist = ResponseDistribution.from_labels(X.values, labels_best, X.columns)
+        save_df(dist.to_frame(), f"{k}_response_distribution.csv")
+
+        RENDERER.submit(plot_mode_cluster_heatmaps, dist, f"{prefix}_response_heatmap_k_{k}")
+
+def run(X: ResponseMatrix, X_pca: np.ndarray | None = None,
+        sil_mode: Literal["exact", "sampled"] | None = "exact") -> tuple[dict, pd.DataFrame]:
     """
-    Main script to run the spectral clustering pipeline.
-    Uses k-NN + RBF spectral embedding and KMeans in embedding space.
+    Runs the spectral pipeline on loaded responses and returns the results and score summary.
+    `X_pca` is accepted for a uniform interface; the embedding is plotted instead of PCA.
+    `sil_mode=None` leaves the scores to the caller, see `label_and_score`.
     """
-    # Load (and optionally sample) the data
-    X = prep_sample(save=True, use_all=True)
-
-    results, summary = label_and_score(
+    float_gb = X.values.size * 8 / 2**30
+    scheduler = StageScheduler()
+    # each stage is skipped when its inputs, parameters and code match a cached run
+    scheduler.add("embedding", lambda: CACHE.run(
+        "embedding",
+        label_and_score,
         X,
         ks=(2, 3, 4),
         save=True,
         prefix="spectral",
         n_neighbors=15,
-    )
-    print(summary)
+        sil_mode=sil_mode,
+    ), cores=scheduler.cores, mem_gb=4 * float_gb)
+    scheduler.add("profiles", lambda fit: _profile_clusters(X, fit[0], (2, 3, 4), "spectral"), deps=("embedding",))
+    stage_results = scheduler.run()
+    results, summary = stage_results["embedding"]
+    if sil_mode is not None:
+        print(summary)
+    print("Critical path:", " -> ".join(scheduler.critical_path()))
 
-    for k in (2, 3, 4):
-        k_best = k
-        labels_best = results[k_best]["labels"]
-        embedding = results["embedding"]
+    RENDERER.close()
+    # surface failed writes here rather than at exit, then keep the per-artifact write times
+    WRITER.flush()
+    save_df(scheduler.timeline(), "stage_timeline.csv")
+    save_df(WRITER.timing_frame(), "artifact_timings.csv")
+    return results, summary
 
-        plot_spectral_embedding(embedding[:, :2], labels_best, f"spectral_embedding_k_{k}")
-        
-        df_labeled = X.copy()
-        df_labeled["Cluster"] = labels_best
 
-        plot_mode_cluster_heatmaps(df_labeled, f"spectral_response_heatmap_k_{k}")
+def main() -> None:
+    """
+    Main script to run the spectral clustering pipeline.
+    Uses k-NN + RBF spectral embedding and KMeans in embedding space.
+    """
+    # Load (and optionally sample) the data
+    X = CACHE.run("preprocess", prep_sample, inputs=DATA_PATH, save=True, use_all=True)
+    run(X)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,26 @@
 import pandas as pd
-from .config import DATA_PATH, QUESTION_COLS, RANDOM_STATE, SAMPLE_N
-from pipelineio.io_utils import save_df
+from .config import DATA_PATH, QUESTION_COLS, RANDOM_STATE, SAMPLE_N, USE_DATA_CACHE
+from .cache import MISSING, open_cache
+from .responses import ResponseMatrix
+from pipelineio.label_store import save_responses
 
-def load_raw() -> pd.DataFrame:
-    return pd.read_csv(DATA_PATH)
+def load_raw(columns: list[str] | None = None) -> pd.DataFrame:
+    if USE_DATA_CACHE:
+        return open_cache(DATA_PATH).to_frame(columns)
+    return pd.read_csv(DATA_PATH, usecols=columns)
 
-def prep_sample(save: bool = False, use_all: bool = False) -> pd.DataFrame:
-    df = load_raw()
-    X = df[QUESTION_COLS].copy()
-    X_clean = X.dropna().astype(int)
+def load_responses() -> ResponseMatrix:
+    if not USE_DATA_CACHE:
+        return ResponseMatrix.from_frame(load_raw(QUESTION_COLS).dropna())
+
+    cache = open_cache(DATA_PATH)
+    complete = (cache.responses != MISSING).all(axis=1)
+    return ResponseMatrix(cache.responses[complete], index=cache.index[complete], columns=QUESTION_COLS)
+
+def prep_sample(save: bool = False, use_all: bool = False) -> ResponseMatrix:
+    X_clean = load_responses()
     X_sample = X_clean.sample(n=SAMPLE_N, random_state=RANDOM_STATE) if not use_all else X_clean
-    if save and not use_all:
-        save_df(X_sample, f"Xs_{SAMPLE_N}.csv")
-    elif save and use_all:
-        save_df(X_sample, "Xs_all.csv")
-    return X_sample
\ No newline at end of file
+    if save:
+        # written once as uint8; every label column of the run is stored beside it
+        save_responses(X_sample)
+    return X_sample